@@ -25,7 +25,10 @@
 import logging
 
 from lizard_waterbalance.models import IncompleteData
+from lizard_waterbalance.models import OpenWater as DatabaseOpenWater
+from lizard_waterbalance.models import PumpLine as DatabasePumpLine
 from lizard_waterbalance.models import PumpingStation as DatabasePumpingStation
+from lizard_waterbalance.models import prefetch_fews_timeseries
 from lizard_wbcomputation.bucket_types import BucketTypes
 from timeseries.timeseriesstub import add_timeseries
 from timeseries.timeseriesstub import map_timeseries
@@ -38,28 +41,208 @@ logger = logging.getLogger(__name__)
 NEW_ATTR_NAMES = {
     "min_concentr_phosphate": "stof_lower_concentration",
     "incr_concentr_phosphate": "stof_increment",
+    "min_concentr_nitrogen": "n_lower_concentration",
+    "incr_concentr_nitrogen": "n_incremental",
+    "min_concentr_sulphate": "so4_lower_concentration",
+    "incr_concentr_sulphate": "so4_incremental",
     }
 
+# names of the Concentration attributes that a ConcentrationIndex stores
+CONCENTRATION_ATTRIBUTE_NAMES = [
+    'cl_concentration',
+    'stof_lower_concentration',
+    'stof_increment',
+    'p_lower_concentration',
+    'p_incremental',
+    'n_lower_concentration',
+    'n_incremental',
+    'so4_lower_concentration',
+    'so4_incremental',
+    ]
+
+# names of the time series of an open water that an Area retrieves
+OPEN_WATER_TIMESERIES_NAMES = [
+    'precipitation',
+    'evaporation',
+    'seepage',
+    'infiltration',
+    'sewer',
+    'minimum_level',
+    'maximum_level',
+    'waterlevel_measurement',
+    'nutricalc_min',
+    'nutricalc_incr',
+    ]
+
+
+def find_concentration(concentrations, program_name):
+    """Return the Concentration whose Label has the given program name.
+
+    If no such Concentration exists, this function returns None.
+
+    """
+    for concentr in concentrations:
+        if concentr.label.program_name == program_name:
+            return concentr
+    return None
+
+
+class ConcentrationIndex(object):
+    """Stores the attributes of the Concentration(s) of a configuration.
+
+    A ConcentrationIndex maps the pair (program name of the Label, name of
+    the attribute) to the value of that attribute of the Concentration with
+    that Label. It is built once from the list of Concentration(s) so each
+    lookup is a dictionary lookup instead of a query and a scan.
+
+    Just as find_concentration, when multiple Concentration(s) have a Label
+    with the same program name, the first one is used.
+
+    """
+    def __init__(self, concentrations):
+        self._concentrations = {}
+        self._values = {}
+        for concentr in concentrations:
+            program_name = concentr.label.program_name
+            if program_name in self._concentrations:
+                continue
+            self._concentrations[program_name] = concentr
+            for attribute in CONCENTRATION_ATTRIBUTE_NAMES:
+                self._values[(program_name, attribute)] = getattr(concentr, attribute)
+
+    def find(self, program_name):
+        """Return the Concentration whose Label has the given program name.
+
+        If no such Concentration exists, this method returns None.
+
+        """
+        return self._concentrations.get(program_name)
+
+    def get(self, program_name, attribute):
+        """Return the attribute of the Concentration with the given program name.
+
+        If no such Concentration exists, this method returns None.
+
+        """
+        key = (program_name, attribute)
+        if key in self._values:
+            return self._values[key]
+        concentr = self._concentrations.get(program_name)
+        if concentr is not None:
+            return getattr(concentr, attribute)
+        return None
+
+
+def create_concentration_index(configuration):
+    """Return the ConcentrationIndex of the given configuration.
+
+    This function retrieves the Concentration(s) and their Label(s) in a
+    single query.
+
+    """
+    concentrations = configuration.config_concentrations.all().select_related('label')
+    return ConcentrationIndex(concentrations)
+
+
+class AreaSnapshot(object):
+    """Stores the database objects of a configuration that an Area uses.
+
+    An AreaSnapshot loads the open water, its time series, buckets, pumping
+    stations, pump lines and the concentrations with their labels using a
+    fixed number of queries. It also resolves the Fews time series of all
+    these objects in a single query, see prefetch_fews_timeseries. It does
+    not reload these objects when they are modified in the database, see
+    Area.invalidate.
+
+    Instance variables:
+      *open_water*
+        OpenWater of the configuration
+      *concentrations*
+        list of the Concentration(s) of the configuration
+      *concentration_index*
+        ConcentrationIndex of these Concentration(s)
+      *buckets*
+        list of the Bucket(s) of the open water
+      *pumping_stations*
+        list of the PumpingStation(s) of the open water
+
+    """
+    def __init__(self, configuration):
+        self.concentrations = \
+            list(configuration.config_concentrations.all().select_related('label'))
+        self.concentration_index = ConcentrationIndex(self.concentrations)
+        if configuration.open_water_id is None:
+            self.open_water = None
+            self.buckets = []
+            self.pump_lines = {}
+            self.pumping_stations = []
+            return
+        self.open_water = DatabaseOpenWater.objects.select_related(
+            *['%s__fews_timeseries' % name for name in OPEN_WATER_TIMESERIES_NAMES]
+            ).get(pk=configuration.open_water_id)
+
+        database_buckets = list(self.open_water.buckets.all().select_related(
+            'seepage__fews_timeseries'))
+        self.buckets = [Bucket(configuration, b, self).copy_properties()
+                        for b in database_buckets]
+
+        database_stations = list(DatabasePumpingStation.objects.filter(
+            open_water=self.open_water).select_related('label'))
+        # we retrieve the pump lines of all pumping stations in one query
+        self.pump_lines = dict((station.pk, []) for station in database_stations)
+        pump_lines = list(DatabasePumpLine.objects.filter(
+            pumping_station__in=database_stations).select_related(
+            'timeserie__fews_timeseries'))
+        for pump_line in pump_lines:
+            self.pump_lines[pump_line.pumping_station_id].append(pump_line)
+
+        waterbalance_timeseries = \
+            [getattr(self.open_water, name) for name in OPEN_WATER_TIMESERIES_NAMES] + \
+            [bucket.seepage for bucket in database_buckets] + \
+            [pump_line.timeserie for pump_line in pump_lines]
+        prefetch_fews_timeseries(waterbalance_timeseries)
+        self.pumping_stations = [PumpingStation(configuration, s, self).copy_properties()
+                                 for s in database_stations]
+
+
 class Area(object):
+    """Provides the data of a configuration to the computational core.
+
+    An Area loads the database objects of its configuration once, when they
+    are first needed, and stores them in an AreaSnapshot. Call method
+    invalidate when these objects have been modified in the database.
 
+    """
     def __init__(self, configuration):
 
         self.configuration = configuration
+        self._snapshot = None
+
+    @property
+    def snapshot(self):
+        """Return the AreaSnapshot of the current Area."""
+        if self._snapshot is None:
+            self._snapshot = AreaSnapshot(self.configuration)
+        return self._snapshot
+
+    def invalidate(self):
+        """Discard the AreaSnapshot so the next access reloads the database objects."""
+        self._snapshot = None
 
     @property
     def surface(self):
         """Return the surface of the current Area in [m2]."""
-        return self.configuration.open_water.surface
+        return self.snapshot.open_water.surface
 
     @property
     def bottom_height(self):
         """Return the bottom height of the current Area in [mNAP]."""
-        return self.configuration.open_water.bottom_height
+        return self.snapshot.open_water.bottom_height
 
     @property
     def init_water_level(self):
         """Return the initial water level of the current Area in [mNAP]."""
-        return self.configuration.open_water.init_water_level
+        return self.snapshot.open_water.init_water_level
 
     @property
     def init_concentration(self):
@@ -108,22 +291,21 @@ class Area(object):
 
     @property
     def buckets(self):
-        """Return the Bucket(s) for the current Area."""
-        config = self.configuration
-        database_buckets = config.open_water.buckets.all()
-        new_buckets = [Bucket(config, b) for b in database_buckets]
-        return map(lambda b:b.copy_properties(), new_buckets)
+        """Return the Bucket(s) for the current Area.
+
+        Each access returns the same Bucket objects.
+
+        """
+        return list(self.snapshot.buckets)
 
     @property
     def pumping_stations(self):
-        """Return the PumpingStation(s) for the current Area."""
-        open_water = self.configuration.open_water
-        stations = []
-        for s in DatabasePumpingStation.objects.filter(open_water=open_water):
-            station = PumpingStation(self.configuration, s)
-            station.copy_properties()
-            stations.append(station)
-        return stations
+        """Return the PumpingStation(s) for the current Area.
+
+        Each access returns the same PumpingStation objects.
+
+        """
+        return list(self.snapshot.pumping_stations)
 
     def retrieve_precipitation(self, start_date, end_date):
         """Return the precipitation time series for the current Area.
@@ -132,7 +314,7 @@ class Area(object):
         IncompleteData exception.
 
         """
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.precipitation is None:
             exception_msg = "No precipitation is defined for the " \
                 "waterbalance area %s" % unicode(open_water)
@@ -150,7 +332,7 @@ class Area(object):
         IncompleteData exception.
 
         """
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.evaporation is None:
             exception_msg = "No evaporation is defined for the waterbalance " \
                 "area %s" % unicode(open_water)
@@ -168,7 +350,7 @@ class Area(object):
         IncompleteData exception.
 
         """
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.seepage is None:
             exception_msg = "No seepage is defined for the waterbalance " \
                             "area %s" %  unicode(open_water)
@@ -186,7 +368,7 @@ class Area(object):
         IncompleteData exception.
 
         """
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.infiltration is None:
             exception_msg = "No infiltration is defined for the waterbalance " \
                             "area %s" %  unicode(open_water)
@@ -199,7 +381,7 @@ class Area(object):
 
     def retrieve_minimum_level(self, start_date, end_date):
         """Return the minimum water level for the current Area."""
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.use_min_max_level_relative_to_meas:
              min_level = TimeseriesWithMemoryStub()
              min_level.add_value(start_date, open_water.min_level_relative_to_measurement)
@@ -211,7 +393,7 @@ class Area(object):
 
     def retrieve_maximum_level(self, start_date, end_date):
         """Return the maximum water level for the current Area."""
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.use_min_max_level_relative_to_meas:
              max_level = TimeseriesWithMemoryStub()
              max_level.add_value(start_date, open_water.max_level_relative_to_measurement)
@@ -228,7 +410,7 @@ class Area(object):
         If no such time series is defined, this method returns None.
 
         """
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.nutricalc_min is not None:
             timeseries = open_water.nutricalc_min.get_timeseries()
             return TimeseriesRestrictedStub(timeseries=timeseries,
@@ -243,7 +425,7 @@ class Area(object):
         If no such time series is defined, this method returns None.
 
         """
-        open_water = self.configuration.open_water
+        open_water = self.snapshot.open_water
         if open_water.nutricalc_incr is not None:
             timeseries = open_water.nutricalc_incr.get_timeseries()
             return TimeseriesRestrictedStub(timeseries=timeseries,
@@ -253,6 +435,16 @@ class Area(object):
             return None
 
 
+    def get_concentration(self, program_name, attribute):
+        """Return the value of the Concentration attribute specified.
+
+        The parameters specify the attribute of a Concentration whose Label
+        has the given program name. If no such Label exists, this method
+        returns None.
+
+        """
+        return self.snapshot.concentration_index.get(program_name, attribute)
+
     @property
     def concentr_chloride_precipitation(self):
         """Return the chloride concentration of the precipitation.
@@ -261,10 +453,7 @@ class Area(object):
         'precipitation'.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == "precipitation":
-                return concentr.cl_concentration
-        return None
+        return self.get_concentration('precipitation', 'cl_concentration')
 
     @property
     def concentr_chloride_seepage(self):
@@ -274,9 +463,7 @@ class Area(object):
         'seepage'.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == "seepage":
-                return concentr.cl_concentration
+        return self.get_concentration('seepage', 'cl_concentration')
 
     @property
     def min_concentr_phosphate_precipitation(self):
@@ -286,10 +473,7 @@ class Area(object):
         'precipitation'.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == "precipitation":
-                return concentr.stof_lower_concentration
-        return None
+        return self.get_concentration('precipitation', 'stof_lower_concentration')
 
     @property
     def incr_concentr_phosphate_precipitation(self):
@@ -299,10 +483,7 @@ class Area(object):
         'precipitation'.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == "precipitation":
-                return concentr.stof_increment
-        return None
+        return self.get_concentration('precipitation', 'stof_increment')
 
     @property
     def min_concentr_phosphate_seepage(self):
@@ -312,10 +493,7 @@ class Area(object):
         'seepage'.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == "seepage":
-                return concentr.stof_lower_concentration
-        return None
+        return self.get_concentration('seepage', 'stof_lower_concentration')
 
     @property
     def incr_concentr_phosphate_seepage(self):
@@ -325,57 +503,92 @@ class Area(object):
         'seepage'.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == "seepage":
-                return concentr.stof_increment
-        return None
+        return self.get_concentration('seepage', 'stof_increment')
 
     @property
-    def min_concentr_nitrogyn_precipitation(self):
-        """Not implemented as the Django database does not define nitrogen."""
-        pass
+    def min_concentr_nitrogen_precipitation(self):
+        """Return the minimum nitrogen concentration of the precipitation."""
+        return self.get_concentration('precipitation', 'n_lower_concentration')
 
     @property
-    def incr_concentr_nitrogyn_precipitation(self):
-        """Not implemented as the Django database does not define nitrogen."""
-        pass
+    def incr_concentr_nitrogen_precipitation(self):
+        """Return the increment nitrogen concentration of the precipitation."""
+        return self.get_concentration('precipitation', 'n_incremental')
 
     @property
-    def min_concentr_nitrogyn_seepage(self):
-        """Not implemented as the Django database does not define nitrogen."""
-        pass
+    def min_concentr_nitrogen_seepage(self):
+        """Return the minimum nitrogen concentration of the seepage."""
+        return self.get_concentration('seepage', 'n_lower_concentration')
 
     @property
-    def incr_concentr_nitrogyn_seepage(self):
-        """Not implemented as the Django database does not define nitrogen."""
-        pass
+    def incr_concentr_nitrogen_seepage(self):
+        """Return the increment nitrogen concentration of the seepage."""
+        return self.get_concentration('seepage', 'n_incremental')
+
+    # the previous names of the nitrogen properties
+    min_concentr_nitrogyn_precipitation = min_concentr_nitrogen_precipitation
+    incr_concentr_nitrogyn_precipitation = incr_concentr_nitrogen_precipitation
+    min_concentr_nitrogyn_seepage = min_concentr_nitrogen_seepage
+    incr_concentr_nitrogyn_seepage = incr_concentr_nitrogen_seepage
 
     @property
     def min_concentr_sulphate_precipitation(self):
-        """Not implemented as the Django database does not define sulphate."""
-        pass
+        """Return the minimum sulphate concentration of the precipitation."""
+        return self.get_concentration('precipitation', 'so4_lower_concentration')
 
     @property
     def incr_concentr_sulphate_precipitation(self):
-        """Not implemented as the Django database does not define sulphate."""
-        pass
+        """Return the increment sulphate concentration of the precipitation."""
+        return self.get_concentration('precipitation', 'so4_incremental')
 
     @property
     def min_concentr_sulphate_seepage(self):
-        """Not implemented as the Django database does not define sulphate."""
-        pass
+        """Return the minimum sulphate concentration of the seepage."""
+        return self.get_concentration('seepage', 'so4_lower_concentration')
 
     @property
     def incr_concentr_sulphate_seepage(self):
-        """Not implemented as the Django database does not define sulphate."""
-        pass
+        """Return the increment sulphate concentration of the seepage."""
+        return self.get_concentration('seepage', 'so4_incremental')
+
+
+def get_state_without_snapshot(instance):
+    """Return the state to pickle of the given Bucket or PumpingStation.
+
+    Buckets and pumping stations are keys of the cached results, so their
+    state should not contain the AreaSnapshot and its ConcentrationIndex,
+    which contain the data of the whole area. An unpickled instance reads
+    that data from the configuration again, when it needs it.
+
+    """
+    state = instance.__dict__.copy()
+    state['snapshot'] = None
+    state['_concentration_index'] = None
+    return state
 
 
 class Bucket(object):
 
-    def __init__(self, configuration, database_bucket):
+    def __init__(self, configuration, database_bucket, snapshot=None):
         self.configuration = configuration
         self.database_bucket = database_bucket
+        self.snapshot = snapshot
+        self._concentration_index = None
+
+    def __getstate__(self):
+        return get_state_without_snapshot(self)
+
+    def _get_open_water(self):
+        if self.snapshot is None:
+            return self.configuration.open_water
+        return self.snapshot.open_water
+
+    def _get_concentration_index(self):
+        if self.snapshot is not None:
+            return self.snapshot.concentration_index
+        if self._concentration_index is None:
+            self._concentration_index = create_concentration_index(self.configuration)
+        return self._concentration_index
 
     def copy_properties(self):
         """Store the properties that do not belong to the database bucket."""
@@ -398,16 +611,6 @@ class Bucket(object):
         self.min_water_level = self.database_bucket.upper_min_water_level
         self.equi_water_level = self.database_bucket.upper_equi_water_level
         self.init_water_level = self.database_bucket.upper_init_water_level
-        # the following fields are set to None as the Django database does not
-        # define nitrogen
-        self.min_concentr_nitrogen_flow_off = None
-        self.min_concentr_nitrogen_drainage_indraft = None
-        self.incr_concentr_nitrogen_flow_off = None
-        self.incr_concentr_nitrogen_drainage_indraft = None
-        self.min_concentr_sulphate_flow_off = None
-        self.min_concentr_sulphate_drainage_indraft = None
-        self.incr_concentr_sulphate_flow_off = None
-        self.incr_concentr_sulphate_drainage_indraft = None
 
         return self
 
@@ -441,7 +644,7 @@ class Bucket(object):
         """
         timeseries = None
 
-        sewer = self.configuration.open_water.sewer
+        sewer = self._get_open_water().sewer
         if sewer is None:
             return timeseries
 
@@ -469,10 +672,7 @@ class Bucket(object):
         function returns None.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == program_name:
-                return getattr(concentr, attribute)
-        return None
+        return self._get_concentration_index().get(program_name, attribute)
 
     @property
     def concentr_chloride_flow_off(self):
@@ -494,12 +694,61 @@ class Bucket(object):
     def incr_concentr_phosphate_drainage_indraft(self):
         return self.get_concentration('undrained', 'stof_increment')
 
+    @property
+    def min_concentr_nitrogen_flow_off(self):
+        return self.get_concentration('flow_off', 'n_lower_concentration')
+
+    @property
+    def min_concentr_nitrogen_drainage_indraft(self):
+        return self.get_concentration('undrained', 'n_lower_concentration')
+
+    @property
+    def incr_concentr_nitrogen_flow_off(self):
+        return self.get_concentration('flow_off', 'n_incremental')
+
+    @property
+    def incr_concentr_nitrogen_drainage_indraft(self):
+        return self.get_concentration('undrained', 'n_incremental')
+
+    @property
+    def min_concentr_sulphate_flow_off(self):
+        return self.get_concentration('flow_off', 'so4_lower_concentration')
+
+    @property
+    def min_concentr_sulphate_drainage_indraft(self):
+        return self.get_concentration('undrained', 'so4_lower_concentration')
+
+    @property
+    def incr_concentr_sulphate_flow_off(self):
+        return self.get_concentration('flow_off', 'so4_incremental')
+
+    @property
+    def incr_concentr_sulphate_drainage_indraft(self):
+        return self.get_concentration('undrained', 'so4_incremental')
+
 
 class PumpingStation(object):
 
-    def __init__(self, configuration, db_station):
+    def __init__(self, configuration, db_station, snapshot=None):
         self.configuration = configuration
         self.db_station = db_station
+        self.snapshot = snapshot
+        self._concentration_index = None
+
+    def __getstate__(self):
+        return get_state_without_snapshot(self)
+
+    def _get_concentration_index(self):
+        if self.snapshot is not None:
+            return self.snapshot.concentration_index
+        if self._concentration_index is None:
+            self._concentration_index = create_concentration_index(self.configuration)
+        return self._concentration_index
+
+    def _get_pump_lines(self):
+        if self.snapshot is None:
+            return self.db_station.pump_lines.all()
+        return self.snapshot.pump_lines[self.db_station.pk]
 
     def copy_properties(self):
         """Store the properties that do not belong to the database bucket."""
@@ -528,7 +777,7 @@ class PumpingStation(object):
         result = SparseTimeseriesStub()
         factor = (1.0 if self.into else -1.0)
         map_f = lambda v: factor * abs(v)
-        for pump_line in self.db_station.pump_lines.all():
+        for pump_line in self._get_pump_lines():
             timeseries = map_timeseries(pump_line.retrieve_timeseries(), map_f)
             result = add_timeseries(result, timeseries)
         return result
@@ -540,9 +789,8 @@ class PumpingStation(object):
         the program name of the label of the bucket.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == self.db_station.label.program_name:
-                return concentr.cl_concentration
+        return self._get_concentration_index().get(self.db_station.label.program_name,
+                                                   'cl_concentration')
 
     def set_concentrations(self, new_attr_names):
         """Set the concentrations of the current PumpingStation
@@ -552,9 +800,9 @@ class PumpingStation(object):
                 dictionary of new attribute names to database attribute names
 
         """
+        concentration = self._find_concentration()
         for new_attr_name, prev_attr_name in new_attr_names.iteritems():
-            concentration = self._find_concentration()
-            attr_value = getattr(concentration, prev_attr_name)
+            attr_value = getattr(concentration, prev_attr_name, None)
             setattr(self, new_attr_name, attr_value)
 
     def _find_concentration(self):
@@ -564,10 +812,7 @@ class PumpingStation(object):
         the program name of the label of the PumpingStation.
 
         """
-        for concentr in self.configuration.config_concentrations.all().select_related('Label'):
-            if concentr.label.program_name == self.db_station.label.program_name:
-                return concentr
-        return None
+        return self._get_concentration_index().find(self.db_station.label.program_name)
 
     def __hash__(self):
         return hash(self.name)
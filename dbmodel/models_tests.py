@@ -22,11 +22,16 @@
 # You should have received a copy of the GNU General Public License along with
 # this package.  If not, see <http://www.gnu.org/licenses/>.
 
+import pickle
 import unittest
 
 from mock import Mock
 
+from models import Area
+from models import Bucket
+from models import ConcentrationIndex
 from models import PumpingStation
+from models import find_concentration
 
 class PumpingStationTests(unittest.TestCase):
 
@@ -54,3 +59,101 @@ class PumpingStationTests(unittest.TestCase):
         station.set_concentrations(new_attr_names)
         self.assertEqual(0.2, station.min_concentr_phosphate)
         self.assertEqual(0.4, station.incr_concentr_phosphate)
+
+    def test_c(self):
+        """Test the concentration is found in the snapshot."""
+        label = Mock()
+        label.program_name = 'intake'
+        self.concentration.label = label
+        snapshot = Mock()
+        snapshot.concentration_index = ConcentrationIndex([self.concentration])
+        db_station = Mock()
+        db_station.label = label
+        station = PumpingStation(None, db_station, snapshot)
+        self.assertEqual(self.concentration, station._find_concentration())
+
+    def test_d(self):
+        """Test the snapshot is not pickled with a pumping station or bucket."""
+        snapshot = {'open_water': 'open water'}
+        for instance in [PumpingStation(None, 'station', snapshot),
+                         Bucket(None, 'bucket', snapshot)]:
+            instance.name = 'name'
+            instance._concentration_index = ConcentrationIndex([])
+            pickled = pickle.dumps(instance, pickle.HIGHEST_PROTOCOL)
+            self.assertFalse('open water' in pickled)
+            unpickled = pickle.loads(pickled)
+            self.assertEqual('name', unpickled.name)
+            self.assertEqual(None, unpickled.snapshot)
+            self.assertEqual(None, unpickled._concentration_index)
+            self.assertTrue(instance.snapshot is snapshot)
+
+
+class AreaTests(unittest.TestCase):
+
+    def test_a(self):
+        """Test the snapshot is only created once until it is invalidated."""
+        area = Area(None)
+        snapshot = Mock()
+        snapshot.buckets = ['bucket']
+        area._snapshot = snapshot
+        self.assertEqual(['bucket'], area.buckets)
+        self.assertTrue(area.snapshot is snapshot)
+        area.invalidate()
+        self.assertEqual(None, area._snapshot)
+
+    def test_b(self):
+        """Test find_concentration returns None when no label matches."""
+        concentration = Mock()
+        concentration.label = Mock()
+        concentration.label.program_name = 'seepage'
+        self.assertEqual(concentration, find_concentration([concentration], 'seepage'))
+        self.assertEqual(None, find_concentration([concentration], 'precipitation'))
+
+
+def create_concentration(program_name, **values):
+    concentration = Mock()
+    concentration.label = Mock()
+    concentration.label.program_name = program_name
+    for attribute in ['cl_concentration', 'stof_lower_concentration',
+                      'stof_increment', 'p_lower_concentration', 'p_incremental',
+                      'n_lower_concentration', 'n_incremental',
+                      'so4_lower_concentration', 'so4_incremental']:
+        setattr(concentration, attribute, values.get(attribute))
+    return concentration
+
+
+class ConcentrationIndexTests(unittest.TestCase):
+
+    def test_a(self):
+        """Test the index returns the attribute of the matching Concentration."""
+        index = ConcentrationIndex([create_concentration('seepage', cl_concentration=1.0),
+                                    create_concentration('flow_off', cl_concentration=2.0),
+                                    create_concentration('flow_off', cl_concentration=3.0)])
+        self.assertEqual(1.0, index.get('seepage', 'cl_concentration'))
+        self.assertEqual(2.0, index.get('flow_off', 'cl_concentration'))
+        self.assertEqual(None, index.get('precipitation', 'cl_concentration'))
+
+    def test_b(self):
+        """Test the buckets of a snapshot share its index for all substances."""
+        snapshot = Mock()
+        snapshot.concentration_index = ConcentrationIndex([
+            create_concentration('flow_off', stof_lower_concentration=0.1,
+                                 n_lower_concentration=0.2, so4_incremental=0.3),
+            create_concentration('undrained', n_incremental=0.4)])
+        bucket = Bucket(None, None, snapshot)
+        self.assertEqual(0.1, bucket.min_concentr_phosphate_flow_off)
+        self.assertEqual(0.2, bucket.min_concentr_nitrogen_flow_off)
+        self.assertEqual(0.3, bucket.incr_concentr_sulphate_flow_off)
+        self.assertEqual(0.4, bucket.incr_concentr_nitrogen_drainage_indraft)
+
+    def test_c(self):
+        """Test the nitrogen and sulphate concentrations of an Area."""
+        area = Area(None)
+        area._snapshot = Mock()
+        area._snapshot.concentration_index = ConcentrationIndex([
+            create_concentration('precipitation', n_incremental=0.5,
+                                 so4_lower_concentration=0.6)])
+        self.assertEqual(0.5, area.incr_concentr_nitrogen_precipitation)
+        self.assertEqual(0.5, area.incr_concentr_nitrogyn_precipitation)
+        self.assertEqual(0.6, area.min_concentr_sulphate_precipitation)
+        self.assertEqual(None, area.min_concentr_sulphate_seepage)
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#******************************************************************************
+#
+# This file is part of the lizard_waterbalance Django app.
+#
+# The lizard_waterbalance app is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# the lizard_waterbalance app.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2012 Nelen & Schuurmans
+#
+#******************************************************************************
+
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models import ForeignKey
+from django.db.models import Max
+from django.db.models import Sum
+from django.db.models.signals import post_save
+
+from lizard_waterbalance.models import IncompleteData
+from lizard_waterbalance.models import TimeseriesEvent
+from lizard_waterbalance.models import WaterbalanceConf
+from lizard_waterbalance.models import WaterbalanceTimeserie
+
+# number of seconds the fingerprint of a configuration is kept in the cache
+FINGERPRINT_TIMEOUT = 60
+
+
+def get_field_values(instance):
+    """Return the list of (name, value) of the fields of the given model instance.
+
+    The list contains the value of each field that is stored in the table of
+    the instance, where the value of a foreign key is the primary key of the
+    instance it refers to.
+
+    """
+    if instance is None:
+        return None
+    return [(field.attname, getattr(instance, field.attname))
+            for field in instance._meta.fields]
+
+
+def get_timeseries_fields(instance):
+    """Return the WaterbalanceTimeserie(s) the given model instance refers to."""
+    result = []
+    for field in instance._meta.fields:
+        if isinstance(field, ForeignKey) and field.rel.to is WaterbalanceTimeserie:
+            result.append(getattr(instance, field.name))
+    return [wb_timeserie for wb_timeserie in result if wb_timeserie is not None]
+
+
+def get_local_markers(timeseries_ids):
+    """Return the dictionary of Timeseries id to the marker of its events.
+
+    The marker of the events of a time series is the triple (number of
+    events, date time of the last event, sum of their values). When an
+    event is added, removed or modified, its marker almost certainly changes.
+    This function retrieves the markers of all given time series in a single
+    query.
+
+    """
+    markers = TimeseriesEvent.objects.filter(
+        timeseries__in=timeseries_ids).values('timeseries').annotate(
+        count=Count('id'), last=Max('time'), total=Sum('value'))
+    return dict((marker['timeseries'], (marker['count'], marker['last'], marker['total']))
+                for marker in markers)
+
+
+def get_fews_marker(fews_timeseries):
+    """Return the marker of the events of the given TimeseriesFews.
+
+    See get_local_markers for the contents of a marker. If the Fews time
+    series does not exist, this function returns None.
+
+    """
+    try:
+        handle = fews_timeseries._get_fews_timeserie_object()
+    except IncompleteData:
+        return None
+    marker = handle.timeseriedata.aggregate(count=Count('tsd_time'),
+                                            last=Max('tsd_time'),
+                                            total=Sum('tsd_value'))
+    return marker['count'], marker['last'], marker['total']
+
+
+def get_timeseries_markers(waterbalance_timeseries):
+    """Return the list of markers of the given WaterbalanceTimeserie(s).
+
+    The marker of a WaterbalanceTimeserie contains its fields, the fields of
+    the time series it uses and the marker of the events of that time series.
+
+    """
+    local_ids = [wb_timeserie.local_timeseries_id
+                 for wb_timeserie in waterbalance_timeseries
+                 if not wb_timeserie.use_fews and wb_timeserie.local_timeseries_id is not None]
+    local_markers = get_local_markers(local_ids)
+
+    markers = []
+    for wb_timeserie in waterbalance_timeseries:
+        timeseries = wb_timeserie.get_timeseries()
+        if timeseries is None:
+            events_marker = None
+        elif wb_timeserie.use_fews:
+            events_marker = get_fews_marker(timeseries)
+        else:
+            events_marker = local_markers.get(timeseries.pk)
+        markers.append((get_field_values(wb_timeserie), get_field_values(timeseries),
+                        events_marker))
+    return markers
+
+
+def compute_fingerprint(configuration):
+    """Return the fingerprint of the computation of the given configuration.
+
+    The fingerprint is the SHA-1 hex digest of the fields of the
+    configuration, its open water, buckets, pumping stations, pump lines and
+    concentrations, and of the markers of all the time series they use, see
+    get_timeseries_markers. A change to any of these inputs changes the
+    fingerprint, so the fingerprint can be used to key the stored results of
+    the computation.
+
+    """
+    open_water = configuration.open_water
+    items = [get_field_values(configuration), get_field_values(open_water)]
+    items.append([get_field_values(concentration) for concentration in
+                  configuration.config_concentrations.all().order_by('pk')])
+
+    waterbalance_timeseries = list(configuration.references.all().order_by('pk'))
+    if open_water is not None:
+        waterbalance_timeseries += get_timeseries_fields(open_water)
+        for bucket in open_water.buckets.all().order_by('pk'):
+            items.append(get_field_values(bucket))
+            waterbalance_timeseries += get_timeseries_fields(bucket)
+        for station in open_water.pumping_stations.all().order_by('pk'):
+            items.append(get_field_values(station))
+            for pump_line in station.pump_lines.all().order_by('pk'):
+                items.append(get_field_values(pump_line))
+                waterbalance_timeseries += get_timeseries_fields(pump_line)
+    items.append(get_timeseries_markers(waterbalance_timeseries))
+
+    return hashlib.sha1(repr(items)).hexdigest()
+
+
+def get_fingerprint_key(configuration):
+    """Return the cache key name of the fingerprint of the given configuration."""
+    return 'fingerprint::%d' % configuration.pk
+
+
+def get_fingerprint(configuration, timeout=FINGERPRINT_TIMEOUT):
+    """Return the fingerprint of the given configuration.
+
+    The computation of a fingerprint requires dozens of queries, see
+    compute_fingerprint, and the views need it for each request. Therefore
+    this function keeps the fingerprint in the cache for the given number of
+    seconds. A change to the inputs of the configuration is detected when
+    that time has passed, or immediately when the configuration is saved or
+    its fingerprint is forgotten, see forget_fingerprint.
+
+    """
+    if configuration.pk is None:
+        return compute_fingerprint(configuration)
+    key = get_fingerprint_key(configuration)
+    fingerprint = cache.get(key)
+    if fingerprint is None:
+        fingerprint = compute_fingerprint(configuration)
+        cache.set(key, fingerprint, timeout)
+    return fingerprint
+
+
+def forget_fingerprint(configuration):
+    """Remove the fingerprint of the given configuration from the cache."""
+    if configuration.pk is not None:
+        cache.delete(get_fingerprint_key(configuration))
+
+
+def post_save_forget_fingerprint(*args, **kwargs):
+    """Remove the fingerprint of the saved WaterbalanceConf from the cache."""
+    forget_fingerprint(kwargs['instance'])
+
+post_save.connect(post_save_forget_fingerprint, sender=WaterbalanceConf)
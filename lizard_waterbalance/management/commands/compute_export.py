@@ -83,7 +83,7 @@ class Command(BaseCommand):
         cache_key_name = CacheKeyName(configuration)
         names = [ "sluice_error", "total_outtakes", "incoming", "outgoing",
             "outcome", "pair", "ref_in", "ref_out", "sluice_error_waterlevel",
-            "fractions_1", "fractions_2", "concentrations", "impact",
+            "fractions", "concentrations", "impact",
             "impact_incremental" ]
         key_names = [cache_key_name.get(name) for name in names]
         cache.delete_many(key_names)
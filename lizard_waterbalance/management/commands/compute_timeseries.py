@@ -1,45 +1,415 @@
 import datetime
 import logging
+import multiprocessing
+import os
+import time
 
+from optparse import make_option
+
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from dbmodel.models import Area
+from lizard_waterbalance.fingerprint import forget_fingerprint
 from lizard_waterbalance.models import IncompleteData
+from lizard_waterbalance.models import Parameter
 from lizard_waterbalance.models import WaterbalanceConf
 from lizard_waterbalance.models import WaterbalanceTimeserie
+from lizard_waterbalance.views import CacheKeyName
+from lizard_waterbalance.views import CachedWaterbalanceComputer
+from lizard_waterbalance.views import get_result_store
 from lizard_wbcomputation.compute import WaterbalanceComputer2
+from lizard_wbcomputation.incremental import compute_incremental
+from lizard_wbcomputation.incremental import load_record
+from lizard_wbcomputation.incremental import save_record
+from lizard_wbcomputation.incremental import trim_record
+from timeseries.timeseriesstub import grouped_event_values
 
 
 logger = logging.getLogger(__name__)
 
+# name of the WaterbalanceTimeserie and Parameter of the monthly sluice error
+SLUICE_ERROR_NAME = 'sluitfout'
+
+# name of the method of WaterbalanceComputer2 that computes the sluice error
+SLUICE_ERROR_METHOD_NAME = 'calc_sluice_error_timeseries'
+
+
+class ConfigurationReport(object):
+    """Stores the outcome of the computation of a single configuration.
+
+    Instance variables:
+      *pk*
+        primary key of the WaterbalanceConf
+      *name*
+        name of the WaterbalanceConf
+      *status*
+        'done', 'incomplete' when the data was incomplete or 'failed'
+      *seconds*
+        number of seconds the computation took
+      *message*
+        description of the error when the computation failed, None otherwise
+      *fingerprint*
+        fingerprint of the inputs of the WaterbalanceConf, None when it
+        could not be computed
+
+    """
+    def __init__(self, pk, name, status, seconds, message=None, fingerprint=None):
+        self.pk = pk
+        self.name = name
+        self.status = status
+        self.seconds = seconds
+        self.message = message
+        self.fingerprint = fingerprint
+
+
+def estimate_work(configuration):
+    """Return an estimate of the work to compute the given configuration.
+
+    The work is proportional to the number of days of the calculation period
+    and, as the buckets take most of the time, to the number of buckets.
+
+    When the calculation period cannot be determined, for example because the
+    configuration does not have an open water, this function returns 0. The
+    computation of that configuration reports the actual problem.
+
+    """
+    if configuration.open_water is None:
+        bucket_count = 0
+    else:
+        bucket_count = configuration.open_water.buckets.count()
+    try:
+        start_date, end_date = configuration.get_calc_period()
+    except (AttributeError, IncompleteData):
+        logger.warning('Unable to estimate the work of configuration %s.' %
+                       configuration.pk)
+        return 0
+    day_count = max((end_date - start_date).days, 0)
+    return (bucket_count + 1) * day_count
+
+
+def schedule_configurations(configurations, estimate=estimate_work):
+    """Return the given configurations sorted by descending estimated work.
+
+    When the largest computations start first, the smaller ones can fill up
+    the gaps at the end of the batch.
+
+    """
+    return sorted(configurations, key=estimate, reverse=True)
+
+
+def create_bucket_executor(processes):
+    """Return the executor to compute the buckets with the given number of processes.
+
+    This function returns None when only a single process is requested, in
+    which case WaterbalanceComputer2 computes the buckets in the current
+    process.
+
+    """
+    if processes > 1:
+        return ProcessPoolExecutor(processes)
+    return None
+
+
+def compute_configuration(pk, start_date_calc, end_date_calc, record_directory=None,
+                          executor=None):
+    """Compute the configuration with the given primary key.
+
+    This function returns the ConfigurationReport of the computation. It
+    does not raise an exception when the computation fails, so the failure
+    of one configuration does not abort the batch. Apart from the executor,
+    it only uses picklable parameters, so it can be executed by a
+    multiprocessing.Pool.
+
+    When an executor is given, for example the one returned by
+    create_bucket_executor, the buckets of the configuration are computed
+    using that executor.
+
+    When a record directory is given, this function only computes the days
+    after the previous computation, see compute_incremental.
+
+    When a ResultStore is configured, see views.get_result_store, this
+    function also computes the results the views use and stores them in
+    that ResultStore.
+
+    """
+    started = time.time()
+    configuration = WaterbalanceConf.objects.get(pk=pk)
+    name = unicode(configuration)
+    logger.info('Processing %s...' % name)
+    fingerprint = None
+    try:
+        result_store = get_result_store()
+        if result_store is not None:
+            # the results should be stored for the current inputs, not for
+            # the inputs of the fingerprint in the cache
+            forget_fingerprint(configuration)
+            cache_key_name = CacheKeyName(configuration)
+            fingerprint = cache_key_name.fingerprint
+        if record_directory is None:
+            waterbalance_computer = WaterbalanceComputer2(configuration,
+                                                          Area(configuration),
+                                                          executor=executor)
+            logger.info('Computing sluice errors...')
+            sluice_error = waterbalance_computer.calc_sluice_error_timeseries(
+                start_date_calc, end_date_calc)
+            store_sluice_error(configuration, sluice_error, start_date_calc,
+                               end_date_calc)
+        else:
+            compute_record(configuration, start_date_calc, end_date_calc,
+                           record_directory, executor)
+        if result_store is not None:
+            logger.info('Storing the results...')
+            fill_result_store(configuration, cache_key_name, result_store,
+                              executor)
+        status, message = 'done', None
+    except IncompleteData:
+        logger.info('Skipped %s because of incomplete data.' % name)
+        status, message = 'incomplete', None
+    except Exception, e:
+        logger.exception('Failed to compute %s.' % name)
+        status, message = 'failed', unicode(e)
+    return ConfigurationReport(pk, name, status, time.time() - started, message,
+                               fingerprint)
+
+
+def compute_configuration_task(args):
+    """Call compute_configuration with the given tuple of arguments."""
+    return compute_configuration(*args)
+
+
+def compute_record(configuration, start_date_calc, end_date_calc, record_directory,
+                   executor=None):
+    """Extend the results of the previous run of the given configuration.
+
+    The results and the state at the end of the previous run of a
+    configuration are stored in a file in the given directory. This function
+    only computes the days after that run, unless the input before the end
+    of that run has changed.
+
+    """
+    file_name = os.path.join(record_directory,
+                             'configuration-%d.pickle' % configuration.pk)
+    if os.path.exists(file_name):
+        record = load_record(file_name)
+    else:
+        record = None
+    if record is not None and find_sluice_error(configuration) is None:
+        # the record only contains the last month, so the stored sluice
+        # error has to be computed from scratch
+        record = None
+
+    def create_computer(checkpoint, checkpoint_dates):
+        return WaterbalanceComputer2(configuration,
+                                     Area(configuration),
+                                     checkpoint=checkpoint,
+                                     checkpoint_dates=checkpoint_dates,
+                                     executor=executor)
+
+    record = compute_incremental(create_computer, start_date_calc,
+                                 end_date_calc, record, [SLUICE_ERROR_METHOD_NAME])
+    logger.info('Storing sluice errors from %s...', record.outputs_start)
+    store_sluice_error(configuration, record.outputs[SLUICE_ERROR_METHOD_NAME],
+                       record.start_date, record.end_date,
+                       replace_from=record.outputs_start)
+    # the next run only has to recompute the sums of the last month, so the
+    # record does not have to keep the days before that month
+    end_date = record.end_date
+    trim_record(record, datetime.datetime(end_date.year, end_date.month, 1))
+    save_record(file_name, record)
+
+
+def get_sluice_error_parameter():
+    """Return the Parameter of the monthly sluice error."""
+    parameter, _ = Parameter.objects.get_or_create(
+        name=SLUICE_ERROR_NAME,
+        defaults={'unit': 'm3/maand',
+                  'sourcetype': Parameter.TYPE_COMPUTED})
+    return parameter
+
+
+def find_sluice_error(configuration):
+    """Return the WaterbalanceTimeserie of the monthly sluice error.
+
+    This function returns None when the sluice error of the given
+    configuration has not been stored.
+
+    """
+    existing_timeseries = WaterbalanceTimeserie.objects.filter(
+        name=SLUICE_ERROR_NAME,
+        parameter=get_sluice_error_parameter(),
+        configuration=configuration,
+        timestep=WaterbalanceTimeserie.TIMESTEP_MONTH)
+    if existing_timeseries:
+        return existing_timeseries[0]
+    return None
+
+
+def store_sluice_error(configuration, timeseries, start_date, end_date,
+                       replace_from=None):
+    """Store the monthly sums of the given sluice error of the configuration.
+
+    The sums are stored in the WaterbalanceTimeserie of the configuration
+    with timestep TIMESTEP_MONTH. When a date to replace from is given and that
+    WaterbalanceTimeserie exists, this function only replaces the sums from
+    that date and keeps the sums before it. Otherwise it replaces the whole
+    WaterbalanceTimeserie. Note that the date to replace from should be the
+    first day of a month, as the sum of the month it falls in is replaced.
+
+    """
+    monthly_events = [(date, value) for (date, value) in
+                      grouped_event_values(timeseries, 'month')
+                      if replace_from is None or date >= replace_from]
+    if replace_from is not None and replace_from > start_date:
+        wb_timeseries = find_sluice_error(configuration)
+        if wb_timeseries is not None:
+            wb_timeseries.get_timeseries().save_events(monthly_events, replace=True)
+            wb_timeseries.hint_datetime_end = end_date
+            wb_timeseries.save()
+            return
+    WaterbalanceTimeserie.create(SLUICE_ERROR_NAME,
+                                 get_sluice_error_parameter(),
+                                 dict(monthly_events),
+                                 configuration=configuration,
+                                 timestep=WaterbalanceTimeserie.TIMESTEP_MONTH,
+                                 hint_datetime_start=start_date,
+                                 hint_datetime_end=end_date)
+
+
+def fill_result_store(configuration, cache_key_name, result_store, executor=None):
+    """Store the results of the given configuration in the given ResultStore.
+
+    The results are computed for the calculation period of the configuration,
+    which is the period for which the views request them.
+
+    """
+    waterbalance_computer = CachedWaterbalanceComputer(cache_key_name,
+                                                       configuration,
+                                                       Area(configuration),
+                                                       result_store=result_store,
+                                                       executor=executor)
+    start_date, end_date = configuration.get_calc_period()
+    waterbalance_computer.compute_all(start_date, end_date)
+
+
+def log_reports(reports):
+    """Log the summary of the given ConfigurationReport(s)."""
+    logger.info('*****************')
+    for status in ['done', 'incomplete', 'failed']:
+        selected = [report for report in reports if report.status == status]
+        logger.info('%s: %d configuration(s)' % (status, len(selected)))
+        for report in sorted(selected, key=lambda report: report.seconds, reverse=True):
+            if report.message is None:
+                logger.info('  %s (%.1f s)' % (report.name, report.seconds))
+            else:
+                logger.info('  %s (%.1f s): %s' % (report.name, report.seconds,
+                                                   report.message))
+    logger.info('total computation time: %.1f s' %
+                sum(report.seconds for report in reports))
+
 
 class Command(BaseCommand):
     args = ""
     help = ("Compute timeseries which are visible "
             "in the geographical environment.")
 
+    option_list = BaseCommand.option_list + (
+        make_option("--incremental",
+                    dest="record_directory",
+                    default=None,
+                    help="only compute the days after the previous run, "
+                         "using the records of that run in the given "
+                         "directory"),
+        make_option("--processes",
+                    dest="processes",
+                    type="int",
+                    default=1,
+                    help="number of processes that compute the "
+                         "configurations"),
+        make_option("--bucket-processes",
+                    dest="bucket_processes",
+                    type="int",
+                    default=1,
+                    help="number of processes that compute the buckets "
+                         "of a configuration, which cannot be combined "
+                         "with --processes"),)
+
     def handle(self, *args, **options):
         logger.info('Start computing timeseries.')
 
         start_date_calc = datetime.datetime(1900, 1, 1)
-        end_date_calc = (datetime.datetime.now() +
-                         datetime.timedelta(days=31))
-
-        done_list = []
-
-        # Loop all configurations, try to calculate sluice errors.
-        for configuration in WaterbalanceConf.objects.all():
-            logger.info('Processing %s...' % configuration)
-            waterbalance_computer = WaterbalanceComputer2(configuration)
-
-            try:
-                logger.info('Computing sluice errors...')
-                waterbalance_computer.calc_and_store_sluice_error_timeseries(
-                    start_date_calc, end_date_calc,
-                    timestep=WaterbalanceTimeserie.TIMESTEP_MONTH)
-                done_list.append(configuration)
-            except IncompleteData:
-                logger.info('Skipped because of incomplete data.')
-
-        logger.info('*****************')
-        logger.info('Succesfully done:')
-        for d in done_list:
-            logger.info(d)
+        record_directory = options.get('record_directory')
+        if record_directory is None:
+            end_date_calc = (datetime.datetime.now() +
+                             datetime.timedelta(days=31))
+        else:
+            # As the forecasts beyond today change each day, the incremental
+            # computation ends at the start of today.
+            today = datetime.date.today()
+            end_date_calc = datetime.datetime(today.year, today.month, today.day)
+            if not os.path.isdir(record_directory):
+                os.makedirs(record_directory)
+
+        configurations = schedule_configurations(WaterbalanceConf.objects.all())
+        tasks = [(configuration.pk, start_date_calc, end_date_calc, record_directory)
+                 for configuration in configurations]
+
+        processes = options.get('processes') or 1
+        bucket_processes = options.get('bucket_processes') or 1
+        if processes > 1 and bucket_processes > 1:
+            # the workers of a multiprocessing.Pool are daemonic processes,
+            # which are not allowed to create processes of their own
+            raise CommandError('Options --processes and --bucket-processes '
+                               'cannot be combined.')
+
+        started = time.time()
+        if processes > 1:
+            reports = self.compute_in_pool(tasks, processes)
+        else:
+            reports = self.compute_in_process(tasks, bucket_processes)
+        log_reports(reports)
+        logger.info('elapsed time: %.1f s' % (time.time() - started))
+
+        result_store = get_result_store()
+        if result_store is not None:
+            # the results of the fingerprints that are no longer current
+            # cannot be requested anymore, unless a view has stored them
+            # during this run because the inputs changed in the meantime
+            result_store.remove_others((report.fingerprint for report in reports),
+                                       before=started)
+
+        failed_count = len([report for report in reports if report.status == 'failed'])
+        if failed_count > 0:
+            raise CommandError('Failed to compute %d configuration(s).' % failed_count)
+
+    def compute_in_process(self, tasks, bucket_processes):
+        """Compute the given tasks in the current process.
+
+        The buckets of each configuration are computed by the given number
+        of processes, see create_bucket_executor.
+
+        """
+        executor = create_bucket_executor(bucket_processes)
+        try:
+            return [compute_configuration(*(task + (executor,))) for task in tasks]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def compute_in_pool(self, tasks, processes):
+        """Compute the given tasks using a pool of the given number of processes.
+
+        The worker processes are forked from the current process. To make
+        sure each worker opens its own database connection, we close the
+        connection of the current process before the workers are created.
+
+        """
+        connection.close()
+        pool = multiprocessing.Pool(processes)
+        try:
+            # a chunk size of 1 makes sure the tasks start in the given order
+            return list(pool.imap_unordered(compute_configuration_task, tasks, 1))
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Implements tests for the command to compute the time series."""
+
+# This package implements the management commands for lizard-waterbalance Django
+# app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+import unittest
+
+from lizard_waterbalance.management.commands.compute_timeseries import create_bucket_executor
+from lizard_waterbalance.management.commands.compute_timeseries import estimate_work
+from lizard_waterbalance.models import WaterbalanceConf
+from lizard_waterbalance.management.commands.compute_timeseries import schedule_configurations
+
+
+class Buckets(object):
+
+    def __init__(self, count):
+        self._count = count
+
+    def count(self):
+        return self._count
+
+
+class OpenWater(object):
+
+    def __init__(self, bucket_count):
+        self.buckets = Buckets(bucket_count)
+
+
+class Configuration(object):
+
+    def __init__(self, name, bucket_count, start_date, end_date):
+        self.name = name
+        if bucket_count is None:
+            self.open_water = None
+        else:
+            self.open_water = OpenWater(bucket_count)
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def get_calc_period(self):
+        return self.start_date, self.end_date
+
+
+class ScheduleTests(unittest.TestCase):
+
+    def test_a(self):
+        """Test estimate_work takes the buckets and the period into account."""
+        configuration = Configuration('a', 3, datetime(2011, 1, 1), datetime(2011, 1, 11))
+        self.assertEqual(40, estimate_work(configuration))
+        configuration = Configuration('b', None, datetime(2011, 1, 1), datetime(2011, 1, 11))
+        self.assertEqual(10, estimate_work(configuration))
+
+    def test_b(self):
+        """Test schedule_configurations puts the largest configurations first."""
+        configurations = [
+            Configuration('small', 1, datetime(2011, 1, 1), datetime(2012, 1, 1)),
+            Configuration('large', 9, datetime(2000, 1, 1), datetime(2012, 1, 1)),
+            Configuration('medium', 9, datetime(2011, 1, 1), datetime(2012, 1, 1))]
+        self.assertEqual(['large', 'medium', 'small'],
+                         [configuration.name for configuration in
+                          schedule_configurations(configurations)])
+
+    def test_c(self):
+        """Test estimate_work handles a configuration without open water.
+
+        Without a calculation end date, WaterbalanceConf.get_calc_period
+        requires the open water to determine the end date.
+
+        """
+        configuration = WaterbalanceConf(calculation_start_date=datetime(2011, 1, 1))
+        self.assertEqual(0, estimate_work(configuration))
+        configurations = [configuration,
+                          Configuration('small', 1, datetime(2011, 1, 1), datetime(2012, 1, 1))]
+        self.assertEqual([configurations[1], configuration],
+                         schedule_configurations(configurations))
+
+
+class CreateBucketExecutorTests(unittest.TestCase):
+
+    def test_a(self):
+        """Test no executor is created for a single process."""
+        self.assertTrue(create_bucket_executor(1) is None)
+
+    def test_b(self):
+        """Test a ProcessPoolExecutor is created for multiple processes."""
+        executor = create_bucket_executor(2)
+        try:
+            self.assertEqual(4, executor.submit(pow, 2, 2).result())
+        finally:
+            executor.shutdown()
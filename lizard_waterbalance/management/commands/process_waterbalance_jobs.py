@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Implements the command to process the queued waterbalance computations."""
+
+# This package implements the management commands for lizard-waterbalance Django
+# app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from dbmodel.models import Area
+from lizard_waterbalance.models import WaterbalanceConf
+from lizard_waterbalance.views import CacheKeyName
+from lizard_waterbalance.views import CachedWaterbalanceComputer
+from lizard_waterbalance.views import get_job_queue
+
+
+logger = logging.getLogger(__name__)
+
+# number of seconds a finished job remains in the queue, so the requests that
+# wait for it can see it has finished
+FINISHED_JOB_AGE = 24 * 60 * 60
+
+
+def process_job(job_queue, key, argument):
+    """Compute the data of the configuration of the given job.
+
+    The argument of the job is the primary key of the configuration. This
+    function computes all the data the views need and marks the job as done,
+    or as failed when the computation raises an exception.
+
+    """
+    try:
+        configuration = WaterbalanceConf.objects.get(pk=int(argument))
+        logger.info('Processing %s...' % unicode(configuration))
+        waterbalance_computer = \
+            CachedWaterbalanceComputer(CacheKeyName(configuration),
+                                       configuration, Area(configuration))
+        start_date, end_date = configuration.get_calc_period()
+        waterbalance_computer.compute_all(start_date, end_date)
+        message = None
+    except Exception, e:
+        logger.exception('Failed to process job %s.' % key)
+        message = unicode(e) or e.__class__.__name__
+    finally:
+        # a worker runs for a long time, so we do not keep the database
+        # connection open between jobs
+        connection.close()
+    job_queue.finish(key, message)
+
+
+def process_jobs(job_queue, interval, once=False, sleep=time.sleep):
+    """Process the jobs of the given JobQueue.
+
+    When no job is queued, this function waits the given number of seconds
+    before it looks again. When once holds, this function returns as soon as
+    no job is queued.
+
+    """
+    while True:
+        job = job_queue.claim()
+        if job is not None:
+            process_job(job_queue, *job)
+            continue
+        job_queue.remove_finished(FINISHED_JOB_AGE)
+        if once:
+            break
+        sleep(interval)
+
+
+class Command(BaseCommand):
+    args = ""
+    help = ("Process the waterbalance computations that are queued by the "
+            "views, see setting LIZARD_WATERBALANCE_JOB_QUEUE.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--interval",
+                    dest="interval",
+                    type="float",
+                    default=1.0,
+                    help="number of seconds to wait before looking for "
+                         "new jobs"),
+        make_option("--once",
+                    dest="once",
+                    action="store_true",
+                    default=False,
+                    help="stop when no job is queued"),)
+
+    def handle(self, *args, **options):
+        job_queue = get_job_queue()
+        if job_queue is None:
+            logger.error('Setting LIZARD_WATERBALANCE_JOB_QUEUE is not present.')
+            return
+        logger.info('Start processing jobs.')
+        process_jobs(job_queue, options.get('interval') or 1.0,
+                     options.get('once'))
@@ -4,8 +4,50 @@
 divideVerticalSpaceEqually, reloadGraphs, show_popup, nothingFoundPopup */
 
 
+// number of milliseconds between two requests of the status of the computation
+var COMPUTATION_POLL_INTERVAL = 2000;
+
+
+function show_graphs(graphs) {
+    var div;
+    $('div#evenly-spaced-vertical .vertical-item').remove();
+    $.each(graphs, function (index, val) {
+        // console.log(val);
+        div = $("<div/>").addClass('vertical-item').addClass('img-use-my-size');
+        div.append($("<a/>").addClass('replace-with-image').attr('href', val).attr(
+            'data-errormsg', 'Waarschijnlijk is niet alle data ingevuld'));
+        // $('div#evenly-spaced-vertical').append(div);
+        div.insertBefore('#adjustment-form');
+    });
+    restretchExistingElements();
+}
+
+
+function wait_for_computation(status, status_url, done) {
+    // Call done when the computation of the graph data is no longer queued or
+    // running, so the graphs do not have to wait for it themselves.
+    if (status !== "queued" && status !== "running") {
+        done();
+        return;
+    }
+    window.setTimeout(function () {
+        $.ajax({
+            url: status_url,
+            type: "GET",
+            cache: false,
+            success: function (data, textStatus, xhr) {
+                wait_for_computation(data.status, status_url, done);
+            },
+            error: function (data, textStatus, xhr) {
+                done();
+            }
+        });
+    }, COMPUTATION_POLL_INTERVAL);
+}
+
+
 function graph_type_select(event) {
-    var $form, url, div;
+    var $form, url;
     event.preventDefault();
     $form = $(this).parents("#graphtype-select-form");
     url = $form.attr("action");
@@ -21,18 +63,11 @@ function graph_type_select(event) {
         data: $form.serialize(),
         type: "POST",
         success: function (data, textStatus, xhr) {
-            $button.attr("value", original_text);
-            $button.removeAttr("disabled");
-            $('div#evenly-spaced-vertical .vertical-item').remove();
-            $.each(data, function (index, val) {
-                // console.log(val);
-                div = $("<div/>").addClass('vertical-item').addClass('img-use-my-size');
-                div.append($("<a/>").addClass('replace-with-image').attr('href', val).attr(
-                    'data-errormsg', 'Waarschijnlijk is niet alle data ingevuld'));
-                // $('div#evenly-spaced-vertical').append(div);
-                div.insertBefore('#adjustment-form');
+            wait_for_computation(data.status, data.status_url, function () {
+                $button.attr("value", original_text);
+                $button.removeAttr("disabled");
+                show_graphs(data.graphs);
             });
-            restretchExistingElements();
         },
         error: function (data, textStatus, xhr) {
             $button.attr("value", original_text);
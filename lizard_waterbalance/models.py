@@ -27,25 +27,30 @@
 
 import logging
 import datetime
+import threading
+import time
+
+from cStringIO import StringIO
+from itertools import islice
+from itertools import izip
+
+import numpy
 
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.db import models
+from django.db import connection
 from django.db import transaction
 from django.db.models import Max
 from django.db.models import Min
+from django.db.models import Q
 from django.utils.translation import ugettext as _
 from django.template.defaultfilters import slugify
 from django.db.models.signals import pre_save
 from django.db.models.signals import post_save
 
-from lizard_fewsunblobbed.models import Filter as FewsFilter
-from lizard_fewsunblobbed.models import Location as FewsLocation
-from lizard_fewsunblobbed.models import Parameter as FewsParameter
 from lizard_fewsunblobbed.models import Timeserie as FewsTimeserie
 from lizard_map.models import ColorField
 from lizard_wbcomputation.bucket_types import BucketTypes
-from timeseries.timeseriesstub import daily_events
-from timeseries.timeseriesstub import daily_sticky_events
 from timeseries.timeseriesstub import TimeseriesWithMemoryStub
 from timeseries.timeseriesstub import TimeseriesRestrictedStub
 
@@ -54,6 +59,24 @@ from timeseries.timeseriesstub import TimeseriesRestrictedStub
 # in the function pre_save_configuration
 MAXLENGTH_OPENWATER_NAME = 64
 
+# number of events that insert_events sends to the database in one go
+INSERT_EVENTS_CHUNK_SIZE = 5000
+
+# timesteps of the Fews time series a TimeseriesFews can refer to, in order of
+# preference: the timestep is hardcoded for Waternet
+FEWS_TIMESTEPS = ["dag GMT+1", "dag GMT-8"]
+
+# number of seconds the FewsHandleCache keeps a resolved Fews time series
+FEWS_HANDLE_TTL = 15 * 60
+
+# number of events that iter_time_values retrieves in a single query
+EVENTS_CHUNK_SIZE = 10000
+
+# a single day and microsecond in the unit of the times that
+# generate_event_arrays uses
+DAY = numpy.timedelta64(1, 'D').astype('timedelta64[us]')
+MICROSECOND = numpy.timedelta64(1, 'us')
+
 logger = logging.getLogger(__name__)
 
 def generate_events(events, default_value, sticky, start_date, end_date):
@@ -66,28 +89,142 @@ def generate_events(events, default_value, sticky, start_date, end_date):
     exists, this method returns the value of the last event or if not present,
     the default value.
 
+    The events are computed by generate_event_arrays. A value that is missing,
+    for example because the default value is None, is returned as None.
+
+    """
+    times, values = generate_event_arrays(events, default_value, sticky,
+                                          start_date, end_date)
+    for date, value in izip(times.astype(object), values.tolist()):
+        if value != value:
+            value = None
+        yield date, value
+
+
+def read_time_arrays(events, chunk_size=EVENTS_CHUNK_SIZE):
+    """Return the pair of arrays (times, values) of the given events.
+
+    The times are stored as datetime64 in microseconds and the values as
+    floats, where a value of None is stored as NaN.
+
+    """
+    times_chunks = [numpy.zeros(0, dtype='datetime64[us]')]
+    values_chunks = [numpy.zeros(0)]
+    for chunk in iter_chunks(events, chunk_size):
+        times_chunks.append(numpy.array([time for time, value in chunk],
+                                        dtype='datetime64[us]'))
+        values_chunks.append(numpy.array([value for time, value in chunk],
+                                         dtype=float))
+    return numpy.concatenate(times_chunks), numpy.concatenate(values_chunks)
+
+
+def count_days_before(start, end):
+    """Return the number of days start + i * DAY, i >= 0, before end."""
+    return max(0, int((end - start + DAY - MICROSECOND) // DAY))
+
+
+def generate_event_arrays(events, default_value, sticky, start_date, end_date):
+    """Return the daily events of the given events as the arrays (times, values).
+
+    This function computes the same events as generate_events used to
+    generate one at a time, but it computes them in one go. Between two
+    successive events, it fills in an event for each day after the first
+    one, whose value is the value of the first event if sticky holds and the
+    default value otherwise.
+
+    If sticky holds and the start and end are not None, this function also
+    fills in the default value for each day from the start up to the first
+    event. If sticky holds and the end is not None, it fills in the value of
+    the last event for each day after that event up to and including the end.
+
+    The times are returned as datetime64 in microseconds. A value that is None
+    is returned as NaN.
+
     """
+    times, values = read_time_arrays(events)
+    if default_value is None:
+        default_value = numpy.nan
+    if len(times) == 0:
+        if sticky and start_date is not None and end_date is not None:
+            start = numpy.datetime64(start_date, 'us')
+            count = count_days_before(start, numpy.datetime64(end_date, 'us') + MICROSECOND)
+            return start + numpy.arange(count) * DAY, numpy.repeat(float(default_value), count)
+        return times, values
+
+    # the number of days to fill in after each event
+    gaps = times[1:] - times[:-1]
+    fill_counts = numpy.where(gaps > numpy.timedelta64(0, 'us'),
+                              (gaps - MICROSECOND) // DAY, 0)
+    counts = numpy.append(fill_counts, 0) + 1
+    indices = numpy.repeat(numpy.arange(len(times)), counts)
+    offsets = numpy.arange(counts.sum()) - (numpy.cumsum(counts) - counts)[indices]
+    daily_times = times[indices] + offsets * DAY
     if sticky:
-        if start_date is None or end_date is None:
-            date_before_first_event = False
-        else:
-            date_before_first_event = True
-            date = start_date
-        value = default_value
-        for event_date, event_value in daily_sticky_events(events):
-            while date_before_first_event and date < event_date:
-                yield date, default_value
-                date = date + datetime.timedelta(1)
-            yield event_date, event_value
-            date_before_first_event = False
-            date = event_date + datetime.timedelta(1)
-            value = event_value
-        while end_date is not None and date <= end_date:
-            yield date, value
-            date = date + datetime.timedelta(1)
+        daily_values = values[indices]
     else:
-        for date, value in daily_events(events, default_value=default_value):
-            yield date, value
+        daily_values = numpy.where(offsets == 0, values[indices], default_value)
+
+    if sticky and start_date is not None and end_date is not None:
+        start = numpy.datetime64(start_date, 'us')
+        count = count_days_before(start, times[0])
+        daily_times = numpy.concatenate([start + numpy.arange(count) * DAY, daily_times])
+        daily_values = numpy.concatenate([numpy.repeat(float(default_value), count),
+                                          daily_values])
+    if sticky and end_date is not None:
+        first = times[-1] + DAY
+        count = count_days_before(first, numpy.datetime64(end_date, 'us') + MICROSECOND)
+        daily_times = numpy.concatenate([daily_times, first + numpy.arange(count) * DAY])
+        daily_values = numpy.concatenate([daily_values, numpy.repeat(values[-1], count)])
+    return daily_times, daily_values
+
+
+def iter_time_values(queryset, time_field, value_field, chunk_size=EVENTS_CHUNK_SIZE):
+    """Return a generator of the (time, value) pairs of the given queryset.
+
+    The generator iterates over the pairs in the order of their time, and
+    of their primary key for the same time. It does not create a model
+    instance for each event and it does not retrieve all events at once: it
+    retrieves them using values_list, at most chunk_size events per query.
+    Each query continues after the (time, primary key) of the last event of
+    the previous query, so the memory use of the generator does not depend on
+    the number of events and no event is retrieved twice or skipped.
+
+    """
+    last_time, last_pk = None, None
+    while True:
+        chunk = queryset
+        if last_time is not None:
+            chunk = chunk.filter(Q(**{'%s__gt' % time_field: last_time}) |
+                                 Q(**{time_field: last_time, 'pk__gt': last_pk}))
+        chunk = chunk.order_by(time_field, 'pk').values_list(time_field, value_field, 'pk')
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row[0], row[1]
+        if len(rows) < chunk_size:
+            break
+        last_time, last_pk = rows[-1][0], rows[-1][2]
+
+
+def read_event_arrays(time_values, chunk_size=EVENTS_CHUNK_SIZE):
+    """Return the events of the given (time, value) pairs as arrays.
+
+    This function returns the pair of arrays (days, values), where days is
+    the array of the ordinal of the date of each event and values is the array
+    of the value of each event. It fills the arrays chunk_size events at a
+    time, so it does not store the events themselves.
+
+    """
+    days_chunks = []
+    values_chunks = []
+    for chunk in iter_chunks(time_values, chunk_size):
+        days_chunks.append(numpy.fromiter((event_time.toordinal()
+                                           for event_time, value in chunk),
+                                          dtype=int, count=len(chunk)))
+        values_chunks.append(numpy.fromiter((value for time, value in chunk),
+                                            dtype=float, count=len(chunk)))
+    if len(days_chunks) == 0:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0)
+    return numpy.concatenate(days_chunks), numpy.concatenate(values_chunks)
 
 
 class IncompleteData(Exception):
@@ -135,14 +272,32 @@ class Timeseries(models.Model):
         not fill in the missing dates with value.
 
         """
-        events = self.timeseries_events.filter().order_by('time')
+        events = self.timeseries_events.all()
         if start_date:
             events = events.filter(time__gte=start_date)
         if end_date:
             events = events.filter(time__lte=end_date)
 
-        for event in events:
-            yield event.time, event.value
+        return iter_time_values(events, 'time', 'value')
+
+    def event_arrays(self, start_date=None, end_date=None):
+        """Return the events as the pair of arrays (days, values).
+
+        See function read_event_arrays for the contents of the arrays.
+
+        """
+        return read_event_arrays(self.raw_events(start_date, end_date))
+
+    def daily_arrays(self, start_date=None, end_date=None):
+        """Return the daily events as the pair of arrays (times, values).
+
+        The arrays contain the same events as method events, see function
+        generate_event_arrays.
+
+        """
+        return generate_event_arrays(self.raw_events(start_date, end_date),
+                                     self.default_value, self.stick_to_last_value,
+                                     start_date, end_date)
 
     def get_last_event(self):
         """return event with latest datetime"""
@@ -180,30 +335,43 @@ class Timeseries(models.Model):
            for method TimeseriesFews.events.
 
         """
-        ts_events = self.timeseries_events.filter().order_by('time')
+        ts_events = self.timeseries_events.all()
         if not start_date is None:
             ts_events = ts_events.filter(time__gte=start_date)
         if not end_date is None:
             ts_events = ts_events.filter(time__lte=end_date)
 
-        events = ((event.time, event.value) for event in ts_events)
+        events = iter_time_values(ts_events, 'time', 'value')
         for date, value in generate_events(events, self.default_value,
                                            self.stick_to_last_value,
                                            start_date, end_date):
             yield date, value
 
-    @transaction.commit_manually
-    def save_timeserie_stub(self,timeserie_stub):
+    def save_timeserie_stub(self, timeserie_stub, replace=False):
         """Save a timeserie_stub into the database
 
-        We need some performance boost on this function
-        #first clear?
+        This method saves the events in bulk, see save_events.
+
         """
-        for date, value in timeserie_stub.raw_events():
-            ts = TimeseriesEvent(time=date, value=value, timeseries=self)
-            ts.save()
+        return self.save_events(timeserie_stub.raw_events(), replace=replace)
+
+    @transaction.commit_on_success
+    def save_events(self, events, replace=False):
+        """Save the given events into the database and return their number.
+
+        The events are (date time, value) pairs. They are inserted in bulk,
+        see insert_events, instead of one query per event.
 
-        transaction.commit()
+        If replace holds, this method first deletes the stored events from the
+        date time of the first given event up to and including the date time
+        of the last one. It deletes and inserts the events in one transaction.
+
+        """
+        events = sorted(events)
+        if replace and events:
+            self.timeseries_events.filter(time__gte=events[0][0],
+                                          time__lte=events[-1][0]).delete()
+        return insert_events(self.pk, events)
 
     def times_values(self, start_date, end_date):
         """
@@ -247,6 +415,178 @@ class TimeseriesEvent(models.Model):
         return u'Event %s: (%s, %s)' % (self.timeseries, self.time, self.value)
 
 
+def iter_chunks(iterable, size):
+    """Return a generator of the lists of the next size items of the iterable.
+
+    The last list can contain less than size items.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def insert_events(timeseries_id, events, chunk_size=INSERT_EVENTS_CHUNK_SIZE):
+    """Insert the given events of the Timeseries with the given id.
+
+    The events are (date time, value) pairs. This function does not create a
+    TimeseriesEvent for each event but sends them to the database in chunks of
+    chunk_size events: on PostgreSQL it uses COPY and on other databases a
+    single executemany per chunk. It returns the number of inserted events.
+
+    This function does not commit the current transaction, so the caller
+    can delete and insert events in the same transaction.
+
+    """
+    meta = TimeseriesEvent._meta
+    columns = [meta.get_field(name).column for name in ['time', 'value', 'timeseries']]
+    cursor = connection.cursor()
+    # the psycopg2 cursor can be wrapped by Django, for example in DEBUG mode
+    raw_cursor = getattr(cursor, 'cursor', cursor)
+    use_copy = hasattr(raw_cursor, 'copy_from')
+    if not use_copy:
+        quote_name = connection.ops.quote_name
+        sql = 'INSERT INTO %s (%s) VALUES (%%s, %%s, %%s)' % \
+              (quote_name(meta.db_table), ', '.join(quote_name(c) for c in columns))
+    count = 0
+    for chunk in iter_chunks(events, chunk_size):
+        if use_copy:
+            rows = ''.join('%s\t%r\t%d\n' % (time, float(value), timeseries_id)
+                           for time, value in chunk)
+            raw_cursor.copy_from(StringIO(rows), meta.db_table, columns=columns)
+        else:
+            to_db = connection.ops.value_to_db_datetime
+            cursor.executemany(sql, [(to_db(time), value, timeseries_id)
+                                     for time, value in chunk])
+        count += len(chunk)
+    transaction.set_dirty()
+    return count
+
+
+def resolve_fews_timeseries(keys):
+    """Return the Fews time series of the given keys using a single query.
+
+    Each key is a triple (pkey, fkey, lkey) as stored by a TimeseriesFews.
+    This function returns the dictionary of key to the Fews Timeserie with
+    that parameter, filter and location. When such time series exist for
+    multiple timesteps in FEWS_TIMESTEPS, it returns the one with the first
+    timestep. A key for which no time series exists is not in the dictionary.
+
+    """
+    keys = set(keys)
+    if len(keys) == 0:
+        return {}
+    fews_timeseries = FewsTimeserie.objects.filter(
+        timestep__in=FEWS_TIMESTEPS,
+        parameterkey__pkey__in=set(key[0] for key in keys),
+        filterkey__id__in=set(key[1] for key in keys),
+        locationkey__lkey__in=set(key[2] for key in keys)).select_related(
+        'parameterkey', 'filterkey', 'locationkey')
+
+    key2timeseries = {}
+    key2rank = {}
+    for timeseries in fews_timeseries:
+        key = (timeseries.parameterkey.pkey, timeseries.filterkey.id,
+               timeseries.locationkey.lkey)
+        # the query can also return the time series of other combinations of
+        # the requested parameters, filters and locations
+        if key not in keys:
+            continue
+        rank = FEWS_TIMESTEPS.index(timeseries.timestep)
+        if rank < key2rank.get(key, len(FEWS_TIMESTEPS)):
+            key2timeseries[key] = timeseries
+            key2rank[key] = rank
+    return key2timeseries
+
+
+class FewsHandleCache(object):
+    """Caches the Fews time series that TimeseriesFews(s) refer to.
+
+    The cache maps the key (pkey, fkey, lkey) of a TimeseriesFews to the Fews
+    Timeserie it refers to, so the events of a TimeseriesFews can be retrieved
+    without resolving that Fews Timeserie again. A resolved time series
+    expires after ttl seconds, after which it is resolved again, and
+    method invalidate removes time series before they expire. Keys for which
+    no time series exists are not cached.
+
+    All access to the cache is guarded by a lock, so multiple threads can use
+    the same cache.
+
+    """
+    def __init__(self, ttl=FEWS_HANDLE_TTL, resolve=resolve_fews_timeseries,
+                 clock=time.time):
+        self.ttl = ttl
+        self.resolve = resolve
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the Fews time series of the given key.
+
+        If no such time series exists, this method returns None.
+
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Return the dictionary of the given keys to their Fews time series.
+
+        This method resolves the keys that are not cached using a single call
+        to resolve. A key for which no time series exists is not in the
+        dictionary.
+
+        """
+        now = self.clock()
+        key2timeseries = {}
+        missing_keys = []
+        with self._lock:
+            for key in set(keys):
+                entry = self._entries.get(key)
+                if entry is not None and now < entry[1]:
+                    key2timeseries[key] = entry[0]
+                else:
+                    missing_keys.append(key)
+        if missing_keys:
+            resolved = self.resolve(missing_keys)
+            with self._lock:
+                for key, timeseries in resolved.iteritems():
+                    self._entries[key] = (timeseries, now + self.ttl)
+            key2timeseries.update(resolved)
+        return key2timeseries
+
+    def invalidate(self, key=None):
+        """Remove the given key from the cache, or all keys if it is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# the FewsHandleCache shared by all TimeseriesFews(s) of the current process
+fews_handle_cache = FewsHandleCache()
+
+
+def prefetch_fews_timeseries(waterbalance_timeseries):
+    """Resolve the Fews time series of the given WaterbalanceTimeserie(s).
+
+    This function resolves the Fews time series that are not in the
+    fews_handle_cache using a single query, so the later retrieval of their
+    events does not have to resolve them one at a time. The given list can
+    contain None and WaterbalanceTimeserie(s) that do not use Fews.
+
+    """
+    keys = [wb_timeserie.fews_timeseries.handle_key()
+            for wb_timeserie in waterbalance_timeseries
+            if wb_timeserie is not None and wb_timeserie.use_fews and
+            wb_timeserie.fews_timeseries is not None]
+    fews_handle_cache.get_many(keys)
+
+
 class TimeseriesFews(models.Model):
     """Specifies a time series in a Fews unblobbed database.
 
@@ -310,34 +650,23 @@ class TimeseriesFews(models.Model):
         except:
             return None
 
+    def handle_key(self):
+        """Return the key of the Fews time series in the fews_handle_cache."""
+        return (self.pkey, self.fkey, self.lkey)
+
     def _get_fews_timeserie_object(self):
-        """
+        """Return the Fews time series the current TimeseriesFews refers to.
 
-        """
-        fews_parameter = FewsParameter.objects.get(pkey=self.pkey)
-        fews_filter = FewsFilter.objects.get(id=self.fkey)
-        fews_location = FewsLocation.objects.get(lkey=self.lkey)
+        The Fews time series is retrieved from the fews_handle_cache. If no
+        such time series exists, this method raises an IncompleteData
+        exception.
 
-        # the timestep is hardcoded for Waternet: "dag GMT+1" or "dag GMT-8"
-        timestep = "dag GMT+1"
-        try:
-            fews_timeseries = FewsTimeserie.objects.get(
-                timestep=timestep,
-                parameterkey=fews_parameter,
-                                                    filterkey=fews_filter,
-                                                    locationkey=fews_location)
-        except FewsTimeserie.DoesNotExist:
-            timestep = "dag GMT-8"
-            try:
-                fews_timeseries = FewsTimeserie.objects.get(
-                    timestep=timestep,
-                    parameterkey=fews_parameter,
-                    filterkey=fews_filter,
-                    locationkey=fews_location)
-            except FewsTimeserie.DoesNotExist:
-                exception_msg = "No Fews time series exists with parameter key %d, filter key %d, location %d and timestep \"%s\"" % (self.pkey, self.fkey, self.lkey, timestep)
-                logger.warning(exception_msg)
-                raise IncompleteData(exception_msg)
+        """
+        fews_timeseries = fews_handle_cache.get(self.handle_key())
+        if fews_timeseries is None:
+            exception_msg = "No Fews time series exists with parameter key %s, filter key %s, location %s and timestep in %s" % (self.pkey, self.fkey, self.lkey, FEWS_TIMESTEPS)
+            logger.warning(exception_msg)
+            raise IncompleteData(exception_msg)
 
         return fews_timeseries
 
@@ -350,14 +679,32 @@ class TimeseriesFews(models.Model):
         """
         fews_timeseries = self._get_fews_timeserie_object()
 
-        ts_events = fews_timeseries.timeseriedata.filter().order_by('tsd_time')
+        ts_events = fews_timeseries.timeseriedata.all()
         if not start_date is None:
             ts_events = ts_events.filter(tsd_time__gte=start_date)
         if not end_date is None:
             ts_events = ts_events.filter(tsd_time__lte=end_date)
 
-        for event in ts_events:
-            yield event.tsd_time, event.tsd_value
+        return iter_time_values(ts_events, 'tsd_time', 'tsd_value')
+
+    def event_arrays(self, start_date=None, end_date=None):
+        """Return the events as the pair of arrays (days, values).
+
+        See function read_event_arrays for the contents of the arrays.
+
+        """
+        return read_event_arrays(self.raw_events(start_date, end_date))
+
+    def daily_arrays(self, start_date=None, end_date=None):
+        """Return the daily events as the pair of arrays (times, values).
+
+        The arrays contain the same events as method events, see function
+        generate_event_arrays.
+
+        """
+        return generate_event_arrays(self.raw_events(start_date, end_date),
+                                     self.default_value, self.stick_to_last_value,
+                                     start_date, end_date)
 
     def events(self, start_date=None, end_date=None):
         """Return a generator to iterate over all daily events.
@@ -370,13 +717,13 @@ class TimeseriesFews(models.Model):
         """
         fews_timeseries = self._get_fews_timeserie_object()
 
-        ts_events = fews_timeseries.timeseriedata.filter().order_by('tsd_time')
+        ts_events = fews_timeseries.timeseriedata.all()
         if not start_date is None:
             ts_events = ts_events.filter(tsd_time__gte=start_date)
         if not end_date is None:
             ts_events = ts_events.filter(tsd_time__lte=end_date)
 
-        events = ((event.tsd_time, event.tsd_value) for event in ts_events)
+        events = iter_time_values(ts_events, 'tsd_time', 'tsd_value')
         for date, value in generate_events(events, self.default_value,
                                            self.stick_to_last_value,
                                            start_date, end_date):
@@ -612,16 +959,8 @@ class WaterbalanceTimeserie(models.Model):
         ts_name = '%s (%s)' % (name, configuration)
         local_timeseries = Timeseries(name=ts_name[:64])
         local_timeseries.save()
-        counter = 0
-        counter_report = 1000
-        for key, value in timeseries.items():
-            local_timeseries.timeseries_events.create(
-                time=key,
-                value=value)
-            counter += 1
-            if counter % counter_report == 0:
-                logger.debug('record %d' % counter)
-                counter_report = min(counter * 2, 10000)
+        counter = insert_events(local_timeseries.pk, sorted(timeseries.items()))
+        logger.debug('record %d' % counter)
         wb_ts = WaterbalanceTimeserie(
             name=name,
             parameter=parameter,
@@ -1376,10 +1715,17 @@ class WaterbalanceConf(models.Model):
                 {'area_slug': str(self.waterbalance_area.slug),
                  'scenario_slug': str(self.waterbalance_scenario.slug)})
 
-    def get_calc_period(self, input_end_date_time=datetime.datetime.now()):
+    def get_calc_period(self, input_end_date_time=None):
         """Return the start and end date (and time) for the calculation horizon.
 
+        When the end date cannot be derived from the configuration, the given
+        end date is used. When that date is not given, the start of today is
+        used.
+
         """
+        if input_end_date_time is None:
+            today = datetime.date.today()
+            input_end_date_time = datetime.datetime(today.year, today.month, today.day)
         start_date = self.calculation_start_date
         if self.calculation_end_date:
             end_date = self.calculation_end_date
@@ -28,8 +28,14 @@
 from datetime import datetime
 from unittest import TestCase
 
+from lizard_waterbalance.models import FewsHandleCache
 from lizard_waterbalance.models import Timeseries
 from lizard_waterbalance.models import TimeseriesEvent
+from lizard_waterbalance.models import generate_event_arrays
+from lizard_waterbalance.models import insert_events
+from lizard_waterbalance.models import iter_time_values
+from lizard_waterbalance.models import read_event_arrays
+from timeseries.timeseriesstub import TimeseriesStub
 
 
 class TimeseriesTests(TestCase):
@@ -122,3 +128,129 @@ class TimeseriesTests(TestCase):
                            (datetime(2011, 4, 9), 10.0)]
         self.assertEqual(expected_events, list(events))
 
+
+    def test_f(self):
+        """Test save_timeserie_stub saves all events in bulk."""
+        timeseries = Timeseries()
+        timeseries.save()
+        stub = TimeseriesStub()
+        for day in range(1, 8):
+            stub.add_value(datetime(2011, 4, day), float(day))
+        self.assertEqual(7, timeseries.save_timeserie_stub(stub))
+        self.assertEqual(list(stub.events()), list(timeseries.raw_events()))
+
+    def test_g(self):
+        """Test save_events only replaces the events in the range of the new events."""
+        timeseries = self.setup_timeseries()
+        new_events = [(datetime(2011, 4, 6), 20.0),
+                      (datetime(2011, 4, 7), 30.0)]
+        timeseries.save_events(new_events, replace=True)
+        expected_events = [(datetime(2011, 4, 5), 10.0),
+                           (datetime(2011, 4, 6), 20.0),
+                           (datetime(2011, 4, 7), 30.0),
+                           (datetime(2011, 4, 8), 10.0),
+                           (datetime(2011, 4, 9), 10.0)]
+        self.assertEqual(expected_events, list(timeseries.raw_events()))
+
+    def test_h(self):
+        """Test insert_events sends the events in chunks."""
+        timeseries = Timeseries()
+        timeseries.save()
+        events = [(datetime(2011, 4, day), 1.0) for day in range(1, 11)]
+        self.assertEqual(10, insert_events(timeseries.pk, events, chunk_size=3))
+        self.assertEqual(events, list(timeseries.raw_events()))
+
+    def test_i(self):
+        """Test iter_time_values retrieves all events in chunks."""
+        timeseries = self.setup_timeseries()
+        events = iter_time_values(timeseries.timeseries_events.all(), 'time',
+                                  'value', chunk_size=2)
+        self.assertEqual(list(timeseries.raw_events()), list(events))
+
+    def test_j(self):
+        """Test iter_time_values retrieves events with the same time once, in order of their key."""
+        timeseries = Timeseries()
+        timeseries.save()
+        events = [(datetime(2011, 4, 5), float(index)) for index in range(5)] + \
+                 [(datetime(2011, 4, 6), 5.0)]
+        insert_events(timeseries.pk, events)
+        time_values = iter_time_values(timeseries.timeseries_events.all(),
+                                       'time', 'value', chunk_size=2)
+        self.assertEqual(events, list(time_values))
+
+    def test_k(self):
+        """Test read_event_arrays returns the ordinal days and values."""
+        events = [(datetime(2011, 4, day), float(day)) for day in range(1, 6)]
+        days, values = read_event_arrays(events, chunk_size=2)
+        self.assertEqual([datetime(2011, 4, day).toordinal() for day in range(1, 6)],
+                         days.tolist())
+        self.assertEqual([1.0, 2.0, 3.0, 4.0, 5.0], values.tolist())
+
+
+class generate_event_arrays_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test the days between two events have the default value."""
+        events = [(datetime(2011, 4, 1), 1.0), (datetime(2011, 4, 4), 2.0)]
+        times, values = generate_event_arrays(events, 5.0, False, None, None)
+        self.assertEqual([datetime(2011, 4, day) for day in range(1, 5)],
+                         times.astype(object).tolist())
+        self.assertEqual([1.0, 5.0, 5.0, 2.0], values.tolist())
+
+    def test_b(self):
+        """Test a sticky expansion fills in the default and the last value."""
+        events = [(datetime(2011, 4, 3), 1.0), (datetime(2011, 4, 5), 2.0)]
+        times, values = generate_event_arrays(events, 5.0, True,
+                                              datetime(2011, 4, 1),
+                                              datetime(2011, 4, 7))
+        self.assertEqual([datetime(2011, 4, day) for day in range(1, 8)],
+                         times.astype(object).tolist())
+        self.assertEqual([5.0, 5.0, 1.0, 1.0, 2.0, 2.0, 2.0], values.tolist())
+
+    def test_c(self):
+        """Test a sticky expansion without events returns the default value."""
+        times, values = generate_event_arrays([], 5.0, True,
+                                              datetime(2011, 4, 1),
+                                              datetime(2011, 4, 3))
+        self.assertEqual(3, len(times))
+        self.assertEqual([5.0, 5.0, 5.0], values.tolist())
+
+
+class FewsHandleCacheTests(TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.resolved_keys = []
+        self.cache = FewsHandleCache(ttl=60, resolve=self.resolve,
+                                     clock=lambda: self.now)
+
+    def resolve(self, keys):
+        self.resolved_keys.append(sorted(keys))
+        return dict((key, 'timeseries %d' % key[0]) for key in keys if key[0] > 0)
+
+    def test_a(self):
+        """Test the cache resolves all missing keys in a single call."""
+        key2timeseries = self.cache.get_many([(1, 2, 3), (4, 5, 6), (0, 0, 0)])
+        self.assertEqual({(1, 2, 3): 'timeseries 1', (4, 5, 6): 'timeseries 4'},
+                         key2timeseries)
+        self.assertEqual('timeseries 1', self.cache.get((1, 2, 3)))
+        self.assertEqual([[(0, 0, 0), (1, 2, 3), (4, 5, 6)]], self.resolved_keys)
+
+    def test_b(self):
+        """Test the cache resolves a key again when it has expired."""
+        self.cache.get((1, 2, 3))
+        self.now = 59.0
+        self.cache.get((1, 2, 3))
+        self.now = 60.0
+        self.cache.get((1, 2, 3))
+        self.assertEqual([[(1, 2, 3)], [(1, 2, 3)]], self.resolved_keys)
+
+    def test_c(self):
+        """Test the cache resolves a key again when it has been invalidated."""
+        self.cache.get_many([(1, 2, 3), (4, 5, 6)])
+        self.cache.invalidate((1, 2, 3))
+        self.cache.get_many([(1, 2, 3), (4, 5, 6)])
+        self.cache.invalidate()
+        self.cache.get((4, 5, 6))
+        self.assertEqual([[(1, 2, 3), (4, 5, 6)], [(1, 2, 3)], [(4, 5, 6)]],
+                         self.resolved_keys)
@@ -98,6 +98,11 @@ urlpatterns = patterns(
      'lizard_waterbalance.views.waterbalance_area_graphs',
      {},
      'waterbalance_area_graph'),
+    (r'^summary/(?P<area_slug>.*)/scenario/(?P<scenario_slug>.*)'
+     '/computation_status/$',
+     'lizard_waterbalance.views.computation_status',
+     {},
+     'waterbalance_computation_status'),
      (r'^summary/(?P<area_slug>.*)/scenario/(?P<scenario_slug>.*)'
      '/export_excel_small/$',
      'lizard_waterbalance.export.export_excel_small',
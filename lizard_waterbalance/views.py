@@ -7,9 +7,11 @@ from datetime import time as datetime_time
 from datetime import timedelta
 import logging
 from time import gmtime
+from time import sleep
 from time import strftime
 from time import time
 
+from django.conf import settings as django_settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
 from django.core.cache import cache
@@ -24,6 +26,7 @@ from django.utils import simplejson
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.lines import Line2D
 import mapnik
+import numpy
 
 from dbmodel.models import Area
 from dbmodel.models import PumpingStation
@@ -32,10 +35,23 @@ from lizard_map import coordinates
 from lizard_map.adapter import Graph
 from lizard_map.daterange import current_start_end_dates
 from lizard_map.models import Workspace
+from lizard_wbcomputation.cache_codec import decode
+from lizard_wbcomputation.cache_codec import encode
+from lizard_wbcomputation.cache_codec import split_chunks
 from lizard_wbcomputation.compute import WaterbalanceComputer2
+from lizard_wbcomputation.daily_timeseries import find_daily_timeseries
+from lizard_wbcomputation.daily_timeseries import load_daily_timeseries
+from lizard_wbcomputation.job_queue import DONE
+from lizard_wbcomputation.job_queue import FAILED
+from lizard_wbcomputation.job_queue import JobQueue
+from lizard_wbcomputation.job_queue import QUEUED
+from lizard_wbcomputation.job_queue import RUNNING
+from lizard_wbcomputation.result_store import ResultStore
 from lizard_waterbalance.forms import WaterbalanceConfEditForm
 from lizard_waterbalance.forms import OpenWaterEditForm
 from lizard_waterbalance.forms import PumpingStationEditForm
+from lizard_waterbalance.fingerprint import forget_fingerprint
+from lizard_waterbalance.fingerprint import get_fingerprint
 from lizard_waterbalance.forms import create_location_label
 from lizard_waterbalance.models import WaterbalanceArea
 from lizard_waterbalance.models import WaterbalanceConf
@@ -561,6 +577,37 @@ def get_cumulative_timeseries(timeseries, start, end,
     return result
 
 
+def get_daily_average_timeseries(timeseries, start, end):
+    """Return the daily averages of the given timeseries in the given range.
+
+    This function computes the same averages as get_average_timeseries for
+    period 'day', but from the arrays that method daily_arrays of the given
+    time series returns. Missing values are skipped.
+
+    A time series without such a method, for example a computed
+    SparseTimeseriesStub, is first loaded into a DailyTimeseries, which
+    provides that method.
+
+    """
+    if not hasattr(timeseries, 'daily_arrays'):
+        daily_timeseries = find_daily_timeseries(timeseries)
+        if daily_timeseries is None:
+            daily_timeseries = load_daily_timeseries(timeseries, start, end)
+        timeseries = daily_timeseries
+    times, values = timeseries.daily_arrays(start, end)
+    present = ~numpy.isnan(values)
+    times, values = times[present], values[present]
+    first = numpy.searchsorted(times, numpy.datetime64(start, 'us'))
+    last = numpy.searchsorted(times, numpy.datetime64(end, 'us'))
+    days = times[first:last].astype('datetime64[D]')
+    if len(days) == 0:
+        return [], []
+    unique_days, day_indices = numpy.unique(days, return_inverse=True)
+    averages = numpy.bincount(day_indices, weights=values[first:last]) / \
+               numpy.bincount(day_indices)
+    return unique_days.astype('datetime64[us]').astype(object).tolist(), averages.tolist()
+
+
 def get_average_timeseries(timeseries, start, end, period='month'):
     """Return the events for the given timeseries in the given range.
 
@@ -570,7 +617,12 @@ def get_average_timeseries(timeseries, start, end, period='month'):
     * end -- the latest date (and/or time) of a returned event
     * period -- 'year', 'month' or 'day'
 
+    The daily averages are computed from arrays, see
+    get_daily_average_timeseries.
+
     """
+    if period == 'day':
+        return get_daily_average_timeseries(timeseries, start, end)
     result = zip(*(e for e in grouped_event_values(timeseries,
                                                    period,
                                                    average=True)
@@ -620,6 +672,124 @@ def retrieve_horizon(request):
                                      59)
     return start_datetime, end_datetime
 
+# number of seconds the results of a configuration are kept in the cache: as
+# the key names of these results change when the inputs change, the results
+# can be kept as long as memcached allows
+CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+# number of seconds after which the lock on the computation of data expires,
+# in case the process that holds it dies before it can release it
+LOCK_TIMEOUT = 10 * 60
+
+# number of seconds a process waits for the data another process computes,
+# before it computes that data itself
+LOCK_WAIT_SECONDS = 60
+
+# number of seconds between the checks whether the data has been computed
+LOCK_POLL_INTERVAL = 0.5
+
+
+def get_result_store():
+    """Return the ResultStore of the computed results, or None.
+
+    The directory of the ResultStore is specified by setting
+    LIZARD_WATERBALANCE_RESULT_STORE. When that setting is not present, the
+    computed results are only stored in the Django cache.
+
+    """
+    directory = getattr(django_settings, 'LIZARD_WATERBALANCE_RESULT_STORE', None)
+    if directory is None:
+        return None
+    return ResultStore(directory)
+
+
+# status of the computation of a configuration when no JobQueue is
+# configured, see get_computation_status
+UNAVAILABLE = 'unavailable'
+
+# number of seconds after which a client should ask again for a graph whose
+# data is still being computed
+RETRY_AFTER_SECONDS = 5
+
+
+def get_job_queue():
+    """Return the JobQueue of the computations, or None.
+
+    The SQLite database of the JobQueue is specified by setting
+    LIZARD_WATERBALANCE_JOB_QUEUE. When that setting is not present, the
+    views compute the data they need themselves.
+
+    """
+    file_name = getattr(django_settings, 'LIZARD_WATERBALANCE_JOB_QUEUE', None)
+    if file_name is None:
+        return None
+    return JobQueue(file_name)
+
+
+def get_computation_status(configuration, waterbalance_computer, job_queue):
+    """Return the status of the computation of the data of the configuration.
+
+    This function returns DONE when the data is present and otherwise the
+    status of the job in the given JobQueue, or None when no such job
+    exists. When the JobQueue is None, it returns UNAVAILABLE. In contrast
+    to request_computation, this function does not compute the data or
+    submit a job.
+
+    """
+    if job_queue is None:
+        return UNAVAILABLE
+    calc_start_datetime, calc_end_datetime = configuration.get_calc_period()
+    if waterbalance_computer.get_cached_data("sluice_error",
+                                             calc_start_datetime,
+                                             calc_end_datetime) is not None:
+        return DONE
+    return job_queue.get_status(waterbalance_computer.cache_key_name.fingerprint)
+
+
+def request_computation(configuration, waterbalance_computer, job_queue, wait=0):
+    """Make sure the data of the given configuration is computed.
+
+    When the given JobQueue is None, this function computes the data that is
+    not in the cache and returns DONE. Otherwise it submits a job to compute
+    that data to the JobQueue, unless that data is already present, and
+    waits at most the given number of seconds for the job to finish. In
+    that case it returns the status of the job.
+
+    As the jobs are identified by the fingerprint of the configuration, at
+    most one job per configuration runs at a time, no matter how many
+    requests need its data. The jobs are processed by the management command
+    process_waterbalance_jobs.
+
+    A job that failed is not submitted again, as it would most likely fail
+    again for each request. It is submitted again when the inputs of the
+    configuration, and so its fingerprint, change, or when the failed job
+    has been removed from the JobQueue, see JobQueue.remove_finished.
+
+    """
+    calc_start_datetime, calc_end_datetime = configuration.get_calc_period()
+    if job_queue is None:
+        if waterbalance_computer.get_cached_data("sluice_error",
+                                                 calc_start_datetime,
+                                                 calc_end_datetime) is None:
+            waterbalance_computer.compute(calc_start_datetime,
+                                          calc_end_datetime)
+        return DONE
+
+    key = waterbalance_computer.cache_key_name.fingerprint
+    status = job_queue.get_status(key)
+    if status in (None, FAILED) and \
+       waterbalance_computer.get_cached_data("sluice_error",
+                                             calc_start_datetime,
+                                             calc_end_datetime) is not None:
+        return DONE
+    if status == FAILED:
+        return status
+    if status != DONE:
+        job_queue.submit(key, configuration.pk)
+        status = job_queue.wait(key, wait)
+    return status
+
+
 class CacheKeyName(object):
     """Implements the creation of key names for data in the cache.
 
@@ -631,26 +801,46 @@ class CacheKeyName(object):
     Instance variables:
       * configuration_slug *
         the string that will be appended to each cache key name
+      * fingerprint *
+        the fingerprint of the inputs of the configuration
 
     The configuration slug is used to create cache key names that differ for
-    different configurations.
+    different configurations. The fingerprint is used to create cache key
+    names that differ when the inputs of a configuration change, see
+    lizard_waterbalance.fingerprint.compute_fingerprint. In that way, the
+    results of a configuration remain valid in the cache until its inputs
+    change.
 
     """
 
-    def __init__(self, configuration):
-        """Set the configuration_slug instance variable.
+    def __init__(self, configuration, fingerprint=None):
+        """Set the configuration_slug and fingerprint instance variables.
 
         The configuration_slug is created from the return value of a call to
-        the __unicode__ method of the configuration.
+        the __unicode__ method of the configuration. When no fingerprint is
+        given, it is retrieved from the cache or computed from the
+        configuration, see lizard_waterbalance.fingerprint.get_fingerprint.
 
         """
         self.configuration_slug = slugify(configuration.__unicode__())
+        if fingerprint is None:
+            fingerprint = get_fingerprint(configuration)
+        self.fingerprint = fingerprint
 
     def get(self, name):
         """Return a key name for one configuration based on the given name.
 
         """
-        return name + "::" + self.configuration_slug
+        return name + "::" + self.configuration_slug + "::" + self.fingerprint
+
+    def get_latest(self, name):
+        """Return the key name of the latest key name of the given name.
+
+        The returned key name does not depend on the fingerprint, so it can
+        refer to the data of a previous fingerprint of the configuration.
+
+        """
+        return name + "::" + self.configuration_slug + "::latest"
 
 class CachedWaterbalanceComputer(WaterbalanceComputer2):
     """Wraps subclasses given WaterbalanceComputer and caches its results.
@@ -667,199 +857,281 @@ class CachedWaterbalanceComputer(WaterbalanceComputer2):
     default, memcached can only store objects that are up to 1 MB in size. For
     our test case this meant that the results of the call to
     WaterbalanceComputer.get_fraction_timeseries did not fit in the
-    cache. Therefore, the reimplementation of this method stores the results in
-    two separate objects.
+    cache. Therefore, the results are stored in a compact encoding, see
+    lizard_wbcomputation.cache_codec, which is split into chunks that each fit
+    in the cache.
 
     Note that if specific data cannot be stored in the cache, the view still
     functions but it will take longer to display the graphs. The data not in
     the cache will have to be recalculated each time it is requested.
 
+    As the Django cache does not survive a restart of memcached, the results
+    are also stored in a ResultStore on disk, when one is configured. The
+    data that is missing from the cache is read from that store before it is
+    recalculated. The nightly computation fills the store, see method
+    compute_all, so the views can read their data from disk instead of
+    recalculating it.
+
+    When multiple requests for the same configuration miss the same data,
+    only one of them computes it, see method get_or_compute. The others
+    return the data of the previous inputs of the configuration, when it is
+    still in the cache, or wait for the data to be computed.
+
     Instance variables:
       *cache_key_name*
         a CacheKeyName to create the key names for data in the cache
+      *result_store*
+        ResultStore of the results on disk, or None
 
     """
     def __init__(self, *args, **kwargs):
         """Set the CacheKeyName to create the key names for data in the cache.
 
         The first non-keyword argument should be the CacheKeyName to set.
+        Keyword argument result_store specifies the ResultStore to use,
+        which is the one returned by get_result_store by default.
 
         """
         assert len(args) > 1
         self.cache_key_name = args[0]
+        if 'result_store' in kwargs:
+            self.result_store = kwargs.pop('result_store')
+        else:
+            self.result_store = get_result_store()
 
         super(CachedWaterbalanceComputer, self).__init__(*args[1:], **kwargs)
 
-    def get_cached_data(self, name):
+    def get_cached_data(self, name, start_date=None, end_date=None):
         """Return the data from the cache using a key based on the given name.
 
         This method uses self.cache_key_name to retrieve the right key name for
-        the current configuration.
+        the current configuration. When the data is not in the cache, this
+        method reads the data for the given period from the ResultStore and
+        stores it in the cache.
 
         """
         key_name = self.cache_key_name.get(name)
-        return cache.get(key_name)
-
-    def set_cached_data(self, name, data):
+        data = self.get_cache(key_name)
+        if data is not None or self.result_store is None:
+            return data
+        data = self.result_store.load(self.cache_key_name.fingerprint, name,
+                                      start_date, end_date)
+        if data is not None:
+            self.set_cache(key_name, data)
+        return data
+
+    def set_cached_data(self, name, data, start_date=None, end_date=None):
         """Store the data in the cache using a key based on the given name.
 
         This method uses self.cache_key_name to retrieve the right key for
-        the current configuration.
+        the current configuration. It also stores the data for the given
+        period in the ResultStore.
 
         """
         key_name = self.cache_key_name.get(name)
-        cache.set(key_name, data, 24 * 60 * 60)
+        self.set_cache(key_name, data)
+        cache.set(self.cache_key_name.get_latest(name), key_name, CACHE_TIMEOUT)
+        if self.result_store is not None:
+            self.result_store.store(self.cache_key_name.fingerprint, name, data,
+                                    start_date, end_date)
 
-    def calc_sluice_error_timeseries(self, start_date, end_date):
+    def get_stale_data(self, name):
+        """Return the data of the given name for the previous inputs, or None.
 
-        sluice_error = self.get_cached_data("sluice_error")
-        if sluice_error is None:
+        This method returns the data that was stored last for the given name
+        of the current configuration, when that data was stored for a
+        different fingerprint.
 
-            parent = super(CachedWaterbalanceComputer, self)
-            sluice_error = \
-                parent.calc_sluice_error_timeseries(start_date,
-                                                    end_date)
+        """
+        key_name = cache.get(self.cache_key_name.get_latest(name))
+        if not isinstance(key_name, basestring) or \
+           key_name == self.cache_key_name.get(name):
+            return None
+        return self.get_cache(key_name)
+
+    def get_cache(self, key_name):
+        """Return the data from the cache using the given key name, or None."""
+        chunk_count = cache.get(key_name)
+        if type(chunk_count) is not int:
+            return None
+        chunk_names = ["%s::%d" % (key_name, index) for index in range(chunk_count)]
+        chunks = cache.get_many(chunk_names)
+        if len(chunks) < chunk_count:
+            return None
+        return decode(''.join(chunks[chunk_name] for chunk_name in chunk_names))
+
+    def set_cache(self, key_name, data):
+        """Store the data in the cache using the given key name."""
+        chunks = split_chunks(encode(data))
+        values = dict(("%s::%d" % (key_name, index), chunk)
+                      for index, chunk in enumerate(chunks))
+        # the key name itself stores the number of chunks
+        values[key_name] = len(chunks)
+        cache.set_many(values, CACHE_TIMEOUT)
+
+    def compute_all(self, start_date, end_date):
+        """Compute and store all the results the views use.
+
+        This method computes the results of each reimplemented method for the
+        given period, unless these results are already stored.
 
-            self.set_cached_data("sluice_error", sluice_error)
+        """
+        self.compute(start_date, end_date)
+        self.get_open_water_incoming_flows(start_date, end_date)
+        self.get_open_water_outgoing_flows(start_date, end_date)
+        self.get_level_control_timeseries(start_date, end_date)
+        self.get_level_control_pumping_stations()
+        self.get_reference_timeseries(start_date, end_date)
+        self.get_waterlevel_with_sluice_error(start_date, end_date)
+        self.get_fraction_timeseries(start_date, end_date)
+        self.get_concentration_timeseries(start_date, end_date)
+        self.get_impact_timeseries(start_date, end_date)
+
+    def get_all_data(self, get_data, names, *args):
+        """Return the data of the given names using the given function.
+
+        This method returns the data of a single name as is and the data of
+        multiple names as a tuple. It returns None when the data of any name
+        is missing.
 
-        return sluice_error
+        """
+        data = [get_data(name, *args) for name in names]
+        if None in data:
+            return None
+        if len(data) == 1:
+            return data[0]
+        return tuple(data)
 
-    def get_open_water_incoming_flows(self,
-                                      start_date,
-                                      end_date):
+    def wait_for_data(self, names, lock_name, start_date, end_date):
+        """Wait for the data of the given names that another process computes.
 
-        incoming = self.get_cached_data("incoming")
-        if incoming is None:
+        This method returns the data as soon as it is present. It returns
+        None when the other process releases the lock without storing the
+        data or when the data is not present after LOCK_WAIT_SECONDS.
 
-            parent = super(CachedWaterbalanceComputer, self)
-            incoming = parent.get_open_water_incoming_flows(start_date,
-                                                            end_date)
-            self.set_cached_data("incoming", incoming)
+        """
+        deadline = time() + LOCK_WAIT_SECONDS
+        while time() < deadline:
+            sleep(LOCK_POLL_INTERVAL)
+            data = self.get_all_data(self.get_cached_data, names, start_date, end_date)
+            if data is not None:
+                return data
+            if cache.get(lock_name) is None:
+                break
+        return None
+
+    def get_or_compute(self, names, compute, start_date=None, end_date=None):
+        """Return the data of the given names, compute it when it is missing.
+
+        The given function computes the data of all the given names, as a
+        tuple when there are multiple names.
+
+        To avoid that multiple processes compute the same data at the same
+        time, a process first adds a lock to the cache. As the cache can only
+        add a key that is not present, only one process gets the lock. The
+        other processes return the data of the previous inputs of the
+        configuration when it is present, see get_stale_data, and wait for
+        the data otherwise. When the data does not appear, for example
+        because the computation failed, they compute the data themselves.
 
-        return incoming
+        """
+        data = self.get_all_data(self.get_cached_data, names, start_date, end_date)
+        if data is not None:
+            return data
+
+        lock_name = self.cache_key_name.get(names[0]) + "::lock"
+        has_lock = cache.add(lock_name, True, LOCK_TIMEOUT)
+        if not has_lock:
+            data = self.get_all_data(self.get_stale_data, names)
+            if data is None:
+                data = self.wait_for_data(names, lock_name, start_date, end_date)
+            if data is not None:
+                return data
+        try:
+            data = compute()
+            if len(names) == 1:
+                values = [data]
+            else:
+                values = data
+            for name, value in zip(names, values):
+                self.set_cached_data(name, value, start_date, end_date)
+        finally:
+            if has_lock:
+                cache.delete(lock_name)
+        return data
 
-    def get_open_water_outgoing_flows(self,
+    def calc_sluice_error_timeseries(self, start_date, end_date):
+
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["sluice_error"],
+            lambda: parent.calc_sluice_error_timeseries(start_date, end_date),
+            start_date, end_date)
+
+    def get_open_water_incoming_flows(self,
                                       start_date,
                                       end_date):
 
-        outgoing = self.get_cached_data("outgoing")
-        if outgoing is None:
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["incoming"],
+            lambda: parent.get_open_water_incoming_flows(start_date, end_date),
+            start_date, end_date)
 
-            parent = super(CachedWaterbalanceComputer, self)
-            outgoing = parent.get_open_water_outgoing_flows(start_date,
-                                                            end_date)
-            self.set_cached_data("outgoing", outgoing)
+    def get_open_water_outgoing_flows(self,
+                                      start_date,
+                                      end_date):
 
-        return outgoing
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["outgoing"],
+            lambda: parent.get_open_water_outgoing_flows(start_date, end_date),
+            start_date, end_date)
 
     def get_level_control_timeseries(self, start_date, end_date):
 
-        outcome = self.get_cached_data("outcome")
-        if outcome is None:
-
-            parent = super(CachedWaterbalanceComputer, self)
-            outcome = parent.get_level_control_timeseries(start_date,
-                                                          end_date)
-            self.set_cached_data("outcome", outcome)
-
-        return outcome
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["outcome"],
+            lambda: parent.get_level_control_timeseries(start_date, end_date),
+            start_date, end_date)
 
     def get_level_control_pumping_stations(self):
 
-        pair = self.get_cached_data("pair")
-        if pair is None:
-
-            parent = super(CachedWaterbalanceComputer, self)
-            pair = parent.get_level_control_pumping_stations()
-            self.set_cached_data("pair", pair)
-
-        return pair
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["pair"],
+            parent.get_level_control_pumping_stations)
 
     def get_reference_timeseries(self, start_date, end_date):
 
-        ref_in = self.get_cached_data("ref_in")
-        ref_out = self.get_cached_data("ref_out")
-        if ref_in is None or ref_out is None:
-
-            parent = super(CachedWaterbalanceComputer, self)
-            ref_in, ref_out = parent.get_reference_timeseries(start_date,
-                                                              end_date)
-            self.set_cached_data("ref_in", ref_in)
-            self.set_cached_data("ref_out", ref_out)
-
-        return ref_in, ref_out
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["ref_in", "ref_out"],
+            lambda: parent.get_reference_timeseries(start_date, end_date),
+            start_date, end_date)
 
     def get_waterlevel_with_sluice_error(self, start_date, end_date):
 
-        waterlevel = self.get_cached_data("waterlevel")
-        sluice_error = self.get_cached_data("sluice_error")
-        if waterlevel is None or sluice_error is None:
-            parent = super(CachedWaterbalanceComputer, self)
-            waterlevel, sluice_error = parent.get_waterlevel_with_sluice_error(
-                start_date, end_date)
-            self.set_cached_data("waterlevel", waterlevel)
-            self.set_cached_data("sluice_error", sluice_error)
-        return waterlevel, sluice_error
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["waterlevel", "sluice_error"],
+            lambda: parent.get_waterlevel_with_sluice_error(start_date, end_date),
+            start_date, end_date)
 
     def get_fraction_timeseries(self, start_date, end_date):
 
-        fractions_1 = self.get_cached_data("fractions_1")
-        fractions_2 = self.get_cached_data("fractions_2")
-        if fractions_1 is None or fractions_2 is None:
-
-            parent = super(CachedWaterbalanceComputer, self)
-            fractions = parent.get_fraction_timeseries(start_date,
-                                                       end_date)
-
-            # When we use memcached as the backend, the default maximum size
-            # for a single object in the cache is 1 MB. It turned out that the
-            # fractions dictionary could easily exceed that limit. For that
-            # reason we partition the fractions in two dictionaries and store
-            # each part separately.
-            fractions_1 = {}
-            fractions_2 = {}
-            key_count = 0
-            for key, values in fractions.iteritems():
-                if key_count < 4:
-                    fractions_1[key] = values
-                else:
-                    fractions_2[key] = values
-                key_count = key_count + 1
-
-            self.set_cached_data("fractions_1", fractions_1)
-            self.set_cached_data("fractions_2", fractions_2)
-
-        fractions = fractions_1
-        for key, values in fractions_2.iteritems():
-            fractions[key] = values
-
-        return fractions
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["fractions"],
+            lambda: parent.get_fraction_timeseries(start_date, end_date),
+            start_date, end_date)
 
     def get_concentration_timeseries(self, start_date, end_date):
 
-        concentrations = self.get_cached_data("concentrations")
-        if concentrations is None:
-
-            parent = super(CachedWaterbalanceComputer, self)
-            concentrations = parent.get_concentration_timeseries(start_date,
-                                                                 end_date)
-            self.set_cached_data("concentrations", concentrations)
-
-        return concentrations
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["concentrations"],
+            lambda: parent.get_concentration_timeseries(start_date, end_date),
+            start_date, end_date)
 
     def get_impact_timeseries(self, start_date, end_date):
 
-        impact = self.get_cached_data("impact")
-        impact_incremental = self.get_cached_data("impact_incremental")
-        if impact is None or impact_incremental is None:
-
-            parent = super(CachedWaterbalanceComputer, self)
-            impact, impact_incremental = parent.get_impact_timeseries(
-                start_date, end_date)
-            self.set_cached_data("impact", impact)
-            self.set_cached_data("impact_incremental", impact_incremental)
-
-        return impact, impact_incremental
+        parent = super(CachedWaterbalanceComputer, self)
+        return self.get_or_compute(["impact", "impact_incremental"],
+            lambda: parent.get_impact_timeseries(start_date, end_date),
+            start_date, end_date)
 
 
 # @profile("waterbalance_area_graph.prof")
@@ -1461,6 +1733,21 @@ def waterbalance_area_graphs(request,
         CachedWaterbalanceComputer(CacheKeyName(configuration), configuration,
                                    area)
 
+    job_queue = get_job_queue()
+    if job_queue is not None:
+        status = request_computation(configuration, waterbalance_computer,
+                                     job_queue)
+        if status == FAILED:
+            message = job_queue.get_message(
+                waterbalance_computer.cache_key_name.fingerprint)
+            return HttpResponse(message or "computation failed", status=500)
+        if status in (QUEUED, RUNNING):
+            # The page polls computation_status before it requests the
+            # graphs, so the web worker does not have to wait for the job.
+            response = HttpResponse("computing", status=202)
+            response['Retry-After'] = str(RETRY_AFTER_SECONDS)
+            return response
+
     period = request.GET.get('period', 'month')
     reset_period = request.GET.get('reset_period', 'year')
     #start_datetime, end_datetime = retrieve_horizon(request)
@@ -1562,10 +1849,12 @@ def graph_select(request):
                    '?period=' + period +
                    '&reset_period=' + reset_period)
             graphs.append(url)
-        json = simplejson.dumps(graphs)
 
-        # If the data has not been cached, we make sure we compute and cache it
-        # now, otherwise all graphs start a computation on their own.
+        # If the data has not been cached, we make sure it is computed and
+        # cached now, otherwise all graphs start a computation on their own.
+        # When a JobQueue is configured, the computation runs in the
+        # background and the page polls the returned status URL until it has
+        # finished, before it requests the graphs.
 
         configuration = WaterbalanceConf.objects.get(
             waterbalance_area__slug=area_slug,
@@ -1576,18 +1865,39 @@ def graph_select(request):
         waterbalance_computer = CachedWaterbalanceComputer(cache_key_name,
                                                            configuration,
                                                            area)
-
-        if waterbalance_computer.get_cached_data("sluice_error") is None:
-            calc_start_datetime, calc_end_datetime = \
-                configuration.get_calc_period()
-            waterbalance_computer.compute(calc_start_datetime,
-                                          calc_end_datetime)
-
+        status = request_computation(configuration, waterbalance_computer,
+                                     get_job_queue())
+        status_url = reverse('waterbalance_computation_status',
+                             kwargs={'area_slug': area_slug,
+                                     'scenario_slug': scenario_slug})
+        json = simplejson.dumps({'graphs': graphs,
+                                 'status': status,
+                                 'status_url': status_url})
         return HttpResponse(json, mimetype='application/json')
     else:
         return HttpResponse("Should not be run this way.")
 
 
+def computation_status(request, area_slug, scenario_slug):
+    """Return the status of the computation of the given configuration.
+
+    The status is returned as JSON, see get_computation_status. A client can
+    poll this view to find out when the graphs of a configuration can be
+    retrieved without waiting. This view does not start a computation.
+
+    """
+    configuration = WaterbalanceConf.objects.get(
+        waterbalance_area__slug=area_slug,
+        waterbalance_scenario__slug=scenario_slug)
+    waterbalance_computer = \
+        CachedWaterbalanceComputer(CacheKeyName(configuration), configuration,
+                                   Area(configuration))
+    status = get_computation_status(configuration, waterbalance_computer,
+                                    get_job_queue())
+    return HttpResponse(simplejson.dumps({'status': status}),
+                        mimetype='application/json')
+
+
 def search_fews_lkeys(request):
     if request.is_ajax():
         pkey = request.POST['pkey']
@@ -1624,10 +1934,11 @@ def recalculate_graph_data(request, area_slug=None, scenario_slug=None):
              waterbalance_area__slug=area_slug,
              waterbalance_scenario__slug=scenario_slug)
 
+        forget_fingerprint(configuration)
         cache_key_name = CacheKeyName(configuration)
         names = [ "sluice_error", "total_outtakes", "incoming", "outgoing",
             "outcome", "pair", "ref_in", "ref_out", "sluice_error_waterlevel",
-            "fractions_1", "fractions_2", "concentrations", "impact",
+            "fractions", "concentrations", "impact",
             "impact_incremental" ]
         key_names = [cache_key_name.get(name) for name in names]
         cache.delete_many(key_names)
@@ -1636,6 +1947,8 @@ def recalculate_graph_data(request, area_slug=None, scenario_slug=None):
                               CachedWaterbalanceComputer(cache_key_name,
                                                          configuration,
                                                          area)
+        if waterbalance_computer.result_store is not None:
+            waterbalance_computer.result_store.remove(cache_key_name.fingerprint)
         calc_start_datetime, calc_end_datetime = configuration.get_calc_period()
         waterbalance_computer.compute(calc_start_datetime, calc_end_datetime)
 
@@ -1,7 +1,10 @@
 from datetime import datetime
 from unittest import TestCase
+import os
+import tempfile
 
 from django.contrib.auth import authenticate
+from django.core.cache import cache
 from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User
 from django.contrib.auth.models import AnonymousUser
@@ -11,14 +14,30 @@ from lizard_waterbalance.models import Label
 from lizard_waterbalance.models import WaterbalanceArea
 from lizard_waterbalance.models import WaterbalanceConf
 from lizard_waterbalance.models import WaterbalanceScenario
+from lizard_waterbalance.fingerprint import forget_fingerprint
+from lizard_waterbalance.fingerprint import get_fingerprint_key
 from lizard_waterbalance.localmock import Mock
 from lizard_waterbalance.views import CacheKeyName
+from lizard_waterbalance.views import CachedWaterbalanceComputer
 from lizard_waterbalance.views import DataForCumulativeGraph
 from lizard_waterbalance.views import LegendInfo
+from lizard_waterbalance.views import UNAVAILABLE
+from lizard_waterbalance.views import get_computation_status
+from lizard_waterbalance.views import get_average_timeseries
+from lizard_waterbalance.views import get_daily_average_timeseries
 from lizard_waterbalance.views import raw_add_timeseries
+from lizard_waterbalance.views import request_computation
 from lizard_waterbalance.views import retrieve_viewable_configurations
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from lizard_wbcomputation.job_queue import DONE
+from lizard_wbcomputation.job_queue import FAILED
+from lizard_wbcomputation.job_queue import JobQueue
+from lizard_wbcomputation.job_queue import QUEUED
+from timeseries.timeseriesstub import SparseTimeseriesStub
 from timeseries.timeseriesstub import TimeseriesStub
 
+import numpy
+
 
 class DataForCumulativeGraphTests(TestCase):
 
@@ -117,22 +136,47 @@ class CacheKeyNameTests(TestCase):
     def test_a(self):
         """Test the case for a __unicode__ return value without spaces."""
         configuration = Mock({"__unicode__": "hello"})
-        cache_key_name = CacheKeyName(configuration)
+        cache_key_name = CacheKeyName(configuration, "0123")
         self.assertEqual("hello", cache_key_name.configuration_slug)
 
     def test_b(self):
         """Test the case for a __unicode__ return value with spaces."""
         configuration = Mock({"__unicode__": "hello world"})
-        cache_key_name = CacheKeyName(configuration)
+        cache_key_name = CacheKeyName(configuration, "0123")
         self.assertEqual("hello-world", cache_key_name.configuration_slug)
 
     def test_c(self):
         """Test method get."""
         configuration = Mock({"__unicode__": "hello world"})
-        cache_key_name = CacheKeyName(configuration)
-        self.assertEqual("sluice_error::hello-world",
+        cache_key_name = CacheKeyName(configuration, "0123")
+        self.assertEqual("sluice_error::hello-world::0123",
                          cache_key_name.get("sluice_error"))
 
+    def test_d(self):
+        """Test the key names differ for different fingerprints."""
+        configuration = Mock({"__unicode__": "hello world"})
+        self.assertNotEqual(CacheKeyName(configuration, "0123").get("outcome"),
+                            CacheKeyName(configuration, "4567").get("outcome"))
+
+    def test_e(self):
+        """Test the latest key name does not depend on the fingerprint."""
+        configuration = Mock({"__unicode__": "hello world"})
+        self.assertEqual(CacheKeyName(configuration, "0123").get_latest("outcome"),
+                         CacheKeyName(configuration, "4567").get_latest("outcome"))
+
+    def test_f(self):
+        """Test the fingerprint is retrieved from the cache until it is forgotten."""
+        configuration = WaterbalanceConf(pk=-1)
+        configuration.__unicode__ = lambda: u"hello world"
+        cache.set(get_fingerprint_key(configuration), "0123")
+        try:
+            self.assertEqual("0123", CacheKeyName(configuration).fingerprint)
+            forget_fingerprint(configuration)
+            self.assertEqual(None, cache.get(get_fingerprint_key(configuration)))
+        finally:
+            cache.delete(get_fingerprint_key(configuration))
+
+
 class LegendInfoTestSuite(TestCase):
 
     def test_a(self):
@@ -367,3 +411,172 @@ class PermissionTests(TestCase):
         configurations = retrieve_viewable_configurations(user)
         self.assertEqual([], list(configurations))
 
+
+
+class DailyArraysStub(object):
+
+    def __init__(self, events):
+        self.events = events
+
+    def daily_arrays(self, start_date=None, end_date=None):
+        times = numpy.array([event[0] for event in self.events], dtype='datetime64[us]')
+        values = numpy.array([event[1] for event in self.events], dtype=float)
+        return times, values
+
+
+class DailyAverageTestSuite(TestCase):
+
+    def test_a(self):
+        """Test the daily averages are restricted to the given range."""
+        timeseries = DailyArraysStub([(datetime(2011, 4, day), float(day))
+                                      for day in range(1, 8)])
+        times, values = get_daily_average_timeseries(timeseries,
+                                                     datetime(2011, 4, 3),
+                                                     datetime(2011, 4, 6))
+        self.assertEqual([datetime(2011, 4, 3), datetime(2011, 4, 4),
+                          datetime(2011, 4, 5)], times)
+        self.assertEqual([3.0, 4.0, 5.0], values)
+
+    def test_b(self):
+        """Test the events of a single day are averaged and missing values are skipped."""
+        timeseries = DailyArraysStub([(datetime(2011, 4, 1), 1.0),
+                                      (datetime(2011, 4, 1, 12), 3.0),
+                                      (datetime(2011, 4, 2), None)])
+        times, values = get_daily_average_timeseries(timeseries,
+                                                     datetime(2011, 4, 1),
+                                                     datetime(2011, 4, 3))
+        self.assertEqual([datetime(2011, 4, 1)], times)
+        self.assertEqual([2.0], values)
+
+    def test_c(self):
+        """Test the averages of the computed time series the views pass."""
+        values = [float(day) for day in range(1, 8)]
+        for timeseries in [DailyTimeseries(datetime(2011, 4, 1), values),
+                           SparseTimeseriesStub(datetime(2011, 4, 1), values)]:
+            times, averages = get_average_timeseries(timeseries,
+                                                     datetime(2011, 4, 3),
+                                                     datetime(2011, 4, 6),
+                                                     period='day')
+            self.assertEqual([datetime(2011, 4, 3), datetime(2011, 4, 4),
+                              datetime(2011, 4, 5)], times)
+            self.assertEqual([3.0, 4.0, 5.0], averages)
+
+
+class CacheKeyNameStub(object):
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+
+
+class ComputerStub(object):
+
+    def __init__(self, cached_data=None):
+        self.cache_key_name = CacheKeyNameStub('0123')
+        self.cached_data = cached_data
+        self.computed = False
+
+    def get_cached_data(self, name, start_date=None, end_date=None):
+        return self.cached_data
+
+    def compute(self, start_date, end_date):
+        self.computed = True
+
+
+class RequestComputationTests(TestCase):
+
+    def setUp(self):
+        handle, self.file_name = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        self.job_queue = JobQueue(self.file_name)
+        self.configuration = Mock({'get_calc_period': (datetime(2011, 1, 1),
+                                                       datetime(2012, 1, 1))})
+        self.configuration.pk = 1
+
+    def tearDown(self):
+        os.remove(self.file_name)
+
+    def test_a(self):
+        """Test the data is computed in the request without a job queue."""
+        computer = ComputerStub()
+        self.assertEqual(DONE, request_computation(self.configuration, computer, None))
+        self.assertTrue(computer.computed)
+
+    def test_b(self):
+        """Test a single job is queued for multiple requests of missing data."""
+        computer = ComputerStub()
+        self.assertEqual(QUEUED, request_computation(self.configuration, computer,
+                                                     self.job_queue))
+        self.assertEqual(QUEUED, request_computation(self.configuration, computer,
+                                                     self.job_queue))
+        self.assertFalse(computer.computed)
+        self.assertEqual(('0123', u'1'), self.job_queue.claim())
+        self.assertEqual(None, self.job_queue.claim())
+
+    def test_c(self):
+        """Test no job is queued when the data is already cached."""
+        computer = ComputerStub(cached_data='sluice error')
+        self.assertEqual(DONE, request_computation(self.configuration, computer,
+                                                   self.job_queue))
+        self.assertEqual(None, self.job_queue.claim())
+
+    def test_d(self):
+        """Test a failed job is neither submitted again nor computed in the request."""
+        computer = ComputerStub()
+        request_computation(self.configuration, computer, self.job_queue)
+        self.job_queue.claim()
+        self.job_queue.finish('0123', 'failed')
+        self.assertEqual(FAILED, request_computation(self.configuration, computer,
+                                                     self.job_queue))
+        self.assertFalse(computer.computed)
+        self.assertEqual(None, self.job_queue.claim())
+
+    def test_e(self):
+        """Test get_computation_status neither computes the data nor submits a job."""
+        computer = ComputerStub()
+        self.assertEqual(UNAVAILABLE, get_computation_status(self.configuration,
+                                                             computer, None))
+        self.assertEqual(None, get_computation_status(self.configuration, computer,
+                                                      self.job_queue))
+        self.assertFalse(computer.computed)
+        self.assertEqual(None, self.job_queue.claim())
+        request_computation(self.configuration, computer, self.job_queue)
+        self.assertEqual(QUEUED, get_computation_status(self.configuration, computer,
+                                                        self.job_queue))
+
+
+def create_cached_computer(fingerprint):
+    """Return a CachedWaterbalanceComputer that only uses the cache."""
+    configuration = Mock({"__unicode__": "single flight"})
+    computer = CachedWaterbalanceComputer.__new__(CachedWaterbalanceComputer)
+    computer.cache_key_name = CacheKeyName(configuration, fingerprint)
+    computer.result_store = None
+    return computer
+
+
+class GetOrComputeTests(TestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_a(self):
+        """Test the computed data is stored and the lock is released."""
+        computer = create_cached_computer("0123")
+        self.assertEqual(1.0, computer.get_or_compute(["outcome"], lambda: 1.0))
+        self.assertEqual(1.0, computer.get_or_compute(["outcome"], lambda: 2.0))
+        self.assertEqual(None, cache.get(computer.cache_key_name.get("outcome") + "::lock"))
+
+    def test_b(self):
+        """Test the stale data is returned while another process holds the lock."""
+        create_cached_computer("0123").get_or_compute(["outcome"], lambda: 1.0)
+        computer = create_cached_computer("4567")
+        cache.add(computer.cache_key_name.get("outcome") + "::lock", True)
+        self.assertEqual(1.0, computer.get_or_compute(["outcome"], lambda: 2.0))
+        cache.delete(computer.cache_key_name.get("outcome") + "::lock")
+        self.assertEqual(2.0, computer.get_or_compute(["outcome"], lambda: 2.0))
+
+    def test_c(self):
+        """Test the data of multiple names is returned as a tuple."""
+        computer = create_cached_computer("0123")
+        self.assertEqual((1.0, 2.0),
+                         computer.get_or_compute(["ref_in", "ref_out"], lambda: (1.0, 2.0)))
+        self.assertEqual(2.0, computer.get_cached_data("ref_out"))
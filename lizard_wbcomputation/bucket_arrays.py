@@ -0,0 +1,314 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+from lizard_wbcomputation.daily_timeseries import find_daily_timeseries
+
+
+# names of the bucket attributes that bucket_computer.compute uses
+PARAMETER_NAMES = [
+    'surface',
+    'bottom_porosity',
+    'crop_evaporation_factor',
+    'min_crop_evaporation_factor',
+    'bottom_drainage_fraction',
+    'bottom_indraft_fraction',
+    'bottom_max_water_level',
+    'bottom_min_water_level',
+    'bottom_equi_water_level',
+    'bottom_init_water_level',
+    ]
+
+# names of the bucket attributes that are only used by some computations, see
+# compute_multiple_arrays
+OPTIONAL_PARAMETER_NAMES = [
+    'bottom_min_water_level',
+    ]
+
+
+def read_events(timeseries):
+    """Return the events of the given time series as arrays.
+
+    This function returns the triple (first date, days, values), where days is
+    the array of the ordinal of the date of each event and values is the array
+    of the value of each event. When the time series does not have any events,
+    the first date is None.
+
+    The arrays of a DailyTimeseries are returned without reading its events.
+
+    """
+    daily_timeseries = find_daily_timeseries(timeseries)
+    if daily_timeseries is not None:
+        if len(daily_timeseries) == 0:
+            return None, numpy.zeros(0, dtype=int), numpy.zeros(0)
+        first_day = daily_timeseries.first_date.toordinal()
+        days = numpy.arange(first_day, first_day + len(daily_timeseries))
+        return daily_timeseries.first_date, days, daily_timeseries.values
+    events = list(timeseries.events())
+    if len(events) == 0:
+        return None, numpy.zeros(0, dtype=int), numpy.zeros(0)
+    days = numpy.array([event[0].toordinal() for event in events])
+    values = numpy.array([event[1] for event in events], dtype=float)
+    return events[0][0], days, values
+
+
+def fill_days(days, values, first_day, day_count):
+    """Return the array of the given values for each day of the given range.
+
+    The returned array contains day_count values and the value at index i is
+    the value at day first_day + i. When no value is given for a day, its value
+    is 0.0.
+
+    """
+    result = numpy.zeros(day_count)
+    result[days - first_day] = values
+    return result
+
+
+def find_day_range(read_events_list):
+    """Return the first date, first day and day count of the given events.
+
+    Parameter:
+      *read_events_list*
+        list of triples as returned by read_events
+
+    The day range starts at the first day for which any of the events exists
+    and ends at the last day for which any of the events exists. Just as
+    timeseries.timeseriesstub.enumerate_events, the first date is the date of
+    the first event of the first events when that event is on the first day.
+
+    """
+    present = [(first_date, days) for (first_date, days, values) in read_events_list
+               if first_date is not None]
+    if len(present) == 0:
+        return None, None, 0
+    first_date = min(date for (date, days) in present)
+    first_day = first_date.toordinal()
+    last_day = max(days[-1] for (date, days) in present)
+
+    date = read_events_list[0][0]
+    if date is not None and date.toordinal() == first_day:
+        first_date = date
+    return first_date, first_day, last_day - first_day + 1
+
+
+def align_events(*timeseries_list):
+    """Return the daily values of the given time series as aligned arrays.
+
+    This function returns the pair (first date, list of arrays). Each array
+    contains the values of the time series at the same index and the value at
+    index i of each array is the value at the i-th day after the first date.
+
+    The alignment mimics timeseries.timeseriesstub.enumerate_events: the
+    arrays start at the first day for which any of the time series has an
+    event and end at the last day for which any of the time series has an
+    event. When a time series has no event on a day, its value on that day is
+    0.0. Just as enumerate_events, the first date is the date of the event of
+    the first time series when that time series has an event on the first day.
+
+    When none of the time series has an event, this function returns None as
+    the first date and empty arrays.
+
+    """
+    read_events_list = [read_events(timeseries) for timeseries in timeseries_list]
+    first_date, first_day, day_count = find_day_range(read_events_list)
+    if first_date is None:
+        return None, [numpy.zeros(0) for timeseries in timeseries_list]
+    arrays = [fill_days(days, values, first_day, day_count)
+              for (date, days, values) in read_events_list]
+    return first_date, arrays
+
+
+def create_parameter_matrix(layers):
+    """Return the parameter matrix of the given bucket layers.
+
+    Each bucket layer is an object that has an attribute for each name in
+    PARAMETER_NAMES, for example a bucket_layers.BucketLayer. The parameter
+    matrix is a dictionary that maps each name in PARAMETER_NAMES to the array
+    of the values of that parameter, one value per layer.
+
+    A parameter value that is None is stored as NaN when its name is in
+    OPTIONAL_PARAMETER_NAMES. For any other parameter, this function raises a
+    TypeError, just as the computation of a single bucket does, so the
+    missing value does not silently spread through the results.
+
+    """
+    matrix = {}
+    for name in PARAMETER_NAMES:
+        values = [getattr(layer, name) for layer in layers]
+        if name not in OPTIONAL_PARAMETER_NAMES and None in values:
+            layer = layers[values.index(None)]
+            raise TypeError("Parameter %s of bucket %s is not set" % (name, layer.name))
+        matrix[name] = numpy.array(values, dtype=float)
+    return matrix
+
+
+def compute_initial_volume(bucket):
+    """Return the storage of the given bucket at the start of its computation."""
+    return bucket.bottom_init_water_level * bucket.surface * bucket.bottom_porosity
+
+
+def compute_arrays(bucket, precipitation, evaporation, seepage,
+                   allow_below_minimum_storage=True):
+    """Compute and return the daily waterbalance of the given bucket.
+
+    This function computes the same waterbalance as
+    bucket_computer.compute_timeseries but it uses arrays instead of time
+    series. It returns the quintuple of arrays (storage, flow off, net
+    drainage, seepage, net precipitation).
+
+    Parameters:
+    * bucket -- bucket for which to compute the waterbalance
+    * precipitation -- array of the daily precipitation in [mm/day]
+    * evaporation -- array of the daily evaporation in [mm/day]
+    * seepage -- array of the daily seepage in [mm/day]
+    * allow_below_minimum_storage -- holds iff the computed storage can be
+      below the minimum storage
+
+    The arrays should have the same length. To be able to produce the same
+    values as bucket_computer.compute, each expression below evaluates its
+    operands in the same order as the corresponding expression in that
+    function.
+
+    """
+    surface = bucket.surface
+    equi_volume = bucket.bottom_equi_water_level * surface
+    drainage_fraction = bucket.bottom_drainage_fraction
+    indraft_fraction = bucket.bottom_indraft_fraction
+    max_storage = bucket.bottom_max_water_level * surface * bucket.bottom_porosity
+    if allow_below_minimum_storage:
+        min_storage = 0.0
+    else:
+        min_storage = bucket.bottom_min_water_level * surface
+
+    # the net precipitation and seepage do not depend on the storage of the
+    # previous day, except for the choice of the crop evaporation factor, so we
+    # compute them for all days in one go
+    wet_precipitation = \
+        (precipitation - evaporation * bucket.crop_evaporation_factor) * surface / 1000.0
+    dry_precipitation = \
+        (precipitation - evaporation * bucket.min_crop_evaporation_factor) * surface / 1000.0
+    seepage = surface * seepage / 1000.0
+
+    day_count = len(precipitation)
+    storage = numpy.empty(day_count)
+    flow_off = numpy.empty(day_count)
+    net_drainage = numpy.empty(day_count)
+    net_precipitation = numpy.empty(day_count)
+
+    volume = compute_initial_volume(bucket)
+    for day in xrange(day_count):
+        if volume > equi_volume:
+            precipitation_value = wet_precipitation[day]
+            drainage_value = -volume * drainage_fraction
+        elif volume < equi_volume:
+            precipitation_value = dry_precipitation[day]
+            drainage_value = volume * indraft_fraction
+        else:
+            precipitation_value = dry_precipitation[day]
+            drainage_value = 0.0
+
+        volume = volume + precipitation_value + drainage_value + seepage[day]
+        if volume > max_storage:
+            flow_off_value = max_storage - volume
+            volume = max_storage
+        else:
+            flow_off_value = 0.0
+        if min_storage > volume:
+            volume = min_storage
+
+        storage[day] = volume
+        flow_off[day] = flow_off_value
+        net_drainage[day] = drainage_value
+        net_precipitation[day] = precipitation_value
+
+    return storage, flow_off, net_drainage, seepage, net_precipitation
+
+
+def compute_multiple_arrays(matrix, precipitation, evaporation, seepage,
+                            allow_below_minimum_storage, initial_volume=None):
+    """Compute and return the daily waterbalance of multiple bucket layers.
+
+    This function computes the same waterbalance as compute_arrays but for
+    multiple bucket layers at the same time: it advances the storage of all
+    layers for a single day in one vectorized step. It returns the quintuple
+    of 2-dimensional arrays (storage, flow off, net drainage, seepage, net
+    precipitation), where each row specifies the values of a single day and
+    each column the values of a single layer.
+
+    Parameters:
+    * matrix -- parameter matrix as returned by create_parameter_matrix
+    * precipitation -- (days x layers) array of the precipitation in [mm/day]
+    * evaporation -- (days x layers) array of the evaporation in [mm/day]
+    * seepage -- (days x layers) array of the seepage in [mm/day]
+    * allow_below_minimum_storage -- array that specifies for each layer
+      whether its storage can be below its minimum storage
+    * initial_volume -- array of the storage of each layer at the start of
+      the first day, or None to start from the initial water level of each
+      layer
+
+    """
+    surface = matrix['surface']
+    equi_volume = matrix['bottom_equi_water_level'] * surface
+    drainage_fraction = matrix['bottom_drainage_fraction']
+    indraft_fraction = matrix['bottom_indraft_fraction']
+    max_storage = matrix['bottom_max_water_level'] * surface * matrix['bottom_porosity']
+    min_water_level = matrix['bottom_min_water_level']
+    if numpy.isnan(min_water_level[~numpy.asarray(allow_below_minimum_storage)]).any():
+        raise TypeError("Parameter bottom_min_water_level is not set for a "
+                        "bucket whose storage cannot be below its minimum")
+    min_storage = numpy.where(allow_below_minimum_storage, 0.0,
+                              min_water_level * surface)
+
+    wet_precipitation = \
+        (precipitation - evaporation * matrix['crop_evaporation_factor']) * surface / 1000.0
+    dry_precipitation = \
+        (precipitation - evaporation * matrix['min_crop_evaporation_factor']) * surface / 1000.0
+    seepage = surface * seepage / 1000.0
+
+    storage = numpy.empty(precipitation.shape)
+    flow_off = numpy.empty(precipitation.shape)
+    net_drainage = numpy.empty(precipitation.shape)
+    net_precipitation = numpy.empty(precipitation.shape)
+
+    if initial_volume is None:
+        volume = matrix['bottom_init_water_level'] * surface * matrix['bottom_porosity']
+    else:
+        volume = numpy.array(initial_volume, dtype=float)
+    for day in xrange(len(precipitation)):
+        is_wet = volume > equi_volume
+        is_dry = volume < equi_volume
+        net_precipitation[day] = numpy.where(is_wet, wet_precipitation[day],
+                                             dry_precipitation[day])
+        net_drainage[day] = numpy.where(is_wet, -volume * drainage_fraction,
+                                        numpy.where(is_dry, volume * indraft_fraction, 0.0))
+
+        volume = volume + net_precipitation[day] + net_drainage[day] + seepage[day]
+        is_full = volume > max_storage
+        flow_off[day] = numpy.where(is_full, max_storage - volume, 0.0)
+        volume = numpy.where(is_full, max_storage, volume)
+        volume = numpy.where(min_storage > volume, min_storage, volume)
+        storage[day] = volume
+
+    return storage, flow_off, net_drainage, seepage, net_precipitation
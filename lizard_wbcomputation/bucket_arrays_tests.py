@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+
+from datetime import datetime
+from datetime import timedelta
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays import align_events
+from lizard_wbcomputation.bucket_arrays import create_parameter_matrix
+from lizard_wbcomputation.bucket_computer import compute
+from lizard_wbcomputation.bucket_computer import compute_multiple_timeseries
+from lizard_wbcomputation.bucket_computer import compute_timeseries
+from lizard_wbcomputation.bucket_computer import compute_timeseries_with_arrays
+from lizard_wbcomputation.bucket_computer import compute_timeseries_on_drained_surface
+from lizard_wbcomputation.bucket_computer import compute_timeseries_on_hardened_surface
+from lizard_wbcomputation.bucket_types import BucketTypes
+from timeseries.timeseriesstub import SparseTimeseriesStub
+from timeseries.timeseriesstub import TimeseriesStub
+
+
+class Bucket(object):
+
+    def __init__(self):
+        self.name = 'bucket'
+        self.surface = 2950181
+        self.bottom_porosity = 0.2
+        self.crop_evaporation_factor = 1.0
+        self.min_crop_evaporation_factor = 0.75
+        self.bottom_drainage_fraction = 0.02
+        self.bottom_indraft_fraction = 0.02
+        self.bottom_max_water_level = 0.7
+        self.bottom_equi_water_level = 0.1
+        self.bottom_min_water_level = 0.0
+        self.bottom_init_water_level = 0.35
+        self.porosity = 1.0
+        self.drainage_fraction = 0.05
+        self.indraft_fraction = 0.01
+        self.max_water_level = 0.02
+        self.min_water_level = 0.0
+        self.equi_water_level = 0.01
+        self.init_water_level = 0.0
+
+
+def create_timeseries(start, values):
+    timeseries = SparseTimeseriesStub()
+    for index, value in enumerate(values):
+        timeseries.add_value(start + timedelta(index), value)
+    return timeseries
+
+
+class PicklingFuture(object):
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return pickle.loads(self._result)
+
+
+class PicklingExecutor(object):
+    """Implements an executor that pickles the arguments and result of a task.
+
+    The arguments and result of a task for a process pool executor are
+    pickled, so this executor checks they can be pickled without the need to
+    start other processes.
+
+    """
+    def __init__(self):
+        self.task_count = 0
+
+    def submit(self, function, *args):
+        self.task_count += 1
+        args = pickle.loads(pickle.dumps(args, 2))
+        return PicklingFuture(pickle.dumps(function(*args), 2))
+
+
+class align_events_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test align_events fills missing days with 0.0."""
+        today = datetime(2011, 10, 24)
+        tomorrow = today + timedelta(1)
+        first_date, arrays = align_events(TimeseriesStub((today, 1.0)),
+                                          TimeseriesStub((tomorrow, 2.0)))
+        self.assertEqual(today, first_date)
+        self.assertEqual([1.0, 0.0], arrays[0].tolist())
+        self.assertEqual([0.0, 2.0], arrays[1].tolist())
+
+    def test_b(self):
+        """Test align_events on time series without events."""
+        first_date, arrays = align_events(TimeseriesStub(), TimeseriesStub())
+        self.assertEqual(None, first_date)
+        self.assertEqual([[], []], [array.tolist() for array in arrays])
+
+
+class create_parameter_matrix_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test a missing optional parameter is stored as NaN."""
+        bucket = Bucket()
+        bucket.bottom_min_water_level = None
+        matrix = create_parameter_matrix([bucket])
+        self.assertTrue(matrix['bottom_min_water_level'][0] != matrix['bottom_min_water_level'][0])
+
+    def test_b(self):
+        """Test a missing parameter raises a TypeError."""
+        bucket = Bucket()
+        bucket.crop_evaporation_factor = None
+        self.assertRaises(TypeError, create_parameter_matrix, [Bucket(), bucket])
+
+
+class compute_timeseries_with_arrays_TestSuite(TestCase):
+
+    def setUp(self):
+        start = datetime(2011, 1, 1)
+        self.precipitation = create_timeseries(start, [(day * 7) % 23 for day in range(400)])
+        self.evaporation = create_timeseries(start, [(day * 3) % 5 for day in range(400)])
+        self.seepage = create_timeseries(start, [((day * 5) % 11) - 5 for day in range(400)])
+
+    def assert_same_outcome(self, expected_outcome, outcome):
+        for name, timeseries in expected_outcome.name2timeseries().items():
+            self.assertEqual(list(timeseries.events()),
+                             list(outcome.name2timeseries()[name].events()))
+
+    def test_a(self):
+        """Test the array computation is equal to the event computation."""
+        expected_outcome = compute_timeseries(Bucket(), self.precipitation,
+                                              self.evaporation, self.seepage,
+                                              compute)
+        outcome = compute_timeseries_with_arrays(Bucket(), self.precipitation,
+                                                 self.evaporation, self.seepage,
+                                                 compute)
+        self.assert_same_outcome(expected_outcome, outcome)
+
+    def test_b(self):
+        """Test the array computation of a hardened surface."""
+        expected_outcome = compute_timeseries_on_hardened_surface(Bucket(),
+            self.precipitation, self.evaporation, self.seepage, compute)
+        outcome = compute_timeseries_on_hardened_surface(Bucket(),
+            self.precipitation, self.evaporation, self.seepage, compute,
+            compute_timeseries=compute_timeseries_with_arrays)
+        self.assert_same_outcome(expected_outcome, outcome)
+
+    def test_c(self):
+        """Test the array computation of a drained surface."""
+        expected_outcome = compute_timeseries_on_drained_surface(Bucket(),
+            self.precipitation, self.evaporation, self.seepage, compute)
+        outcome = compute_timeseries_on_drained_surface(Bucket(),
+            self.precipitation, self.evaporation, self.seepage, compute,
+            compute_timeseries=compute_timeseries_with_arrays)
+        self.assert_same_outcome(expected_outcome, outcome)
+
+
+class compute_multiple_timeseries_TestSuite(TestCase):
+
+    def setUp(self):
+        start = datetime(2011, 1, 1)
+        self.precipitation = create_timeseries(start, [(day * 7) % 23 for day in range(400)])
+        self.evaporation = create_timeseries(start, [(day * 3) % 5 for day in range(400)])
+        self.buckets = []
+        self.bucket2seepage = {}
+        for surface_type in [BucketTypes.UNDRAINED_SURFACE,
+                             BucketTypes.HARDENED_SURFACE,
+                             BucketTypes.DRAINED_SURFACE,
+                             BucketTypes.DRAINED_SURFACE]:
+            bucket = Bucket()
+            bucket.surface_type = surface_type
+            bucket.surface = bucket.surface + 1000 * len(self.buckets)
+            self.buckets.append(bucket)
+            offset = len(self.buckets)
+            self.bucket2seepage[bucket] = \
+                create_timeseries(start, [((day * 5 + offset) % 11) - 5 for day in range(400)])
+
+    def test_a(self):
+        """Test the multiple bucket computation is equal to the single one."""
+        computers = {BucketTypes.UNDRAINED_SURFACE: compute_timeseries,
+                     BucketTypes.HARDENED_SURFACE: compute_timeseries_on_hardened_surface,
+                     BucketTypes.DRAINED_SURFACE: compute_timeseries_on_drained_surface}
+        bucket2outcome = compute_multiple_timeseries(self.buckets,
+                                                     self.precipitation,
+                                                     self.evaporation,
+                                                     self.bucket2seepage)
+        for bucket in self.buckets:
+            expected_outcome = computers[bucket.surface_type](bucket,
+                self.precipitation, self.evaporation,
+                self.bucket2seepage[bucket], compute)
+            outcome = bucket2outcome[bucket]
+            for name, timeseries in expected_outcome.name2timeseries().items():
+                self.assertEqual(list(timeseries.events()),
+                                 list(outcome.name2timeseries()[name].events()))
+
+    def test_b(self):
+        """Test the computation using an executor is equal to the one without."""
+        expected_bucket2outcome = compute_multiple_timeseries(self.buckets,
+            self.precipitation, self.evaporation, self.bucket2seepage)
+        executor = PicklingExecutor()
+        bucket2outcome = compute_multiple_timeseries(self.buckets,
+            self.precipitation, self.evaporation, self.bucket2seepage,
+            executor, 3)
+        self.assertEqual(3, executor.task_count)
+        for bucket in self.buckets:
+            expected_outcome = expected_bucket2outcome[bucket]
+            outcome = bucket2outcome[bucket]
+            for name, timeseries in expected_outcome.name2timeseries().items():
+                self.assertEqual(list(timeseries.events()),
+                                 list(outcome.name2timeseries()[name].events()))
+
+    def test_c(self):
+        """Test a missing parameter raises the same error as a single bucket."""
+        self.buckets[1].crop_evaporation_factor = None
+        self.assertRaises(TypeError, compute_timeseries_on_hardened_surface,
+                          self.buckets[1], self.precipitation, self.evaporation,
+                          self.bucket2seepage[self.buckets[1]], compute)
+        self.assertRaises(TypeError, compute_multiple_timeseries, self.buckets,
+                          self.precipitation, self.evaporation, self.bucket2seepage)
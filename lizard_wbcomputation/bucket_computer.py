@@ -28,8 +28,24 @@
 
 import logging
 from datetime import datetime
-
+from functools import partial
+
+import numpy
+
+from lizard_wbcomputation.bucket_arrays import align_events
+from lizard_wbcomputation.bucket_arrays import compute_arrays
+from lizard_wbcomputation.bucket_arrays import compute_initial_volume
+from lizard_wbcomputation.bucket_arrays import compute_multiple_arrays
+from lizard_wbcomputation.bucket_arrays import create_parameter_matrix
+from lizard_wbcomputation.bucket_arrays import fill_days
+from lizard_wbcomputation.bucket_arrays import find_day_range
+from lizard_wbcomputation.bucket_arrays import read_events
+from lizard_wbcomputation.bucket_layers import create_bucket_layers
+from lizard_wbcomputation.bucket_layers import create_drained_layers
+from lizard_wbcomputation.bucket_layers import create_hardened_layers
 from lizard_wbcomputation.bucket_types import BucketTypes
+from lizard_wbcomputation.checkpoint import map_checkpoints
+from lizard_wbcomputation.daily_timeseries import load_daily_timeseries
 
 from timeseries.timeseriesstub import add_timeseries
 from timeseries.timeseriesstub import create_empty_timeseries
@@ -188,6 +204,10 @@ def compute(bucket, previous_storage, precipitation, evaporation, seepage, allow
 
     return (storage, flow_off, net_drainage, seepage, net_precipitation)
 
+# compute_timeseries_with_arrays inlines the function above and has to be able
+# to check whether it is asked to use that function
+default_compute = compute
+
 def compute_timeseries(bucket, precipitation, evaporation, seepage, compute, allow_below_minimum_storage=True):
     """Compute and return the waterbalance time series of the given bucket.
 
@@ -207,8 +227,7 @@ def compute_timeseries(bucket, precipitation, evaporation, seepage, compute, all
     volume = bucket.bottom_init_water_level * bucket.surface * bucket.bottom_porosity
 
     if not allow_below_minimum_storage and bucket.bottom_min_water_level == None:
-        logger.warming("Warning, minimum level is not set for %s, default value 0 taken for calculation (level below minimum level is not allowed for this bucket type)"%bucket.name)
-        bucket.min_water_level = 0
+        logger.warning("Warning, minimum level is not set for %s (level below minimum level is not allowed for this bucket type)"%bucket.name)
 
     for triple in enumerate_events(precipitation, evaporation, seepage):
         precipitation_event = triple[0]
@@ -227,48 +246,63 @@ def compute_timeseries(bucket, precipitation, evaporation, seepage, compute, all
         outcome.net_precipitation.add_value(event_date, bucket_triple[4])
     return outcome
 
-def switch_values(one, two):
-    return two, one
+def compute_timeseries_with_arrays(bucket, precipitation, evaporation, seepage, compute, allow_below_minimum_storage=True):
+    """Compute and return the waterbalance time series of the given bucket.
 
-def switch_bucket_upper_values(bucket):
+    This method computes the same BucketOutcome as compute_timeseries but
+    instead of computing the waterbalance event by event, it aligns the given
+    time series into arrays and lets bucket_arrays.compute_arrays compute the
+    waterbalance for all days.
 
-    bucket.bottom_porosity, bucket.porosity = switch_values(bucket.bottom_porosity, bucket.porosity)
-    bucket.bottom_drainage_fraction, bucket.drainage_fraction = switch_values(bucket.bottom_drainage_fraction, bucket.drainage_fraction)
-    bucket.bottom_indraft_fraction, bucket.indraft_fraction = switch_values(bucket.bottom_indraft_fraction, bucket.indraft_fraction)
-    bucket.bottom_max_water_level, bucket.max_water_level = switch_values(bucket.bottom_max_water_level, bucket.max_water_level)
-    bucket.bottom_min_water_level, bucket.min_water_level = switch_values(bucket.bottom_min_water_level, bucket.min_water_level)
-    bucket.bottom_equi_water_level, bucket.equi_water_level = switch_values(bucket.bottom_equi_water_level, bucket.equi_water_level)
-    bucket.bottom_init_water_level, bucket.init_water_level = switch_values(bucket.bottom_init_water_level, bucket.init_water_level)
-    return bucket
+    The array computation inlines the default daily computation. When the
+    caller specifies another function to compute the daily waterbalance, this
+    method falls back to compute_timeseries.
+
+    """
+    if compute is not default_compute:
+        return compute_timeseries(bucket, precipitation, evaporation, seepage,
+                                  compute, allow_below_minimum_storage)
 
-def compute_timeseries_on_hardened_surface(bucket, precipitation, evaporation, seepage, compute):
+    if not allow_below_minimum_storage and bucket.bottom_min_water_level == None:
+        logger.warning("Warning, minimum level is not set for %s (level below minimum level is not allowed for this bucket type)"%bucket.name)
+
+    first_date, arrays = align_events(precipitation, evaporation, seepage)
+    outcome = BucketOutcome()
+    if first_date is None:
+        return outcome
+
+    computed_arrays = compute_arrays(bucket, arrays[0], arrays[1], arrays[2],
+                                     allow_below_minimum_storage)
+    outcome.storage, outcome.flow_off, outcome.net_drainage, \
+        outcome.seepage, outcome.net_precipitation = \
+        [SparseTimeseriesStub(first_date, values.tolist()) for values in computed_arrays]
+    return outcome
+
+def compute_timeseries_on_hardened_surface(bucket, precipitation, evaporation, seepage, compute, compute_timeseries=compute_timeseries):
 
     # we compute the upper bucket:
     #   - the upper bucket does not have seepage
     #   - the porosity of the upper bucket is always 1.0
     #   - the storage of the upper bucket can not be below the minimum storage
+    # The BucketLayers take care of the upper bucket attributes, so the given
+    # bucket is not modified.
 
+    layers = create_hardened_layers(bucket)
     upper_seepage = create_empty_timeseries(seepage)
 
-
-    bucket = switch_bucket_upper_values(bucket)
-    bucket.bottom_porosity, tmp = 1.0, bucket.bottom_porosity
-
-    upper_outcome = compute_timeseries(bucket,
+    upper_outcome = compute_timeseries(layers.upper,
                                        precipitation,
                                        evaporation,
                                        upper_seepage,
                                        compute,
                                        False)
-    bucket.bottom_porosity = tmp
-    bucket = switch_bucket_upper_values(bucket)
 
     # we then compute the lower bucket:
     #  - the lower bucket does not have precipitation, evaporation and does not
     #    have flow off
     lower_precipitation = create_empty_timeseries(precipitation)
     lower_evaporation = create_empty_timeseries(evaporation)
-    lower_outcome = compute_timeseries(bucket,
+    lower_outcome = compute_timeseries(layers.lower,
                                        lower_precipitation,
                                        lower_evaporation,
                                        seepage,
@@ -282,16 +316,17 @@ def compute_timeseries_on_hardened_surface(bucket, precipitation, evaporation, s
     return outcome
 
 
-def compute_timeseries_on_drained_surface(bucket, precipitation, evaporation, seepage, compute):
+def compute_timeseries_on_drained_surface(bucket, precipitation, evaporation, seepage, compute, compute_timeseries=compute_timeseries):
 
     # we first compute the upper bucket:
     #   - the upper bucket does not have seepage
     #   - the upper bucket has some of its own attributes
+    # The BucketLayers take care of the upper bucket attributes, so the given
+    # bucket is not modified.
+    layers = create_drained_layers(bucket)
     upper_seepage = create_empty_timeseries(seepage)
 
-    bucket = switch_bucket_upper_values(bucket)
-
-    upper_outcome = compute_timeseries(bucket,
+    upper_outcome = compute_timeseries(layers.upper,
                                        precipitation,
                                        evaporation,
                                        upper_seepage,
@@ -299,8 +334,6 @@ def compute_timeseries_on_drained_surface(bucket, precipitation, evaporation, se
     assert len(list(upper_outcome.flow_off.events())) > 0
     assert len(list(upper_outcome.net_drainage.events())) > 0
 
-    bucket = switch_bucket_upper_values(bucket)
-
     # we compute the lower bucket
     (drainage, indraft) = split_timeseries(upper_outcome.net_drainage)
     # upper_outcome.flow_off and drainage are time series with only
@@ -309,22 +342,18 @@ def compute_timeseries_on_drained_surface(bucket, precipitation, evaporation, se
     # As it is, lower_precipitation contains only non-positive values but it
     # adds water to the bottom bucket, so we have to invert these values. Also,
     # lower_precipitation is specified in [m3/day] but should be specified in
-    # [mm/day]
+    # [mm/day]. Note that the crop evaporation factors of the lower layer are
+    # 1.0.
 
-    bucket.crop_evaporation_factor, tmp_crop_evaporation = 1, bucket.crop_evaporation_factor
-    bucket.min_crop_evaporation_factor, tmp_min_crop_evaporation = 1 , bucket.min_crop_evaporation_factor
     lower_precipitation = multiply_timeseries(lower_precipitation, -1000.0 / bucket.surface)
     lower_evaporation = create_empty_timeseries(evaporation)
     assert len(list(lower_precipitation.events())) > 0
-    lower_outcome = compute_timeseries(bucket,
+    lower_outcome = compute_timeseries(layers.lower,
                                        lower_precipitation,
                                        lower_evaporation,
                                        seepage,
                                        compute)
 
-    bucket.crop_evaporation_factor = tmp_crop_evaporation
-    bucket.min_crop_evaporation_factor = tmp_min_crop_evaporation
-
     outcome = BucketOutcome()
     outcome.storage = upper_outcome.storage
     outcome.flow_off = upper_outcome.flow_off
@@ -336,12 +365,6 @@ def compute_timeseries_on_drained_surface(bucket, precipitation, evaporation, se
 
 def compute_timeseries_from_sewer(bucket, sewer):
 
-    # we first compute the upper bucket:
-    #   - the upper bucket does not have seepage
-    #   - the upper bucket has some of its own attributes
-
-
-    bucket = switch_bucket_upper_values(bucket)
     outcome = BucketOutcome()
     outcome.net_drainage = multiply_timeseries(sewer, -1 * bucket.surface/10000)
     return outcome
@@ -361,17 +384,319 @@ def compute_timeseries_predefined(bucket):
     return outcome
 
 
+def compute_multiple_timeseries(buckets, precipitation, evaporation, bucket2seepage,
+                                executor=None, chunk_count=1, checkpoint=None,
+                                checkpoints=None):
+    """Compute and return the waterbalance time series of the given buckets.
+
+    This method computes the same BucketOutcome(s) as compute_timeseries,
+    compute_timeseries_on_hardened_surface and
+    compute_timeseries_on_drained_surface, but instead of computing the
+    waterbalance bucket by bucket, it computes the waterbalance of all buckets
+    together. It reads the precipitation and evaporation only once, stores the
+    parameters of the buckets in a parameter matrix and advances the storage
+    of every bucket for a single day in one vectorized step.
+
+    This method returns the dictionary of Bucket to BucketOutcome.
+
+    Parameters:
+    * buckets -- list of buckets that have an undrained, hardened or drained
+      surface
+    * precipitation -- precipitation time series in [mm/day]
+    * evaporation -- evaporation time series  in [mm/day]
+    * bucket2seepage -- dictionary of Bucket to seepage time series in [mm/day]
+    * executor -- concurrent.futures.Executor to compute the buckets with, or
+      None to compute them in the current process
+    * chunk_count -- maximum number of tasks to submit to the executor for
+      the buckets that span the same range of days
+    * checkpoint -- Checkpoint to start the computation from at its date, or
+      None to start from the initial water level of each bucket
+    * checkpoints -- list of Checkpoint(s) in which to store the volume of
+      each bucket at the start of their date, or None
+
+    When an executor is given, this method splits the buckets into chunks and
+    submits the computation of each chunk to the executor. The tasks only
+    receive and return BucketLayers and arrays, which are cheap to pickle, so
+    the executor can be a concurrent.futures.ProcessPoolExecutor. As each
+    bucket is computed independently of the other buckets, the outcome does
+    not depend on the executor or the number of chunks.
+
+    A Checkpoint refers to a bucket by its name. When the given Checkpoint
+    does not contain the volumes of a bucket, the computation of that bucket
+    starts from its initial water level.
+
+    """
+    if checkpoint is not None:
+        restrict = lambda timeseries: load_daily_timeseries(timeseries, checkpoint.date)
+        precipitation = restrict(precipitation)
+        evaporation = restrict(evaporation)
+        bucket2seepage = dict((bucket, restrict(bucket2seepage[bucket])) for bucket in buckets)
+    day2checkpoint = map_checkpoints(checkpoints)
+
+    precipitation_events = read_events(precipitation)
+    evaporation_events = read_events(evaporation)
+
+    # the time series of each bucket can span a different range of days, so
+    # we group the buckets by their range of days
+    range2buckets = {}
+    bucket2first_date = {}
+    bucket2seepage_events = {}
+    for bucket in buckets:
+        seepage_events = read_events(bucket2seepage[bucket])
+        first_date, first_day, day_count = \
+            find_day_range([precipitation_events, evaporation_events, seepage_events])
+        range2buckets.setdefault((first_day, day_count), []).append(bucket)
+        bucket2first_date[bucket] = first_date
+        bucket2seepage_events[bucket] = seepage_events
+
+    # each task is the quadruple (range of days, list of buckets, list of
+    # initial volumes, future or list of computed arrays)
+    tasks = []
+    for (first_day, day_count), range_buckets in range2buckets.items():
+        if day_count == 0:
+            tasks.append(((first_day, day_count), range_buckets, None, None))
+            continue
+        fill = lambda events: fill_days(events[1], events[2], first_day, day_count)
+        daily_precipitation = fill(precipitation_events)
+        daily_evaporation = fill(evaporation_events)
+        if executor is None:
+            chunks = [range_buckets]
+        else:
+            chunks = split_list(range_buckets, chunk_count)
+        for chunk in chunks:
+            bucket_layers = [create_bucket_layers(bucket) for bucket in chunk]
+            initial_volumes = [find_initial_volumes(layers, checkpoint)
+                               for layers in bucket_layers]
+            arguments = (bucket_layers,
+                         daily_precipitation,
+                         daily_evaporation,
+                         [fill(bucket2seepage_events[bucket]) for bucket in chunk],
+                         initial_volumes)
+            if executor is None:
+                result = compute_multiple_layers(*arguments)
+            else:
+                result = executor.submit(compute_multiple_layers, *arguments)
+            tasks.append(((first_day, day_count), chunk, initial_volumes, result))
+
+    bucket2outcome = {}
+    for (first_day, day_count), chunk, initial_volumes, result in tasks:
+        if day_count == 0:
+            for bucket in chunk:
+                bucket2outcome[bucket] = BucketOutcome()
+            continue
+        if executor is not None:
+            result = result.result()
+        for bucket, volumes, arrays in zip(chunk, initial_volumes, result):
+            first_date = bucket2first_date[bucket]
+            outcome = BucketOutcome()
+            outcome.storage, outcome.flow_off, outcome.net_drainage, \
+                outcome.seepage, outcome.net_precipitation = \
+                [SparseTimeseriesStub(first_date, values.tolist()) for values in arrays[:5]]
+            bucket2outcome[bucket] = outcome
+            for day, day_checkpoint in day2checkpoint.iteritems():
+                index = day - first_day
+                if 0 <= index <= day_count:
+                    day_checkpoint.bucket_volumes[bucket.name] = \
+                        find_volumes(arrays, index, volumes)
+    return bucket2outcome
+
+def find_initial_volumes(bucket_layers, checkpoint):
+    """Return the volumes of the given BucketLayers at the start of a computation.
+
+    This method returns the pair (volume of the upper layer, volume of the
+    lower layer) as stored in the given Checkpoint. If the given Checkpoint is
+    None or does not contain the volumes of the bucket, this method returns
+    the volumes at the initial water level of each layer.
+
+    """
+    if checkpoint is not None:
+        if bucket_layers.lower.name in checkpoint.bucket_volumes:
+            return checkpoint.bucket_volumes[bucket_layers.lower.name]
+        logger.warning("Checkpoint %s does not contain the volumes of bucket %s, "
+                       "the bucket is computed from its initial water level",
+                       checkpoint, bucket_layers.lower.name)
+    if bucket_layers.upper is None:
+        return None, compute_initial_volume(bucket_layers.lower)
+    return compute_initial_volume(bucket_layers.upper), \
+        compute_initial_volume(bucket_layers.lower)
+
+def find_volumes(arrays, index, initial_volumes):
+    """Return the volumes of a bucket at the start of the day at the given index.
+
+    Parameters:
+    * arrays -- tuple of arrays as returned by compute_multiple_layers
+    * index -- index of the day, which can be the index after the last day
+    * initial_volumes -- volumes of the bucket at the start of the first day
+
+    """
+    if index == 0:
+        return initial_volumes
+    upper_volume, lower_volume = initial_volumes
+    if upper_volume is None:
+        return None, float(arrays[0][index - 1])
+    return float(arrays[0][index - 1]), float(arrays[5][index - 1])
+
+def split_list(items, count):
+    """Return the given list split into at most count consecutive sublists.
+
+    The lengths of the sublists differ at most 1 and none of them is empty.
+
+    """
+    count = max(1, min(count, len(items)))
+    size, remainder = divmod(len(items), count)
+    sublists = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < remainder else 0)
+        sublists.append(items[start:end])
+        start = end
+    return sublists
+
+def compute_multiple_layers(bucket_layers, precipitation, evaporation, seepage,
+                            initial_volumes=None):
+    """Compute and return the waterbalance arrays of the given buckets.
+
+    This method returns the list that contains for each BucketLayers in the
+    given list the quintuple of arrays (storage, flow off, net drainage,
+    seepage, net precipitation) that compute_multiple_timeseries stores in a
+    BucketOutcome, followed by the array of the storage of the lower layer.
+    That last array is None for a bucket that consists of a single layer.
+
+    Parameters:
+    * bucket_layers -- list of BucketLayers of the buckets to compute
+    * precipitation -- array of the daily precipitation in [mm/day]
+    * evaporation -- array of the daily evaporation in [mm/day]
+    * seepage -- list of the array of the daily seepage in [mm/day], one array
+      per BucketLayers
+    * initial_volumes -- list of the pair (volume of the upper layer, volume
+      of the lower layer) at the start of the first day, one pair per
+      BucketLayers, or None to start from the initial water levels
+
+    The given arrays of precipitation, evaporation and seepage should span the
+    same range of days. The computation is done in two steps. The first step
+    computes the undrained buckets and the upper layer of the hardened and
+    drained buckets. The second step computes the lower layer of the hardened
+    and drained buckets, as the lower layer of a drained bucket depends on the
+    outcome of its upper layer.
+
+    As this method only depends on its parameters, it can be executed in
+    another process.
+
+    """
+    day_count = len(precipitation)
+
+    # first step
+    if initial_volumes is None:
+        upper_volume, lower_volume = None, None
+    else:
+        upper_volume = [upper if layers_of_bucket.upper is not None else lower
+                        for layers_of_bucket, (upper, lower) in
+                        zip(bucket_layers, initial_volumes)]
+        lower_volume = [lower for layers_of_bucket, (upper, lower) in
+                        zip(bucket_layers, initial_volumes)
+                        if layers_of_bucket.upper is not None]
+
+    layers = []
+    allow_below_minimum_storage = []
+    seepage_columns = []
+    for index, layers_of_bucket in enumerate(bucket_layers):
+        if layers_of_bucket.upper is None:
+            layers.append(layers_of_bucket.lower)
+            allow_below_minimum_storage.append(True)
+            seepage_columns.append(seepage[index])
+        else:
+            # the upper bucket does not have seepage and the storage of the
+            # upper bucket of a hardened surface can not be below the minimum
+            # storage
+            layers.append(layers_of_bucket.upper)
+            allow_below_minimum_storage.append(
+                layers_of_bucket.surface_type != BucketTypes.HARDENED_SURFACE)
+            seepage_columns.append(numpy.zeros(day_count))
+
+    upper_arrays = compute_multiple_arrays(create_parameter_matrix(layers),
+        numpy.repeat(precipitation[:, numpy.newaxis], len(bucket_layers), axis=1),
+        numpy.repeat(evaporation[:, numpy.newaxis], len(bucket_layers), axis=1),
+        numpy.column_stack(seepage_columns),
+        numpy.array(allow_below_minimum_storage),
+        upper_volume)
+
+    result = [None] * len(bucket_layers)
+    layered_indices = []
+    for index, layers_of_bucket in enumerate(bucket_layers):
+        if layers_of_bucket.upper is None:
+            result[index] = [array[:, index] for array in upper_arrays] + [None]
+        else:
+            layered_indices.append(index)
+    if len(layered_indices) == 0:
+        return result
+
+    # second step
+    layers = []
+    lower_precipitation = []
+    for index in layered_indices:
+        layers_of_bucket = bucket_layers[index]
+        layers.append(layers_of_bucket.lower)
+        if layers_of_bucket.surface_type == BucketTypes.HARDENED_SURFACE:
+            # the lower bucket of a hardened surface does not have
+            # precipitation, evaporation and does not have flow off
+            lower_precipitation.append(numpy.zeros(day_count))
+        else:
+            # the lower bucket of a drained surface receives the flow off and
+            # the drainage of the upper bucket as precipitation, see
+            # compute_timeseries_on_drained_surface
+            upper_net_drainage = upper_arrays[2][:, index]
+            drainage = numpy.where(upper_net_drainage > 0, 0.0, upper_net_drainage)
+            flow = upper_arrays[1][:, index] + drainage
+            lower_precipitation.append(flow * (-1000.0 / layers_of_bucket.lower.surface))
+
+    shape = (day_count, len(layered_indices))
+    lower_arrays = compute_multiple_arrays(create_parameter_matrix(layers),
+        numpy.column_stack(lower_precipitation),
+        numpy.zeros(shape),
+        numpy.column_stack([seepage[index] for index in layered_indices]),
+        numpy.ones(len(layered_indices), dtype=bool),
+        lower_volume)
+
+    for lower_index, index in enumerate(layered_indices):
+        result[index] = [
+            upper_arrays[0][:, index],
+            upper_arrays[1][:, index],
+            lower_arrays[1][:, lower_index] + lower_arrays[2][:, lower_index],
+            lower_arrays[3][:, lower_index],
+            upper_arrays[4][:, index],
+            lower_arrays[0][:, lower_index]]
+    return result
+
+
 class BucketComputer:
 
-    def __init__(self, bucket_computers=None):
+    def __init__(self, bucket_computers=None, use_arrays=False):
+        """Set the functions to compute the BucketOutcome of each bucket type.
+
+        If the caller does not supply these functions, the BucketComputer
+        uses the default functions. When use_arrays holds, these default
+        functions compute the waterbalance of a bucket using arrays instead of
+        event by event, which is a lot faster for long periods. Both ways
+        result in the same BucketOutcome. When use_arrays holds, method
+        compute_buckets also computes all buckets of an area in one go.
+
+        """
         if bucket_computers is None:
+            if use_arrays:
+                timeseries_computer = compute_timeseries_with_arrays
+            else:
+                timeseries_computer = compute_timeseries
             self.bucket_computers = {}
-            self.bucket_computers[BucketTypes.UNDRAINED_SURFACE] = compute_timeseries
-            self.bucket_computers[BucketTypes.STEDELIJK_SURFACE] = compute_timeseries
-            self.bucket_computers[BucketTypes.HARDENED_SURFACE] = compute_timeseries_on_hardened_surface
-            self.bucket_computers[BucketTypes.DRAINED_SURFACE] = compute_timeseries_on_drained_surface
+            self.bucket_computers[BucketTypes.UNDRAINED_SURFACE] = timeseries_computer
+            self.bucket_computers[BucketTypes.STEDELIJK_SURFACE] = timeseries_computer
+            self.bucket_computers[BucketTypes.HARDENED_SURFACE] = \
+                partial(compute_timeseries_on_hardened_surface, compute_timeseries=timeseries_computer)
+            self.bucket_computers[BucketTypes.DRAINED_SURFACE] = \
+                partial(compute_timeseries_on_drained_surface, compute_timeseries=timeseries_computer)
         else:
             self.bucket_computers = bucket_computers
+        self.uses_default_computers = bucket_computers is None
+        self.computes_in_batch = use_arrays and self.uses_default_computers
 
     def compute(self, bucket, precipitation, evaporation, seepage, sewer=None):
         """Compute and return the BucketOutcome for the given bucket.
@@ -399,3 +724,48 @@ class BucketComputer:
             result = compute_timeseries_predefined(bucket)
 
         return result
+
+    def compute_buckets(self, buckets, precipitation, evaporation, bucket2seepage, bucket2sewer,
+                        executor=None, chunk_count=1, checkpoint=None, checkpoints=None):
+        """Compute and return the dictionary of Bucket to BucketOutcome.
+
+        Parameters precipitation and evaporation are time series.
+        Parameters bucket2seepage and bucket2sewer are dictionaries of Bucket
+        to time series.
+
+        When the current BucketComputer uses arrays and the default functions,
+        this method computes the buckets with an undrained, hardened or
+        drained surface using compute_multiple_timeseries. It computes the
+        other buckets one by one using method compute.
+
+        When an executor is given and the current BucketComputer uses the
+        default functions, compute_multiple_timeseries computes the buckets
+        using that executor in at most chunk_count tasks.
+
+        The given Checkpoint and list of Checkpoint(s) are passed to
+        compute_multiple_timeseries, so the buckets are computed using that
+        function when the current BucketComputer uses the default functions.
+        Other functions cannot start from or fill a Checkpoint.
+
+        """
+        uses_checkpoints = checkpoint is not None or checkpoints is not None
+        if uses_checkpoints and not self.uses_default_computers:
+            logger.warning("The bucket computers cannot use checkpoints, the "
+                           "buckets are computed from their initial state")
+        computes_in_batch = self.computes_in_batch or \
+            ((executor is not None or uses_checkpoints) and self.uses_default_computers)
+        bucket2outcome = {}
+        multiple_buckets = []
+        for bucket in buckets:
+            if computes_in_batch and bucket.is_computed and bucket.surface > 0 and \
+               bucket.surface_type != BucketTypes.STEDELIJK_SURFACE:
+                multiple_buckets.append(bucket)
+            else:
+                bucket2outcome[bucket] = self.compute(bucket, precipitation,
+                    evaporation, bucket2seepage[bucket], bucket2sewer[bucket])
+        if len(multiple_buckets) > 0:
+            logger.debug('calculate bucket outcome for %d buckets', len(multiple_buckets))
+            bucket2outcome.update(compute_multiple_timeseries(multiple_buckets,
+                precipitation, evaporation, bucket2seepage, executor, chunk_count,
+                checkpoint, checkpoints))
+        return bucket2outcome
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from collections import namedtuple
+
+from lizard_wbcomputation.bucket_arrays import PARAMETER_NAMES
+from lizard_wbcomputation.bucket_types import BucketTypes
+
+logger = logging.getLogger(__name__)
+
+# dictionary of the name of a bottom attribute of a bucket to the name of the
+# corresponding upper attribute
+UPPER_PARAMETER_NAMES = {
+    'bottom_porosity': 'porosity',
+    'bottom_drainage_fraction': 'drainage_fraction',
+    'bottom_indraft_fraction': 'indraft_fraction',
+    'bottom_max_water_level': 'max_water_level',
+    'bottom_min_water_level': 'min_water_level',
+    'bottom_equi_water_level': 'equi_water_level',
+    'bottom_init_water_level': 'init_water_level',
+    }
+
+
+class BucketLayer(namedtuple('BucketLayer', ['name'] + PARAMETER_NAMES)):
+    """Stores the parameters of a single layer of a bucket.
+
+    A BucketLayer cannot be modified and does not have an instance dictionary.
+    It uses the same attribute names as a bucket, so the functions that
+    compute the waterbalance of a bucket can compute the waterbalance of a
+    BucketLayer. The upper layer of a bucket uses the bottom attribute names
+    for its upper attributes.
+
+    As a BucketLayer is immutable, the same BucketLayer can be used by
+    multiple computations at the same time, even in other threads or (as it
+    can be pickled) in other processes.
+
+    """
+    __slots__ = ()
+
+
+class BucketLayers(namedtuple('BucketLayers', ['surface_type', 'upper', 'lower'])):
+    """Stores the surface type and the upper and lower BucketLayer of a bucket.
+
+    The upper layer is None for a bucket that consists of a single layer.
+
+    """
+    __slots__ = ()
+
+
+def create_lower_layer(bucket):
+    """Return the BucketLayer of the bottom attributes of the given bucket."""
+    values = dict((name, getattr(bucket, name)) for name in PARAMETER_NAMES)
+    return BucketLayer(name=bucket.name, **values)
+
+
+def create_upper_layer(bucket):
+    """Return the BucketLayer of the upper attributes of the given bucket."""
+    values = dict((name, getattr(bucket, UPPER_PARAMETER_NAMES.get(name, name)))
+                  for name in PARAMETER_NAMES)
+    return BucketLayer(name=bucket.name, **values)
+
+
+def create_hardened_layers(bucket):
+    """Return the BucketLayers of the given bucket with a hardened surface.
+
+    The porosity of the upper layer is always 1.0 and the minimum water level
+    of the upper layer is 0.0 when it is not set.
+
+    """
+    upper = create_upper_layer(bucket)._replace(bottom_porosity=1.0)
+    if upper.bottom_min_water_level is None:
+        logger.warning("Warning, minimum level is not set for %s, default value 0 taken for calculation (level below minimum level is not allowed for this bucket type)", bucket.name)
+        upper = upper._replace(bottom_min_water_level=0.0)
+    return BucketLayers(BucketTypes.HARDENED_SURFACE, upper, create_lower_layer(bucket))
+
+
+def create_drained_layers(bucket):
+    """Return the BucketLayers of the given bucket with a drained surface.
+
+    The crop evaporation factors of the lower layer are always 1.0.
+
+    """
+    lower = create_lower_layer(bucket)._replace(crop_evaporation_factor=1,
+                                                min_crop_evaporation_factor=1)
+    return BucketLayers(BucketTypes.DRAINED_SURFACE, create_upper_layer(bucket), lower)
+
+
+def create_bucket_layers(bucket):
+    """Return the BucketLayers of the given bucket.
+
+    The layers depend on the surface type of the given bucket. A bucket with
+    a hardened or drained surface has two layers, a bucket with another
+    surface type only has a lower layer.
+
+    """
+    if bucket.surface_type == BucketTypes.HARDENED_SURFACE:
+        layers = create_hardened_layers(bucket)
+    elif bucket.surface_type == BucketTypes.DRAINED_SURFACE:
+        layers = create_drained_layers(bucket)
+    else:
+        layers = BucketLayers(bucket.surface_type, None, create_lower_layer(bucket))
+    return layers
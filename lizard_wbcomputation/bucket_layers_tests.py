@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays import PARAMETER_NAMES
+from lizard_wbcomputation.bucket_arrays_tests import Bucket
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.bucket_computer import compute
+from lizard_wbcomputation.bucket_computer import compute_timeseries_on_drained_surface
+from lizard_wbcomputation.bucket_computer import compute_timeseries_on_hardened_surface
+from lizard_wbcomputation.bucket_layers import create_bucket_layers
+from lizard_wbcomputation.bucket_types import BucketTypes
+
+
+def bucket_values(bucket):
+    return dict(vars(bucket))
+
+
+class create_bucket_layers_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test the upper layer of a hardened surface."""
+        bucket = Bucket()
+        bucket.surface_type = BucketTypes.HARDENED_SURFACE
+        layers = create_bucket_layers(bucket)
+        self.assertEqual(1.0, layers.upper.bottom_porosity)
+        self.assertEqual(bucket.max_water_level, layers.upper.bottom_max_water_level)
+        self.assertEqual(bucket.crop_evaporation_factor, layers.upper.crop_evaporation_factor)
+        self.assertEqual(bucket.bottom_max_water_level, layers.lower.bottom_max_water_level)
+
+    def test_b(self):
+        """Test the lower layer of a drained surface."""
+        bucket = Bucket()
+        bucket.surface_type = BucketTypes.DRAINED_SURFACE
+        layers = create_bucket_layers(bucket)
+        self.assertEqual(bucket.porosity, layers.upper.bottom_porosity)
+        self.assertEqual(1, layers.lower.crop_evaporation_factor)
+        self.assertEqual(1, layers.lower.min_crop_evaporation_factor)
+        self.assertEqual(bucket.bottom_porosity, layers.lower.bottom_porosity)
+
+    def test_c(self):
+        """Test a bucket with an undrained surface only has a lower layer."""
+        bucket = Bucket()
+        bucket.surface_type = BucketTypes.UNDRAINED_SURFACE
+        layers = create_bucket_layers(bucket)
+        self.assertEqual(None, layers.upper)
+        for name in PARAMETER_NAMES:
+            self.assertEqual(getattr(bucket, name), getattr(layers.lower, name))
+
+    def test_d(self):
+        """Test the layers can be pickled."""
+        bucket = Bucket()
+        bucket.surface_type = BucketTypes.DRAINED_SURFACE
+        layers = create_bucket_layers(bucket)
+        self.assertEqual(layers, pickle.loads(pickle.dumps(layers, 2)))
+
+
+class compute_layered_timeseries_TestSuite(TestCase):
+
+    def setUp(self):
+        start = datetime(2011, 1, 1)
+        self.precipitation = create_timeseries(start, [(day * 7) % 23 for day in range(40)])
+        self.evaporation = create_timeseries(start, [(day * 3) % 5 for day in range(40)])
+        self.seepage = create_timeseries(start, [((day * 5) % 11) - 5 for day in range(40)])
+
+    def test_a(self):
+        """Test the computation of a hardened surface does not modify the bucket."""
+        bucket = Bucket()
+        expected_values = bucket_values(bucket)
+        compute_timeseries_on_hardened_surface(bucket, self.precipitation,
+            self.evaporation, self.seepage, compute)
+        self.assertEqual(expected_values, bucket_values(bucket))
+
+    def test_b(self):
+        """Test the computation of a drained surface does not modify the bucket."""
+        bucket = Bucket()
+        expected_values = bucket_values(bucket)
+        compute_timeseries_on_drained_surface(bucket, self.precipitation,
+            self.evaporation, self.seepage, compute)
+        self.assertEqual(expected_values, bucket_values(bucket))
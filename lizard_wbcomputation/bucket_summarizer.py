@@ -26,6 +26,12 @@
 #
 #******************************************************************************
 
+from bisect import bisect_left
+from datetime import timedelta
+
+import numpy
+
+from lizard_wbcomputation.bucket_arrays import align_events
 from lizard_wbcomputation.bucket_types import BucketTypes
 
 from timeseries.timeseriesstub import SparseTimeseriesStub
@@ -196,8 +202,70 @@ class BucketSummarizer:
         return sum
 
 
+def summation_order(buckets):
+    """Return the given buckets in the order in which BucketSummarizer sums them.
+
+    BucketSummarizer iterates over a dictionary that is filled with the given
+    buckets in the given order. To be able to compute the same sums, this
+    function returns the buckets in the order of such a dictionary.
+
+    """
+    bucket2daily_outcome = {}
+    for bucket in buckets:
+        bucket2daily_outcome[bucket] = None
+    return bucket2daily_outcome.keys()
+
+def create_surface_type_masks(buckets):
+    """Return the dictionary of sum name to the buckets mask of that sum.
+
+    Each mask is a boolean array that specifies for each of the given buckets
+    whether BucketSummarizer includes its outcome in the sum.
+
+    """
+    surface_types = numpy.array([bucket.surface_type for bucket in buckets])
+    is_hardened = surface_types == BucketTypes.HARDENED_SURFACE
+    is_drained = surface_types == BucketTypes.DRAINED_SURFACE
+    is_undrained = surface_types == BucketTypes.UNDRAINED_SURFACE
+    return {'hardened': is_hardened,
+            'drained': is_drained,
+            'undrained': is_hardened | is_undrained,
+            'flow_off': is_undrained,
+            'indraft': is_undrained | is_hardened | is_drained,
+            'sewer': surface_types == BucketTypes.STEDELIJK_SURFACE}
+
+def sum_columns(day_count, *masked_columns):
+    """Return the daily sum of the selected columns of the given matrices.
+
+    Each element of masked_columns is a pair of a (days x buckets) matrix and
+    the mask of the columns of that matrix to add. The columns are added one
+    by one and for each bucket, the selected column of each matrix is added
+    in the order of the pairs. In this way, each daily sum is computed in the
+    same order as BucketSummarizer computes it, which results in the same
+    value.
+
+    """
+    total = numpy.zeros(day_count)
+    bucket_count = len(masked_columns[0][1])
+    for index in xrange(bucket_count):
+        for matrix, mask in masked_columns:
+            if mask[index]:
+                total = total + matrix[:, index]
+    return total
+
+
 class BucketsSummarizer:
     """Computes the BucketSummary from the outcome of each bucket."""
+    def __init__(self, use_arrays=False):
+        """Set whether to compute the BucketSummary using arrays.
+
+        When use_arrays holds, method compute does not create a
+        BucketSummarizer for every day but computes each time series of the
+        BucketSummary for all days in one go. Both ways result in the same
+        BucketSummary.
+
+        """
+        self.use_arrays = use_arrays
+
     def compute(self, bucket2outcome, start_date, end_date):
         """Returns the BucketsSummary of the given buckets.
 
@@ -205,6 +273,9 @@ class BucketsSummarizer:
         * bucket2outcome --dictionary of Bucket to BucketOutcome
 
         """
+        if self.use_arrays:
+            return self.compute_with_arrays(bucket2outcome, start_date, end_date)
+
         buckets_summary = BucketsSummary()
         for date, bucket2daily_outcome in total_daily_bucket_outcome(bucket2outcome):
             if date < start_date:
@@ -223,3 +294,70 @@ class BucketsSummarizer:
             buckets_summary.indraft.add_value(date, daily_summary['indraft'])
             buckets_summary.sewer.add_value(date, daily_summary['sewer'])
         return buckets_summary
+
+    def compute_with_arrays(self, bucket2outcome, start_date, end_date):
+        """Returns the BucketsSummary of the given buckets using arrays.
+
+        This method stores the daily flow off and net drainage of the buckets
+        in two (days x buckets) matrices and computes each time series of the
+        BucketsSummary from the masked columns of these matrices.
+
+        Parameters:
+        * bucket2outcome --dictionary of Bucket to BucketOutcome
+
+        """
+        buckets_summary = BucketsSummary()
+        if len(bucket2outcome) == 0:
+            return buckets_summary
+
+        outcomes = bucket2outcome.items()
+        interesting_timeseries = []
+        for bucket, outcome in outcomes:
+            interesting_timeseries.append(outcome.flow_off)
+            interesting_timeseries.append(outcome.net_drainage)
+        first_date, arrays = align_events(*interesting_timeseries)
+        if first_date is None:
+            return buckets_summary
+
+        buckets = summation_order(bucket for (bucket, outcome) in outcomes)
+        bucket2index = dict((bucket, index) for (index, (bucket, outcome)) in enumerate(outcomes))
+        columns = [bucket2index[bucket] for bucket in buckets]
+        flow_off = numpy.column_stack([arrays[index * 2] for index in columns])
+        net_drainage = numpy.column_stack([arrays[index * 2 + 1] for index in columns])
+
+        dates = [first_date + timedelta(day) for day in xrange(len(flow_off))]
+        start = bisect_left(dates, start_date)
+        end = max(start, bisect_left(dates, end_date))
+        if start == end:
+            return buckets_summary
+        flow_off = flow_off[start:end]
+        net_drainage = net_drainage[start:end]
+        day_count = end - start
+
+        negative_net_drainage = numpy.where(net_drainage < 0, net_drainage, 0.0)
+        positive_net_drainage = numpy.where(net_drainage > 0, net_drainage, 0.0)
+
+        # see BucketSummarizer.compute for the reason to negate the sums
+        masks = create_surface_type_masks(buckets)
+        hardened = -sum_columns(day_count, (flow_off, masks['hardened']))
+        drained = -sum_columns(day_count, (flow_off, masks['drained']),
+                               (negative_net_drainage, masks['drained']))
+        undrained = -sum_columns(day_count, (negative_net_drainage, masks['undrained']))
+        flow_off_sum = -sum_columns(day_count, (flow_off, masks['flow_off']))
+        indraft = -sum_columns(day_count, (positive_net_drainage, masks['indraft']))
+        sewer = -sum_columns(day_count, (negative_net_drainage, masks['sewer']))
+        total_outgoing = hardened + drained + undrained + flow_off_sum + sewer
+        total_incoming = indraft
+        totals = total_outgoing + total_incoming
+
+        first_date = dates[start]
+        buckets_summary.totals = SparseTimeseriesStub(first_date, totals.tolist())
+        buckets_summary.total_outgoing = SparseTimeseriesStub(first_date, total_outgoing.tolist())
+        buckets_summary.total_incoming = SparseTimeseriesStub(first_date, total_incoming.tolist())
+        buckets_summary.hardened = SparseTimeseriesStub(first_date, hardened.tolist())
+        buckets_summary.drained = SparseTimeseriesStub(first_date, drained.tolist())
+        buckets_summary.undrained = SparseTimeseriesStub(first_date, undrained.tolist())
+        buckets_summary.flow_off = SparseTimeseriesStub(first_date, flow_off_sum.tolist())
+        buckets_summary.indraft = SparseTimeseriesStub(first_date, indraft.tolist())
+        buckets_summary.sewer = SparseTimeseriesStub(first_date, sewer.tolist())
+        return buckets_summary
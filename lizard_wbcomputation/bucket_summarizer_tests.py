@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.bucket_computer import BucketOutcome
+from lizard_wbcomputation.bucket_summarizer import BucketsSummarizer
+from lizard_wbcomputation.bucket_types import BucketTypes
+
+
+class Bucket(object):
+
+    def __init__(self, surface_type):
+        self.surface_type = surface_type
+
+
+class BucketsSummarizer_TestSuite(TestCase):
+
+    def setUp(self):
+        self.start = datetime(2011, 1, 1)
+        self.bucket2outcome = {}
+        surface_types = [BucketTypes.UNDRAINED_SURFACE,
+                         BucketTypes.HARDENED_SURFACE,
+                         BucketTypes.DRAINED_SURFACE,
+                         BucketTypes.STEDELIJK_SURFACE] * 3
+        for index, surface_type in enumerate(surface_types):
+            outcome = BucketOutcome()
+            outcome.flow_off = create_timeseries(self.start,
+                [-((day * 7 + index) % 13) / 3.0 for day in range(60)])
+            outcome.net_drainage = create_timeseries(self.start,
+                [((day * 5 + index) % 11 - 5) / 7.0 for day in range(60 + index)])
+            self.bucket2outcome[Bucket(surface_type)] = outcome
+
+    def assert_same_summary(self, start_date, end_date):
+        expected_summary = BucketsSummarizer().compute(self.bucket2outcome,
+                                                       start_date, end_date)
+        summary = BucketsSummarizer(use_arrays=True).compute(self.bucket2outcome,
+                                                             start_date, end_date)
+        for name in ['totals', 'total_incoming', 'total_outgoing', 'hardened',
+                     'drained', 'undrained', 'flow_off', 'indraft', 'sewer']:
+            self.assertEqual(list(getattr(expected_summary, name).events()),
+                             list(getattr(summary, name).events()))
+
+    def test_a(self):
+        """Test the array summary is equal to the daily summary."""
+        self.assert_same_summary(self.start, datetime(2012, 1, 1))
+
+    def test_b(self):
+        """Test the array summary only contains the days of the given period."""
+        self.assert_same_summary(datetime(2011, 1, 10), datetime(2011, 2, 5))
+
+    def test_c(self):
+        """Test the array summary of a period without days."""
+        self.assert_same_summary(datetime(2012, 1, 10), datetime(2012, 2, 5))
+
+    def test_d(self):
+        """Test the array summary when there are no buckets."""
+        self.bucket2outcome = {}
+        self.assert_same_summary(self.start, datetime(2012, 1, 1))
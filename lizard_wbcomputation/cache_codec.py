@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import cPickle as pickle
+import struct
+import zlib
+
+from collections import namedtuple
+
+import numpy
+
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from lizard_wbcomputation.daily_timeseries import find_daily_timeseries
+from timeseries.timeseriesstub import SparseTimeseriesStub
+
+# first bytes of each encoded value, to recognize the format
+MAGIC = 'WBC1'
+
+# maximum number of bytes of a single chunk, which keeps each chunk below the
+# default limit of 1 MB that memcached imposes on a single value
+MAX_CHUNK_BYTES = 1000 * 1000
+
+# level of the zlib compression of the block of values
+COMPRESSION_LEVEL = 6
+
+
+class ArrayReference(namedtuple('ArrayReference', ['first_date', 'start', 'stop'])):
+    """Refers to the values of a daily time series in the block of values.
+
+    The values of the daily time series are the values from index start up
+    to index stop of the block.
+
+    """
+    __slots__ = ()
+
+
+class ArrayBlock(object):
+    """Collects the values of the daily time series of a value to encode."""
+
+    def __init__(self):
+        self.arrays = []
+        self.size = 0
+
+    def add(self, values):
+        """Add the given values and return their range (start, stop) in the block."""
+        start = self.size
+        self.arrays.append(numpy.asarray(values, dtype=float))
+        self.size += len(values)
+        return start, self.size
+
+    def tostring(self):
+        """Return the values as a string of little-endian float64."""
+        if len(self.arrays) == 0:
+            return ''
+        return numpy.concatenate(self.arrays).astype('<f8').tostring()
+
+
+def find_daily_values(timeseries):
+    """Return the pair (first date, values) of the given daily time series.
+
+    This function recognizes a (restricted) DailyTimeseries and a
+    SparseTimeseriesStub, which both store a value for each day from their
+    first date. For any other value it returns None.
+
+    """
+    daily_timeseries = find_daily_timeseries(timeseries)
+    if daily_timeseries is not None:
+        return daily_timeseries.first_date, daily_timeseries.values
+    if type(timeseries) is SparseTimeseriesStub:
+        return timeseries.first_date, timeseries.values
+    return None
+
+
+def replace_timeseries(value, block):
+    """Return the given value with each daily time series replaced.
+
+    This function adds the values of each daily time series to the given
+    ArrayBlock and replaces the time series by its ArrayReference. It looks
+    for time series in (nested) dictionaries, lists and tuples.
+
+    """
+    daily_values = find_daily_values(value)
+    if daily_values is not None:
+        first_date, values = daily_values
+        start, stop = block.add(values)
+        return ArrayReference(first_date, start, stop)
+    if type(value) is dict:
+        return dict((key, replace_timeseries(item, block))
+                    for key, item in value.iteritems())
+    if type(value) in (list, tuple):
+        return type(value)(replace_timeseries(item, block) for item in value)
+    return value
+
+
+def restore_timeseries(value, values):
+    """Return the given value with each ArrayReference replaced.
+
+    Each ArrayReference is replaced by a DailyTimeseries whose values are
+    the referenced values of the given array.
+
+    """
+    if isinstance(value, ArrayReference):
+        return DailyTimeseries(value.first_date, values[value.start:value.stop])
+    if type(value) is dict:
+        return dict((key, restore_timeseries(item, values))
+                    for key, item in value.iteritems())
+    if type(value) in (list, tuple):
+        return type(value)(restore_timeseries(item, values) for item in value)
+    return value
+
+
+def encode(value):
+    """Return the given value encoded as a string.
+
+    The encoded value consists of a header and a compressed block of values.
+    The header is the pickled value in which each daily time series is
+    replaced by a reference to its values in the block, see
+    replace_timeseries. The block contains the values of all daily time
+    series as float64.
+
+    """
+    block = ArrayBlock()
+    header = pickle.dumps(replace_timeseries(value, block), pickle.HIGHEST_PROTOCOL)
+    return ''.join([MAGIC, struct.pack('<I', len(header)), header,
+                    zlib.compress(block.tostring(), COMPRESSION_LEVEL)])
+
+
+def decode(data):
+    """Return the value that was encoded as the given string.
+
+    Each daily time series of the encoded value is decoded as a
+    DailyTimeseries. The values of these time series share a single array,
+    which is copied from the decompressed block in one go.
+
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError("Data has not been encoded by cache_codec.encode")
+    offset = len(MAGIC)
+    header_size, = struct.unpack('<I', data[offset:offset + 4])
+    offset += 4
+    header = data[offset:offset + header_size]
+    block = zlib.decompress(data[offset + header_size:])
+    values = numpy.frombuffer(bytearray(block), dtype='<f8')
+    return restore_timeseries(pickle.loads(header), values)
+
+
+def split_chunks(data, chunk_size=MAX_CHUNK_BYTES):
+    """Return the list of consecutive parts of at most chunk_size bytes.
+
+    The returned list contains at least one part, even for an empty string.
+
+    """
+    return [data[index:index + chunk_size]
+            for index in range(0, max(len(data), 1), chunk_size)]
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from datetime import datetime
+from datetime import timedelta
+from unittest import TestCase
+
+from lizard_wbcomputation.cache_codec import decode
+from lizard_wbcomputation.cache_codec import encode
+from lizard_wbcomputation.cache_codec import split_chunks
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from timeseries.timeseriesstub import SparseTimeseriesStub
+from timeseries.timeseriesstub import TimeseriesStub
+
+
+class encode_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test the events of a daily time series survive the encoding."""
+        first_date = datetime(2011, 1, 1)
+        timeseries = SparseTimeseriesStub(first_date, [float(day) for day in range(400)])
+        decoded = decode(encode(timeseries))
+        self.assertTrue(isinstance(decoded, DailyTimeseries))
+        self.assertEqual(list(timeseries.events()), list(decoded.events()))
+
+    def test_b(self):
+        """Test the structure of nested dictionaries and tuples survives the encoding."""
+        first_date = datetime(2011, 1, 1)
+        value = ({'intake': DailyTimeseries(first_date, [1.0, 2.0]),
+                  'pump': SparseTimeseriesStub(first_date + timedelta(1), [3.0])},
+                 [DailyTimeseries(), 'label'])
+        decoded = decode(encode(value))
+        self.assertEqual(tuple, type(decoded))
+        self.assertEqual([(first_date, 1.0), (first_date + timedelta(1), 2.0)],
+                         list(decoded[0]['intake'].events()))
+        self.assertEqual([(first_date + timedelta(1), 3.0)],
+                         list(decoded[0]['pump'].events()))
+        self.assertEqual([], list(decoded[1][0].events()))
+        self.assertEqual('label', decoded[1][1])
+
+    def test_c(self):
+        """Test a time series that is not daily is pickled as is."""
+        timeseries = TimeseriesStub((datetime(2011, 1, 1), 1.0),
+                                    (datetime(2011, 2, 1), 2.0))
+        decoded = decode(encode({'ts': timeseries}))
+        self.assertEqual(list(timeseries.events()), list(decoded['ts'].events()))
+
+    def test_d(self):
+        """Test a decoded time series can be extended without changing the others."""
+        first_date = datetime(2011, 1, 1)
+        decoded = decode(encode([DailyTimeseries(first_date, [1.0]),
+                                 DailyTimeseries(first_date, [2.0])]))
+        decoded[0].add_value(first_date + timedelta(1), 5.0)
+        self.assertEqual([1.0, 5.0], decoded[0].values.tolist())
+        self.assertEqual([2.0], decoded[1].values.tolist())
+
+
+class split_chunks_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test the chunks have at most the given size and join to the data."""
+        chunks = split_chunks('abcdefg', 3)
+        self.assertEqual(['abc', 'def', 'g'], chunks)
+
+    def test_b(self):
+        """Test empty data results in a single empty chunk."""
+        self.assertEqual([''], split_chunks('', 3))
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+
+
+class Checkpoint(object):
+    """Stores the state of a waterbalance computation at the start of a day.
+
+    The computations of the buckets, the level control, the fractions and the
+    chloride concentration each depend on the state at the end of the
+    previous day. A Checkpoint stores that state, so a computation can be
+    restarted at the date of the Checkpoint instead of at the start date of
+    the original computation. A restarted computation computes the same
+    values as the original computation from that date on.
+
+    Instance variables:
+      *date*
+        date of the day at whose start the state holds
+      *bucket_volumes*
+        dictionary of bucket name to the pair (volume of the upper layer,
+        volume of the lower layer) in [m3], where the volume of the upper
+        layer is None for a bucket that consists of a single layer
+      *water_level*
+        water level of the open water in [m]
+      *fractions*
+        dictionary of the name of each fraction to its value, where name
+        'intakes' maps to the dictionary of intake name to its fraction
+      *storage*
+        storage of the open water in [m3] that the fractions refer to
+      *chloride*
+        pair (chloride concentration in [g/m3], volume in [m3]) of the open
+        water
+
+    The state of a computation that has not been done is None, or an empty
+    dictionary for the bucket volumes. As buckets and intakes are often
+    recreated from the database, the Checkpoint refers to them by name.
+
+    """
+    def __init__(self, date):
+        self.date = date
+        self.bucket_volumes = {}
+        self.water_level = None
+        self.fractions = None
+        self.storage = None
+        self.chloride = None
+
+    def __repr__(self):
+        return "Checkpoint(%s)" % self.date.strftime('%Y-%m-%d')
+
+
+def map_checkpoints(checkpoints):
+    """Return the dictionary of day ordinal to Checkpoint of the given ones.
+
+    A computation uses this function to find the Checkpoint(s) that it has
+    to fill. When None is given, this function returns an empty dictionary.
+
+    """
+    if checkpoints is None:
+        return {}
+    return dict((checkpoint.date.toordinal(), checkpoint) for checkpoint in checkpoints)
+
+
+def find_checkpoint(checkpoints, date):
+    """Return the last of the given Checkpoint(s) that is not after the date.
+
+    When no such Checkpoint exists, this function returns None.
+
+    """
+    found = None
+    for checkpoint in checkpoints:
+        if checkpoint.date <= date:
+            if found is None or found.date < checkpoint.date:
+                found = checkpoint
+    return found
+
+
+def save_checkpoints(file_name, checkpoints):
+    """Store the given list of Checkpoint(s) in the file with the given name."""
+    checkpoint_file = open(file_name, 'wb')
+    try:
+        pickle.dump(checkpoints, checkpoint_file, pickle.HIGHEST_PROTOCOL)
+    finally:
+        checkpoint_file.close()
+
+
+def load_checkpoints(file_name):
+    """Return the list of Checkpoint(s) stored in the file with the given name."""
+    checkpoint_file = open(file_name, 'rb')
+    try:
+        return pickle.load(checkpoint_file)
+    finally:
+        checkpoint_file.close()
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays_tests import Bucket
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.bucket_computer import compute_multiple_timeseries
+from lizard_wbcomputation.bucket_types import BucketTypes
+from lizard_wbcomputation.checkpoint import Checkpoint
+from lizard_wbcomputation.checkpoint import find_checkpoint
+from lizard_wbcomputation.checkpoint import load_checkpoints
+from lizard_wbcomputation.checkpoint import save_checkpoints
+from lizard_wbcomputation.open_water_computer_tests import OpenWaterFixture
+
+
+class RestartFixture(OpenWaterFixture):
+    """Provides the comparison of a restarted computation to the original one."""
+
+    def setUp(self):
+        OpenWaterFixture.setUp(self)
+        self.restart_date = datetime(2011, 2, 1)
+
+    def assert_same_from_restart(self, expected_timeseries, timeseries):
+        expected_events = [event for event in expected_timeseries.events()
+                           if event[0] >= self.restart_date]
+        self.assertTrue(len(expected_events) > 0)
+        self.assertEqual(expected_events, list(timeseries.events()))
+
+    def assert_same_outcome(self, expected_outcome, outcome):
+        level_control, fractions, concentration = outcome
+        for name, timeseries in expected_outcome[0].items():
+            self.assert_same_from_restart(timeseries, level_control[name])
+        for name, timeseries in expected_outcome[1].items():
+            if name == 'intakes':
+                for intake, intake_timeseries in timeseries.items():
+                    self.assert_same_from_restart(intake_timeseries, fractions['intakes'][intake])
+            else:
+                self.assert_same_from_restart(timeseries, fractions[name])
+        self.assert_same_from_restart(expected_outcome[2], concentration)
+
+
+class Checkpoint_TestSuite(RestartFixture, TestCase):
+
+    def test_a(self):
+        """Test the separate computations can be restarted from a checkpoint."""
+        checkpoint = Checkpoint(self.restart_date)
+        expected_outcome = self.compute_separately(self.start_date, checkpoints=[checkpoint])
+        outcome = self.compute_separately(self.restart_date, checkpoint=checkpoint)
+        self.assert_same_outcome(expected_outcome, outcome)
+
+    def test_b(self):
+        """Test the OpenWaterComputer can be restarted from a checkpoint."""
+        checkpoint = Checkpoint(self.restart_date)
+        expected_outcome = self.compute_together(checkpoints=[checkpoint])
+        outcome = self.compute_together(self.restart_date, checkpoint)
+        self.assert_same_outcome(
+            [expected_outcome[name] for name in ['level_control', 'fractions', 'concentration']],
+            [outcome[name] for name in ['level_control', 'fractions', 'concentration']])
+
+    def test_c(self):
+        """Test the OpenWaterComputer fills the same checkpoint as the separate computations."""
+        checkpoint = Checkpoint(self.restart_date)
+        self.compute_separately(self.start_date, checkpoints=[checkpoint])
+        other_checkpoint = Checkpoint(self.restart_date)
+        self.compute_together(checkpoints=[other_checkpoint])
+        self.assertEqual(checkpoint.__dict__, other_checkpoint.__dict__)
+
+    def test_d(self):
+        """Test the checkpoint at the end date contains the final state."""
+        checkpoint = Checkpoint(self.end_date)
+        level_control, fractions, concentration = \
+            self.compute_separately(self.start_date, checkpoints=[checkpoint])
+        self.assertEqual(list(level_control['water_level'].events())[-1][1],
+                         checkpoint.water_level)
+        self.assertEqual(list(level_control['storage'].events())[-1][1],
+                         checkpoint.storage)
+        self.assertEqual(dict(concentration.events())[datetime(2011, 2, 28)],
+                         checkpoint.chloride[0])
+
+
+class BucketCheckpoint_TestSuite(TestCase):
+
+    def setUp(self):
+        start = datetime(2011, 1, 1)
+        self.restart_date = datetime(2011, 6, 1)
+        self.precipitation = create_timeseries(start, [(day * 7) % 23 for day in range(400)])
+        self.evaporation = create_timeseries(start, [(day * 3) % 5 for day in range(400)])
+        self.buckets = []
+        self.bucket2seepage = {}
+        for surface_type in [BucketTypes.UNDRAINED_SURFACE,
+                             BucketTypes.HARDENED_SURFACE,
+                             BucketTypes.DRAINED_SURFACE]:
+            bucket = Bucket()
+            bucket.name = 'bucket %d' % len(self.buckets)
+            bucket.surface_type = surface_type
+            self.buckets.append(bucket)
+            offset = len(self.buckets)
+            self.bucket2seepage[bucket] = \
+                create_timeseries(start, [((day * 5 + offset) % 11) - 5 for day in range(400)])
+
+    def test_a(self):
+        """Test the buckets can be restarted from a checkpoint."""
+        checkpoint = Checkpoint(self.restart_date)
+        expected_bucket2outcome = compute_multiple_timeseries(self.buckets,
+            self.precipitation, self.evaporation, self.bucket2seepage,
+            checkpoints=[checkpoint])
+        self.assertEqual(set(bucket.name for bucket in self.buckets),
+                         set(checkpoint.bucket_volumes.keys()))
+        bucket2outcome = compute_multiple_timeseries(self.buckets,
+            self.precipitation, self.evaporation, self.bucket2seepage,
+            checkpoint=checkpoint)
+        for bucket in self.buckets:
+            expected_timeseries = expected_bucket2outcome[bucket].name2timeseries()
+            for name, timeseries in bucket2outcome[bucket].name2timeseries().items():
+                self.assertEqual([event for event in expected_timeseries[name].events()
+                                  if event[0] >= self.restart_date],
+                                 list(timeseries.events()))
+
+    def test_b(self):
+        """Test the checkpoint of a single layer bucket has no upper volume."""
+        checkpoint = Checkpoint(self.restart_date)
+        bucket2outcome = compute_multiple_timeseries(self.buckets,
+            self.precipitation, self.evaporation, self.bucket2seepage,
+            checkpoints=[checkpoint])
+        upper_volume, lower_volume = checkpoint.bucket_volumes['bucket 0']
+        self.assertEqual(None, upper_volume)
+        storage = dict(bucket2outcome[self.buckets[0]].storage.events())
+        self.assertEqual(storage[datetime(2011, 5, 31)], lower_volume)
+
+
+class save_checkpoints_TestSuite(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_a(self):
+        """Test the stored checkpoints can be loaded."""
+        checkpoint = Checkpoint(datetime(2011, 2, 1))
+        checkpoint.water_level = -1.0
+        checkpoint.bucket_volumes['bucket'] = (None, 100.0)
+        file_name = os.path.join(self.directory, 'checkpoints')
+        save_checkpoints(file_name, [checkpoint])
+        checkpoints = load_checkpoints(file_name)
+        self.assertEqual([checkpoint.__dict__], [loaded.__dict__ for loaded in checkpoints])
+
+    def test_b(self):
+        """Test find_checkpoint returns the last checkpoint before a date."""
+        checkpoints = [Checkpoint(datetime(2011, month, 1)) for month in [3, 1, 2]]
+        self.assertEqual(datetime(2011, 2, 1),
+                         find_checkpoint(checkpoints, datetime(2011, 2, 15)).date)
+        self.assertEqual(None, find_checkpoint(checkpoints, datetime(2010, 12, 31)))
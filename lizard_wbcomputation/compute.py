@@ -24,10 +24,16 @@
 import logging
 
 from lizard_wbcomputation.bucket_computer import BucketComputer
+from lizard_wbcomputation.bucket_computer import BucketOutcome
 from lizard_wbcomputation.bucket_summarizer import BucketsSummarizer
+from lizard_wbcomputation.checkpoint import Checkpoint
+from lizard_wbcomputation.checkpoint import save_checkpoints
 from lizard_wbcomputation.concentration_computer import ConcentrationComputer
 from lizard_wbcomputation.concentration_computer import ConcentrationComputer2
 from lizard_wbcomputation.concentration_computer import TotalVolumeChlorideTimeseries
+from lizard_wbcomputation.daily_frame import DailyFrame
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from lizard_wbcomputation.daily_timeseries import load_daily_timeseries
 from lizard_wbcomputation.fraction_computer import FractionComputer
 from lizard_wbcomputation.impact_from_buckets import SummaryLoad
 from lizard_wbcomputation.impact_from_buckets import SummedLoadsFromBuckets
@@ -35,7 +41,9 @@ from lizard_wbcomputation.level_control_assignment import LevelControlAssignment
 from lizard_wbcomputation.level_control_computer import DateRange
 from lizard_wbcomputation.level_control_computer import LevelControlComputer
 from lizard_wbcomputation.load_computer import LoadComputer
+from lizard_wbcomputation.memoize import DEFAULT_MAX_BYTES
 from lizard_wbcomputation.memoize import memoize
+from lizard_wbcomputation.memoize import memoize_range
 from lizard_wbcomputation.sluice_error_computer import SluiceErrorComputer
 from lizard_wbcomputation.vertical_timeseries_computer import VerticalTimeseriesComputer
 
@@ -129,6 +137,57 @@ def retrieve_outgoing_timeseries(area, only_input=False):
     return outgoing_timeseries
 
 
+def find_bucket_input(input_timeseries, bucket):
+    """Return the dictionary of the input time series of the given bucket.
+
+    An Area can create new bucket objects each time its buckets are
+    requested, so this function looks up the input of a bucket by its name.
+
+    """
+    for key, value in input_timeseries.iteritems():
+        if not isinstance(key, basestring) and getattr(key, 'name', None) == bucket.name:
+            return value
+    raise KeyError(bucket.name)
+
+
+def restrict_timeseries(value, start_date, end_date):
+    """Return the given value with its time series restricted to a period.
+
+    Parameters:
+      *value*
+        time series, BucketOutcome, or dictionary, list or tuple of these
+        values
+      *start_date*
+        date of the first day of the period
+      *end_date*
+        date of the day *after* the last day of the period
+
+    This function restricts each time series in the given value, no matter
+    how deeply nested, to the given period and leaves the other values as
+    they are. It does not modify the given value but returns a new one.
+
+    """
+    if isinstance(value, dict):
+        return dict((key, restrict_timeseries(item, start_date, end_date))
+                    for key, item in value.iteritems())
+    elif isinstance(value, list):
+        return [restrict_timeseries(item, start_date, end_date) for item in value]
+    elif isinstance(value, tuple):
+        return tuple(restrict_timeseries(item, start_date, end_date) for item in value)
+    elif isinstance(value, BucketOutcome):
+        outcome = BucketOutcome()
+        for name, timeseries in value.name2timeseries().iteritems():
+            setattr(outcome, name, restrict_timeseries(timeseries, start_date, end_date))
+        return outcome
+    elif isinstance(value, DailyTimeseries):
+        return value.slice(start_date, end_date)
+    elif hasattr(value, 'events'):
+        return TimeseriesRestrictedStub(timeseries=value,
+                                        start_date=start_date,
+                                        end_date=end_date)
+    return value
+
+
 class VolumesConcentrations(object):
 
     def __init__(self, area, incoming_flows, level_control, bucket2outcome):
@@ -198,7 +257,13 @@ class WaterbalanceComputer2(object):
                  concentration_computer=ConcentrationComputer2(),
                  fraction_computer=FractionComputer(),
                  sluice_error_computer=SluiceErrorComputer(),
-                 load_computer = LoadComputer()):
+                 load_computer = LoadComputer(),
+                 executor=None,
+                 chunk_count=16,
+                 open_water_computer=None,
+                 memoize_max_bytes=DEFAULT_MAX_BYTES,
+                 checkpoint=None,
+                 checkpoint_dates=None):
         """Set (among others) the function to store a time series.
 
         Parameter (among others):
@@ -209,10 +274,36 @@ class WaterbalanceComputer2(object):
         * bucket_computer -- computer for the bucket time series
         * level_control_computer -- computer for the level control
         * store_timeserie -- function to store a time series
+        * executor -- concurrent.futures.Executor to compute the bucket time
+          series, None to compute them in the current process
+        * chunk_count -- maximum number of tasks to submit to the executor
+        * open_water_computer -- OpenWaterComputer to compute the level
+          control, fractions and chloride concentration in a single pass, None
+          to compute them separately
+        * memoize_max_bytes -- maximum number of bytes of the results that the
+          memoized methods cache, the least recently used results are evicted
+          first
+        * checkpoint -- Checkpoint to restart the computations from that start
+          at the date of that Checkpoint, None to start each computation from
+          the initial state
+        * checkpoint_dates -- list of dates at which to capture the state of
+          the computations, see method compute_checkpoints
 
         The store_timeserie argument should be a callable that stores a given
         SparseTimeseriesStub as the volume attribute of a WaterbalanceTimeserie.
 
+        To compute the buckets of an area on multiple cores, pass a
+        concurrent.futures.ProcessPoolExecutor as the executor. The outcome is
+        the same as when the buckets are computed in the current process.
+
+        The memoized methods that compute the time series for a period reuse
+        the cached time series of a period that contains it. The time series
+        that do not depend on the start date, such as the input and vertical
+        time series, are sliced from any containing period. The time series
+        that depend on the state at the start date, such as the storage and
+        the level control, are only sliced from a period with the same start
+        date.
+
         """
 
         self.configuration = configuration
@@ -231,7 +322,42 @@ class WaterbalanceComputer2(object):
         self.sluice_error_computer = sluice_error_computer
         self.load_computer = load_computer
 
-    @memoize
+        self.executor = executor
+        self.chunk_count = chunk_count
+        self.open_water_computer = open_water_computer
+        self.memoize_max_bytes = memoize_max_bytes
+
+        self.checkpoint = checkpoint
+        self.checkpoint_dates = checkpoint_dates or []
+        # dictionary of start date to the list of Checkpoint(s) that the
+        # computations from that start date fill
+        self._checkpoints = {}
+
+    def _get_start_checkpoint(self, start_date):
+        """Return the Checkpoint to restart the computations at the start date.
+
+        This method returns None when the computations at the given start
+        date should start from the initial state.
+
+        """
+        if self.checkpoint is not None and self.checkpoint.date == start_date:
+            return self.checkpoint
+        return None
+
+    def _get_checkpoints(self, start_date):
+        """Return the list of Checkpoint(s) to fill from the given start date.
+
+        This method returns None when no checkpoint dates are set.
+
+        """
+        if len(self.checkpoint_dates) == 0:
+            return None
+        checkpoints = [Checkpoint(date) for date in self.checkpoint_dates
+                       if date >= start_date]
+        # dict.setdefault is atomic, so all computations use the same list
+        return self._checkpoints.setdefault(start_date, checkpoints)
+
+    @memoize_range(restrict_timeseries)
     def get_input_timeseries(self, start_date, end_date):
         """return (and collect) all input timeseries
         Args:
@@ -241,29 +367,31 @@ class WaterbalanceComputer2(object):
             date of the day *after* the last day for which to compute the time
             series
 
+        The time series of the area and its buckets, pumping stations and
+        pump lines are loaded as DailyTimeseries of the period, see
+        daily_timeseries.load_daily_timeseries. Each time series is read in a
+        single pass and the other methods use these DailyTimeseries instead of
+        reading the time series again.
+
         This method returns a tuple that contains
           1. a dictionary with all input timeseries.
             - precipitation
             - evaporation
             - seepage
             - open_water minimum_level/maximum_level
+            - [bucket] seepage/sewer
             - incoming_timeseries[intake]
+            - outgoing_timeseries[pump]
         """
         logger.debug("WaterbalanceComputer2::get_input_timeseries")
 
+        load = lambda timeseries: load_daily_timeseries(timeseries, start_date, end_date)
+
         input_ts = {}
-        input_ts['precipitation'] = SparseTimeseriesStub()
-        for event in self.area.retrieve_precipitation(start_date, end_date).events():
-            input_ts['precipitation'].add_value(event[0], event[1])
-        input_ts['evaporation'] = SparseTimeseriesStub()
-        for event in self.area.retrieve_evaporation(start_date, end_date).events():
-            input_ts['evaporation'].add_value(event[0], event[1])
-        input_ts['seepage'] = SparseTimeseriesStub()
-        for event in self.area.retrieve_seepage(start_date, end_date).events():
-            input_ts['seepage'].add_value(event[0], event[1])
-        input_ts['infiltration'] = SparseTimeseriesStub()
-        for event in self.area.retrieve_infiltration(start_date, end_date).events():
-            input_ts['infiltration'].add_value(event[0], event[1])
+        input_ts['precipitation'] = load(self.area.retrieve_precipitation(start_date, end_date))
+        input_ts['evaporation'] = load(self.area.retrieve_evaporation(start_date, end_date))
+        input_ts['seepage'] = load(self.area.retrieve_seepage(start_date, end_date))
+        input_ts['infiltration'] = load(self.area.retrieve_infiltration(start_date, end_date))
 
         input_ts['open_water'] = {}
         input_ts['open_water']['minimum_level'] = self.area.retrieve_minimum_level(start_date, end_date)
@@ -273,26 +401,23 @@ class WaterbalanceComputer2(object):
 
         for bucket in self.area.buckets:
             input_ts[bucket] = {}
-            input_ts[bucket]['seepage'] = bucket.retrieve_seepage(start_date, end_date)
+            input_ts[bucket]['seepage'] = load(bucket.retrieve_seepage(start_date, end_date))
+            sewer = bucket.retrieve_sewer(start_date, end_date)
+            if sewer is not None:
+                sewer = load(sewer)
+            input_ts[bucket]['sewer'] = sewer
 
         input_ts['incoming_timeseries'] = {}
         for intake, timeseries in retrieve_incoming_timeseries(self.area, only_input=False).iteritems():
-            sparse_timeseries = SparseTimeseriesStub()
-            for event in timeseries.events():
-                sparse_timeseries.add_value(event[0], event[1])
-            input_ts['incoming_timeseries'][intake] = TimeseriesRestrictedStub(timeseries=sparse_timeseries,
-                                                            start_date=start_date,
-                                                            end_date=end_date)
+            input_ts['incoming_timeseries'][intake] = load(timeseries)
 
         input_ts['outgoing_timeseries'] = {}
         for pump, timeseries in retrieve_outgoing_timeseries(self.area, only_input=False).iteritems():
-            input_ts['outgoing_timeseries'][pump] = TimeseriesRestrictedStub(timeseries=timeseries,
-                                                            start_date=start_date,
-                                                            end_date=end_date)
+            input_ts['outgoing_timeseries'][pump] = load(timeseries)
 
         return input_ts
 
-    @memoize
+    @memoize_range(restrict_timeseries, same_start=True)
     def get_buckets_timeseries(self, start_date, end_date):
         """return all outcome timeseries of all buckets
         Args:
@@ -309,14 +434,24 @@ class WaterbalanceComputer2(object):
 
         input = self.get_input_timeseries(start_date, end_date)
 
-        buckets_outcome = {}
-        for bucket in self.area.buckets:
-            buckets_outcome[bucket] = self.bucket_computer.compute(
-                bucket,
-                input['precipitation'],
-                input['evaporation'],
-                bucket.retrieve_seepage(start_date, end_date),
-                bucket.retrieve_sewer(start_date, end_date))
+        buckets = self.area.buckets
+        bucket2seepage = {}
+        bucket2sewer = {}
+        for bucket in buckets:
+            bucket_input = find_bucket_input(input, bucket)
+            bucket2seepage[bucket] = bucket_input['seepage']
+            bucket2sewer[bucket] = bucket_input['sewer']
+
+        buckets_outcome = self.bucket_computer.compute_buckets(
+            buckets,
+            input['precipitation'],
+            input['evaporation'],
+            bucket2seepage,
+            bucket2sewer,
+            self.executor,
+            self.chunk_count,
+            self._get_start_checkpoint(start_date),
+            self._get_checkpoints(start_date))
 
         # for bucket in self.configuration.retrieve_sobek_buckets():
         #     buckets_outcome[bucket]  = bucket.get_outcome(start_date, end_date)
@@ -344,7 +479,7 @@ class WaterbalanceComputer2(object):
         outcome = self.get_buckets_timeseries(start_date, end_date)
         return self.buckets_summarizer.compute(outcome, start_date, end_date)
 
-    @memoize
+    @memoize_range(restrict_timeseries)
     def get_vertical_open_water_timeseries(self, start_date, end_date):
         """return all timeseries directly related to openwater (vertical = rainfall, evaporation and seepage)
         Args:
@@ -382,7 +517,7 @@ class WaterbalanceComputer2(object):
 
         return outcome
 
-    @memoize
+    @memoize_range(restrict_timeseries, same_start=True)
     def get_level_control_timeseries(self, start_date, end_date):
         """return all calculated flows for level_control ('peilhandhaving') and the resulting storage and level in open water
         Args:
@@ -400,18 +535,38 @@ class WaterbalanceComputer2(object):
             TO DO: enddate startdate storage
         """
         logger.debug("WaterbalanceComputer2::get_level_control_timeseries")
+        if self.open_water_computer is not None:
+            return self.get_open_water_timeseries(start_date, end_date)['level_control']
+
+        frame = self.get_level_control_frame(start_date, end_date)
+        outcome = self.level_control_computer.compute_frame(
+            self.area,
+            frame,
+            self.area.max_intake,
+            self.area.max_outtake,
+            self._get_start_checkpoint(start_date),
+            self._get_checkpoints(start_date))
+        return outcome
+
+    @memoize
+    def get_level_control_frame(self, start_date, end_date):
+        """return the DailyFrame with the input of the level control
+        Args:
+          *start_date*
+            date of the first day for which to compute the time series
+          *end_date*
+            date of the day *after* the last day for which to compute the time
+            series
+
+        The DailyFrame contains the time series for the level control
+        computation aligned to the days in [start_date, end_date).
+        """
+        logger.debug("WaterbalanceComputer2::get_level_control_frame")
         input = self.get_input_timeseries(start_date, end_date)
         buckets_summary = self.get_bucketflow_summary(start_date, end_date)
         vertical_open_water_timeseries = self.get_vertical_open_water_timeseries(start_date, end_date)
 
-        # We compute the level control for a specific range of time. To do
-        # so, we set an instance method that can determine whether a given
-        # date is inside that range.
-        date_range = DateRange(start_date, end_date)
-        self.level_control_computer.inside_range = date_range.inside
-
-        outcome = self.level_control_computer.compute(
-            self.area,
+        ts = self.level_control_computer.create_input(
             buckets_summary,
             vertical_open_water_timeseries["precipitation"],
             vertical_open_water_timeseries["evaporation"],
@@ -420,10 +575,8 @@ class WaterbalanceComputer2(object):
             input['open_water']['minimum_level'],
             input['open_water']['maximum_level'],
             input['incoming_timeseries'],
-            input['outgoing_timeseries'],
-            self.area.max_intake,
-            self.area.max_outtake)
-        return outcome
+            input['outgoing_timeseries'])
+        return DailyFrame(ts, start_date, end_date)
 
     @memoize
     def get_level_control_pumping_stations(self):
@@ -492,7 +645,7 @@ class WaterbalanceComputer2(object):
         outgoing["outtake_wl_control"] = {outtake: control['outtake_wl_control']}
         return outgoing
 
-    @memoize
+    @memoize_range()
     def get_reference_timeseries(self, start_date, end_date):
         """return (and collect) all timeseries, used for reference (measured flows at structures, waterlevel and concentrations)
         Args:
@@ -525,9 +678,12 @@ class WaterbalanceComputer2(object):
         sluice_error = self.calc_sluice_error_timeseries(start_date, end_date)
         return calc_waterlevel, sluice_error
 
-    @memoize
+    @memoize_range(restrict_timeseries, same_start=True)
     def get_concentration_timeseries(self, start_date, end_date):
         logger.debug("WaterbalanceComputer2::get_concentration_timeseries")
+        if self.open_water_computer is not None:
+            return self.get_open_water_timeseries(start_date, end_date)['concentration']
+
         inflow = self.get_open_water_incoming_flows(start_date, end_date)
         level_control = self.get_level_control_timeseries(start_date, end_date)
         bucket2outcome = self.get_buckets_timeseries(start_date, end_date)
@@ -547,7 +703,8 @@ class WaterbalanceComputer2(object):
         computer.outgoing_volumes_no_chloride = \
             self.get_vertical_open_water_timeseries(start_date, end_date)['evaporation']
 
-        return computer.compute()
+        return computer.compute(self._get_start_checkpoint(start_date),
+                                self._get_checkpoints(start_date))
 
     @memoize
     def get_load_timeseries(self,
@@ -659,7 +816,7 @@ class WaterbalanceComputer2(object):
 
         return sluice_error
 
-    @memoize
+    @memoize_range(restrict_timeseries, same_start=True)
     def get_fraction_timeseries(self, start_date, end_date):
         """return fractions in openwater
         Args:
@@ -675,6 +832,9 @@ class WaterbalanceComputer2(object):
             TO DO: enddate startdate storage
         """
         logger.debug("WaterbalanceComputer2::get_fraction_timeseries")
+        if self.open_water_computer is not None:
+            return self.get_open_water_timeseries(start_date, end_date)['fractions']
+
         input = self.get_input_timeseries(start_date, end_date)
         buckets_summary = self.get_bucketflow_summary(start_date, end_date)
         vertical_open_water_timeseries = self.get_vertical_open_water_timeseries(start_date, end_date)
@@ -701,9 +861,101 @@ class WaterbalanceComputer2(object):
                                                    control['total_outgoing'],
                                                    intakes_timeseries,
                                                    start_date,
-                                                   end_date)
+                                                   end_date,
+                                                   self._get_start_checkpoint(start_date),
+                                                   self._get_checkpoints(start_date))
         return fractions
 
+    @memoize_range(restrict_timeseries, same_start=True)
+    def get_open_water_timeseries(self, start_date, end_date):
+        """return the level control, fractions and concentration in open water
+        Args:
+          *start_date*
+            date of the first day for which to compute the time series
+          *end_date*
+            date of the day *after* the last day for which to compute the time
+            series
+
+        This method returns a dictionary that maps
+          - 'level_control' to the outcome of get_level_control_timeseries,
+          - 'fractions' to the outcome of get_fraction_timeseries and
+          - 'concentration' to the outcome of get_concentration_timeseries
+        and computes these outcomes in a single pass using the
+        OpenWaterComputer.
+        """
+        logger.debug("WaterbalanceComputer2::get_open_water_timeseries")
+        input = self.get_input_timeseries(start_date, end_date)
+        buckets_summary = self.get_bucketflow_summary(start_date, end_date)
+        vertical_open_water_timeseries = self.get_vertical_open_water_timeseries(start_date, end_date)
+        bucket2outcome = self.get_buckets_timeseries(start_date, end_date)
+
+        # the OpenWaterComputer computes the time series of the intake for
+        # level control itself, we refer to these time series by None
+        fraction_intakes_timeseries = dict(input['incoming_timeseries'])
+        intake = find_pumping_station_level_control(self.area, True)
+        if intake is None:
+            logger.warning("No intake for level control is present for "
+                           "area %s", self.area.name)
+        else:
+            fraction_intakes_timeseries[intake] = None
+
+        inflow = {'precipitation': vertical_open_water_timeseries['precipitation'],
+                  'seepage': vertical_open_water_timeseries['seepage'],
+                  'defined_input': input['incoming_timeseries']}
+        vc = VolumesConcentrations(self.area, inflow, {'intake_wl_control': None}, bucket2outcome)
+        vc.start_date = start_date
+        vc.end_date = end_date
+        chloride_inflows = zip(vc.get_volumes(), vc.get_concentrations())
+
+        return self.open_water_computer.compute(
+            self.area,
+            buckets_summary,
+            vertical_open_water_timeseries["precipitation"],
+            vertical_open_water_timeseries["evaporation"],
+            vertical_open_water_timeseries["seepage"],
+            vertical_open_water_timeseries["infiltration"],
+            input['open_water']['minimum_level'],
+            input['open_water']['maximum_level'],
+            input['incoming_timeseries'],
+            input['outgoing_timeseries'],
+            fraction_intakes_timeseries,
+            chloride_inflows,
+            start_date,
+            end_date,
+            self.area.max_intake,
+            self.area.max_outtake,
+            self._get_start_checkpoint(start_date),
+            self._get_checkpoints(start_date))
+
+    def compute_checkpoints(self, start_date, end_date):
+        """Compute and return the Checkpoint(s) of the computations of a period.
+
+        This method returns the list of the Checkpoint(s) of the checkpoint
+        dates that lie in the given period, including the end date. Each
+        Checkpoint contains the state of the buckets, the level control, the
+        fractions and the chloride concentration at the start of its date.
+
+        To restart the computations at one of these dates, for example after
+        new data has been imported, pass the Checkpoint of that date to a new
+        WaterbalanceComputer2 and compute the time series from that date on.
+
+        """
+        logger.debug("WaterbalanceComputer2::compute_checkpoints")
+        self.get_buckets_timeseries(start_date, end_date)
+        self.get_level_control_timeseries(start_date, end_date)
+        self.get_fraction_timeseries(start_date, end_date)
+        self.get_concentration_timeseries(start_date, end_date)
+        checkpoints = self._get_checkpoints(start_date) or []
+        return [checkpoint for checkpoint in checkpoints if checkpoint.date <= end_date]
+
+    def save_checkpoints(self, start_date, end_date, file_name):
+        """Compute the Checkpoint(s) of a period and store them in the given file.
+
+        The Checkpoint(s) can be read using checkpoint.load_checkpoints.
+
+        """
+        save_checkpoints(file_name, self.compute_checkpoints(start_date, end_date))
+
     def compute(self, start_date, end_date):
         """Compute the waterbalance-related time series
 
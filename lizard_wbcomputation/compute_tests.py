@@ -37,6 +37,8 @@ from lizard_wbcomputation.bucket_computer import compute_seepage
 from lizard_wbcomputation.bucket_computer import compute_timeseries
 from lizard_waterbalance.localmock import Mock
 from lizard_wbcomputation.compute import find_pumping_station_level_control
+from lizard_wbcomputation.compute import restrict_timeseries
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
 from timeseries.timeseriesstub import TimeseriesStub
 
 
@@ -970,6 +972,39 @@ class FindIntakeLevelControlSuite(TestCase):
         self.assertTrue(intake is None)
 
 
+class restrict_timeseries_TestSuite(TestCase):
+
+    def setUp(self):
+        self.timeseries = TimeseriesStub((datetime(2011, 10, 24), 1.0),
+                                         (datetime(2011, 10, 25), 2.0),
+                                         (datetime(2011, 10, 26), 3.0))
+
+    def test_a(self):
+        """Test the time series in a nested dictionary are restricted."""
+        value = {'level_control': {'storage': self.timeseries}, 'name': 'area'}
+        restricted = restrict_timeseries(value, datetime(2011, 10, 25),
+                                         datetime(2011, 10, 26))
+        self.assertEqual([(datetime(2011, 10, 25), 2.0)],
+                         list(restricted['level_control']['storage'].events()))
+        self.assertEqual('area', restricted['name'])
+
+    def test_b(self):
+        """Test the given value itself is not modified."""
+        value = (self.timeseries, [self.timeseries])
+        restrict_timeseries(value, datetime(2011, 10, 25), datetime(2011, 10, 26))
+        self.assertEqual(self.timeseries, value[0])
+        self.assertEqual([self.timeseries], value[1])
+        self.assertEqual(3, len(list(value[0].events())))
+
+    def test_c(self):
+        """Test a DailyTimeseries is restricted to a slice of its values."""
+        timeseries = DailyTimeseries(datetime(2011, 10, 24), [1.0, 2.0, 3.0])
+        restricted = restrict_timeseries({'storage': timeseries}, datetime(2011, 10, 25),
+                                         datetime(2011, 10, 26))['storage']
+        self.assertTrue(isinstance(restricted, DailyTimeseries))
+        self.assertEqual([(datetime(2011, 10, 25), 2.0)], list(restricted.events()))
+
+
 def test_no_intakes_or_pumps_exist():
     """Test no intakes or pumps exist."""
     area = Mock()
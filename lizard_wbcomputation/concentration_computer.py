@@ -24,6 +24,8 @@
 from datetime import datetime
 import logging
 
+from lizard_wbcomputation.checkpoint import map_checkpoints
+
 from timeseries.timeseriesstub import add_timeseries
 from timeseries.timeseriesstub import enumerate_dict_events
 from timeseries.timeseriesstub import enumerate_events
@@ -159,18 +161,36 @@ class ConcentrationComputer(object):
         which does not influence the chloride concentration
 
     """
-    def compute(self):
-        """Returns the chloride concentration time series of a water body."""
+    def compute(self, checkpoint=None, checkpoints=None):
+        """Returns the chloride concentration time series of a water body.
+
+        When a Checkpoint is given, this method starts at the date of that
+        Checkpoint from its chloride concentration and volume instead of from
+        the initial ones. When a list of Checkpoint(s) is given, this method
+        stores the chloride concentration and volume at the start of their
+        date in them.
+
+        """
         concentrations = SparseTimeseriesStub()
-        concentration = self.initial_concentration
-        volume = self.initial_volume
+        if checkpoint is None:
+            concentration = self.initial_concentration
+            volume = self.initial_volume
+        else:
+            concentration, volume = checkpoint.chloride
         chloride = volume * concentration
+        day2checkpoint = map_checkpoints(checkpoints)
+        last_day = None
         for events in enumerate_events(self.incoming_volumes,
                                        self.incoming_chlorides,
                                        self.outgoing_volumes,
                                        self.outgoing_volumes_no_chloride):
             date, incoming_volume, incoming_chloride, outgoing_volume, outgoing_volume_no_chloride = \
                 self.parse_events(events)
+            if checkpoint is not None and date < checkpoint.date:
+                continue
+            last_day = date.toordinal()
+            if last_day in day2checkpoint:
+                day2checkpoint[last_day].chloride = (concentration, volume)
 
             max_chloride = chloride + incoming_chloride
             max_volume = volume + incoming_volume
@@ -182,6 +202,8 @@ class ConcentrationComputer(object):
 
             volume = max(max_volume + outgoing_volume, 0.0)
             chloride = concentration * volume
+        if last_day is not None and last_day + 1 in day2checkpoint:
+            day2checkpoint[last_day + 1].chloride = (concentration, volume)
         return concentrations
 
     def parse_events(self, events):
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+
+from lizard_wbcomputation.bucket_arrays import fill_days
+from lizard_wbcomputation.bucket_arrays import read_events
+from lizard_wbcomputation.bucket_summarizer import summation_order
+
+from timeseries.timeseriesstub import SparseTimeseriesStub
+
+
+class DailyFrame(object):
+    """Stores time series as columns of daily values on a shared day index.
+
+    A DailyFrame is created from a dictionary of time series, as accepted by
+    timeseries.timeseriesstub.enumerate_dict_events: each key maps to either
+    a time series or to a dictionary of key to time series. The DailyFrame
+    reads each time series once and stores its values as a column: the value
+    at index i of a column is the value of the time series at the i-th day of
+    the frame, or 0.0 when the time series does not have a value at that day.
+
+    The key of the column of a time series in a nested dictionary is the pair
+    (outer key, inner key).
+
+    Instance variables:
+    * first_date -- date of the day at index 0
+    * day_count -- number of days of the frame
+    * columns -- dictionary of column key to array of daily values
+    * extents -- dictionary of column key to the pair (first index, index
+      after the last index) of the days at which the time series has values,
+      or None when the time series does not have values; these indices can lie
+      outside the frame
+    * group_keys -- dictionary of outer key to the list of inner keys, in the
+      order in which enumerate_dict_events yields them
+
+    """
+    def __init__(self, name2timeseries, start_date=None, end_date=None):
+        """Read the given time series into columns.
+
+        When a start date is given, the frame starts at that date and
+        otherwise it starts at the first day for which any of the time series
+        has a value. The same holds for the end date, which is the date after
+        the last day of the frame.
+
+        """
+        name2events = {}
+        self.group_keys = {}
+        for name, timeseries in name2timeseries.items():
+            if type(timeseries) == dict:
+                self.group_keys[name] = summation_order(timeseries)
+                for key, inner_timeseries in timeseries.items():
+                    name2events[(name, key)] = read_events(inner_timeseries)
+            else:
+                name2events[name] = read_events(timeseries)
+
+        present = [(first_date, days) for (first_date, days, values) in name2events.values()
+                   if first_date is not None]
+        if start_date is not None:
+            first_day = start_date.toordinal()
+        elif len(present) > 0:
+            first_day = min(days[0] for (first_date, days) in present)
+        else:
+            first_day = 0
+        if end_date is not None:
+            end_day = end_date.toordinal()
+        elif len(present) > 0:
+            end_day = max(days[-1] for (first_date, days) in present) + 1
+        else:
+            end_day = first_day
+        self.day_count = max(0, end_day - first_day)
+
+        # the date of each day has the time of the first event, just as the
+        # dates that enumerate_dict_events yields
+        if len(present) > 0:
+            first_date = min(first_date for (first_date, days) in present)
+            self.first_date = first_date + timedelta(first_day - first_date.toordinal())
+        else:
+            self.first_date = start_date
+
+        self.columns = {}
+        self.extents = {}
+        for key, (first_date, days, values) in name2events.items():
+            inside = (days >= first_day) & (days < end_day)
+            self.columns[key] = fill_days(days[inside], values[inside], first_day, self.day_count)
+            if first_date is None:
+                self.extents[key] = None
+            else:
+                self.extents[key] = (days[0] - first_day, days[-1] + 1 - first_day)
+
+    def date(self, index):
+        """Return the date of the day at the given index."""
+        return self.first_date + timedelta(index)
+
+    def range(self):
+        """Return the pair (first index, index after the last index) of the days
+        for which any of the time series has a value.
+
+        This is the range of days for which enumerate_dict_events yields the
+        events of the time series, restricted to the frame. When none of the
+        time series has a value in the frame, this method returns None.
+
+        """
+        extents = [extent for extent in self.extents.values() if extent is not None]
+        if len(extents) == 0:
+            return None
+        first_index = max(min(first for (first, end) in extents), 0)
+        end_index = min(max(end for (first, end) in extents), self.day_count)
+        if first_index >= end_index:
+            return None
+        return first_index, end_index
+
+    def slice(self, first_index, end_index):
+        """Return the DailyFrame of the days in [first_index, end_index)."""
+        first_index = max(first_index, 0)
+        end_index = max(first_index, min(end_index, self.day_count))
+        frame = DailyFrame({})
+        frame.group_keys = self.group_keys
+        frame.day_count = end_index - first_index
+        if self.first_date is not None:
+            frame.first_date = self.date(first_index)
+        for key, column in self.columns.items():
+            frame.columns[key] = column[first_index:end_index]
+            extent = self.extents[key]
+            if extent is not None:
+                extent = (extent[0] - first_index, extent[1] - first_index)
+            frame.extents[key] = extent
+        return frame
+
+    def group(self, name):
+        """Return the list of the columns of the given outer key.
+
+        The columns are listed in the order in which enumerate_dict_events
+        yields the events of the time series of that outer key.
+
+        """
+        return [self.columns[(name, key)] for key in self.group_keys.get(name, [])]
+
+    def create_timeseries(self, first_index, values):
+        """Return the time series of the given values from the given index on."""
+        timeseries = SparseTimeseriesStub()
+        if len(values) > 0:
+            timeseries = SparseTimeseriesStub(self.date(first_index), list(values))
+        return timeseries
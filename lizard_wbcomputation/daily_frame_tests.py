@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.daily_frame import DailyFrame
+from lizard_wbcomputation.level_control_computer import DateRange
+from lizard_wbcomputation.level_control_computer import LevelControlComputer
+from lizard_wbcomputation.open_water_computer_tests import OpenWaterFixture
+
+
+class DailyFrame_TestSuite(TestCase):
+
+    def setUp(self):
+        self.ts = {'one': create_timeseries(datetime(2011, 1, 3), [1.0, 2.0]),
+                   'group': {'two': create_timeseries(datetime(2011, 1, 1), [3.0]),
+                             'three': create_timeseries(datetime(2011, 1, 6), [4.0])}}
+
+    def test_a(self):
+        """Test the frame spans the days of all time series."""
+        frame = DailyFrame(self.ts)
+        self.assertEqual(datetime(2011, 1, 1), frame.first_date)
+        self.assertEqual(6, frame.day_count)
+        self.assertEqual([0.0, 0.0, 1.0, 2.0, 0.0, 0.0], frame.columns['one'].tolist())
+        self.assertEqual([3.0, 0.0, 0.0, 0.0, 0.0, 0.0], frame.columns[('group', 'two')].tolist())
+        self.assertEqual((0, 6), frame.range())
+
+    def test_b(self):
+        """Test the frame spans the given period."""
+        frame = DailyFrame(self.ts, datetime(2011, 1, 2), datetime(2011, 1, 10))
+        self.assertEqual(datetime(2011, 1, 2), frame.first_date)
+        self.assertEqual(8, frame.day_count)
+        self.assertEqual([0.0, 1.0, 2.0, 0.0, 0.0, 0.0, 0.0, 0.0], frame.columns['one'].tolist())
+        self.assertEqual((0, 5), frame.range())
+
+    def test_c(self):
+        """Test the range of a slice includes the days between the time series."""
+        frame = DailyFrame(self.ts).slice(3, 5)
+        self.assertEqual(datetime(2011, 1, 4), frame.first_date)
+        self.assertEqual([2.0, 0.0], frame.columns['one'].tolist())
+        self.assertEqual((0, 2), frame.range())
+
+    def test_d(self):
+        """Test the columns of a group are in the order of the group."""
+        frame = DailyFrame(self.ts)
+        self.assertEqual([frame.columns[('group', key)].tolist() for key in self.ts['group'].keys()],
+                         [column.tolist() for column in frame.group('group')])
+        self.assertEqual([], frame.group('missing'))
+
+
+class compute_frame_TestSuite(OpenWaterFixture, TestCase):
+
+    def test_a(self):
+        """Test the level control from a frame is equal to the one from the time series."""
+        for start_date, end_date in [(self.start_date, self.end_date),
+                                     (datetime(2010, 1, 1), datetime(2011, 2, 1)),
+                                     (datetime(2013, 1, 1), datetime(2013, 2, 1))]:
+            level_control_computer = LevelControlComputer()
+            level_control_computer.inside_range = DateRange(start_date, end_date).inside
+            expected_level_control = level_control_computer.compute(self.area,
+                self.buckets_summary, self.precipitation, self.evaporation,
+                self.seepage, self.infiltration, self.minimum_level,
+                self.maximum_level, self.intakes_timeseries,
+                self.pumps_timeseries, 2000.0, 3000.0)
+            ts = level_control_computer.create_input(self.buckets_summary,
+                self.precipitation, self.evaporation, self.seepage,
+                self.infiltration, self.minimum_level, self.maximum_level,
+                self.intakes_timeseries, self.pumps_timeseries)
+            level_control = level_control_computer.compute_frame(self.area,
+                DailyFrame(ts, start_date, end_date), 2000.0, 3000.0)
+            for name, timeseries in expected_level_control.items():
+                self.assert_same_timeseries(timeseries, level_control[name])
@@ -0,0 +1,273 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from datetime import timedelta
+
+import numpy
+
+from timeseries.timeseriesstub import TimeseriesRestrictedStub
+
+
+def count_days(first_date, date):
+    """Return the index of the first day at or after the given date.
+
+    The day at index i has date first_date + i days. When the dates have a
+    time, the day at the returned index is the first day whose date is not
+    before the given date, just as a timeseries.timeseriesstub.TimeseriesRestrictedStub
+    compares the dates of the events to its start and end date.
+
+    """
+    delta = date - first_date
+    if delta.seconds > 0 or delta.microseconds > 0:
+        return delta.days + 1
+    return delta.days
+
+
+class DailyTimeseries(object):
+    """Implements a time series with a value for each day in an array.
+
+    A DailyTimeseries stores the date of its first day and a numpy array of
+    float64 values, where the value at index i is the value of the i-th day
+    after the first date. The date of a day can be converted to its index and
+    back in constant time.
+
+    A DailyTimeseries supports the events and add_value methods of a
+    timeseries.timeseriesstub.SparseTimeseriesStub, so it can be used
+    wherever such a time series is used. Just as a SparseTimeseriesStub, it
+    contains a value for each day from its first to its last day: when
+    add_value skips a day, the value of that day is 0.0.
+
+    The computations that convert time series to arrays, see
+    bucket_arrays.read_events, use the array of a DailyTimeseries directly
+    instead of reading its events one by one.
+
+    """
+    def __init__(self, first_date=None, values=None):
+        self.first_date = first_date
+        if values is None:
+            values = numpy.zeros(0)
+        # we share the given array, add_value allocates a new array when it
+        # needs to grow
+        self._values = numpy.asarray(values, dtype=float)
+        self._count = len(self._values)
+
+    @property
+    def values(self):
+        """Return the array of the daily values."""
+        return self._values[:self._count]
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        if self.first_date is None:
+            return "DailyTimeseries()"
+        return "DailyTimeseries(%s, %d days)" % (self.first_date.strftime('%Y-%m-%d'),
+                                                 self._count)
+
+    def index(self, date):
+        """Return the index of the day of the given date."""
+        return date.toordinal() - self.first_date.toordinal()
+
+    def date(self, index):
+        """Return the date of the day at the given index."""
+        return self.first_date + timedelta(index)
+
+    def get_value(self, date, default=0.0):
+        """Return the value at the given date, or the default when it has none."""
+        if self.first_date is None:
+            return default
+        index = self.index(date)
+        if 0 <= index < self._count:
+            return float(self._values[index])
+        return default
+
+    def add_value(self, date, value):
+        """Add the given value at the given date.
+
+        The days between the last day and the given date get the value 0.0.
+        Just as SparseTimeseriesStub.add_value, this method appends the value
+        after the last day when the given date does not lie after it.
+
+        """
+        if self.first_date is None:
+            self.first_date = date
+        index = max(count_days(self.first_date, date), self._count)
+        if index >= len(self._values):
+            values = numpy.zeros(max(index + 1, 2 * len(self._values), 16))
+            values[:self._count] = self._values[:self._count]
+            self._values = values
+        else:
+            self._values[self._count:index] = 0.0
+        self._values[index] = value
+        self._count = index + 1
+
+    def events(self, start_date=None, end_date=None):
+        """Yield the (date, value) event of each day in the given period."""
+        timeseries = self.slice(start_date, end_date)
+        date = timeseries.first_date
+        for value in timeseries.values.tolist():
+            yield date, value
+            date = date + timedelta(1)
+
+    def daily_arrays(self, start_date=None, end_date=None):
+        """Return the days in the given period as the pair of arrays (times, values).
+
+        The times are returned as datetime64 in microseconds, just as the
+        method daily_arrays of the time series in the database returns them.
+        The values are shared with the current time series.
+
+        """
+        timeseries = self.slice(start_date, end_date)
+        if timeseries.first_date is None:
+            return numpy.zeros(0, dtype='datetime64[us]'), numpy.zeros(0)
+        times = numpy.datetime64(timeseries.first_date, 'us') + \
+                numpy.arange(len(timeseries)) * numpy.timedelta64(1, 'D')
+        return times, timeseries.values
+
+    def slice(self, start_date=None, end_date=None):
+        """Return the DailyTimeseries of the days in [start_date, end_date).
+
+        The returned time series shares its values with the current one.
+
+        """
+        if self.first_date is None:
+            return DailyTimeseries()
+        first_index, end_index = 0, self._count
+        if start_date is not None:
+            first_index = min(max(count_days(self.first_date, start_date), 0), self._count)
+        if end_date is not None:
+            end_index = min(max(count_days(self.first_date, end_date), first_index), self._count)
+        if first_index == end_index:
+            return DailyTimeseries()
+        return DailyTimeseries(self.date(first_index), self._values[first_index:end_index])
+
+    def __add__(self, other):
+        """Return the sum of the current time series and the other one.
+
+        The other one is either a number or a DailyTimeseries. The sum of two
+        DailyTimeseries spans the days of both, where a time series that does
+        not have a value at a day contributes 0.0.
+
+        """
+        if not isinstance(other, DailyTimeseries):
+            return DailyTimeseries(self.first_date, self.values + other)
+        if other.first_date is None:
+            return DailyTimeseries(self.first_date, self.values.copy())
+        if self.first_date is None:
+            return DailyTimeseries(other.first_date, other.values.copy())
+        first_date = min(self.first_date, other.first_date)
+        first_day = first_date.toordinal()
+        end_day = max(self.first_date.toordinal() + self._count,
+                      other.first_date.toordinal() + other._count)
+        values = numpy.zeros(end_day - first_day)
+        for timeseries in [self, other]:
+            start = timeseries.first_date.toordinal() - first_day
+            values[start:start + len(timeseries)] += timeseries.values
+        return DailyTimeseries(first_date, values)
+
+    __radd__ = __add__
+
+    def __mul__(self, factor):
+        """Return the current time series scaled by the given factor."""
+        return DailyTimeseries(self.first_date, self.values * factor)
+
+    __rmul__ = __mul__
+
+    def split(self):
+        """Return the pair of the positive and the negative part of the values.
+
+        Each day of the first time series has the value of the current time
+        series when that value is positive and 0.0 otherwise. Each day of the
+        second time series has the value of the current time series when
+        that value is negative and 0.0 otherwise.
+
+        """
+        values = self.values
+        return (DailyTimeseries(self.first_date, numpy.where(values > 0, values, 0.0)),
+                DailyTimeseries(self.first_date, numpy.where(values < 0, values, 0.0)))
+
+
+def find_daily_timeseries(timeseries):
+    """Return the given time series as a DailyTimeseries, if it is one.
+
+    This function also recognizes a TimeseriesRestrictedStub of a
+    DailyTimeseries and returns the slice of the restricted period. For any
+    other time series it returns None.
+
+    """
+    if isinstance(timeseries, DailyTimeseries):
+        return timeseries
+    if isinstance(timeseries, TimeseriesRestrictedStub):
+        daily_timeseries = find_daily_timeseries(getattr(timeseries, 'timeseries', None))
+        if daily_timeseries is not None:
+            return daily_timeseries.slice(getattr(timeseries, 'start_date', None),
+                                          getattr(timeseries, 'end_date', None))
+    return None
+
+
+def load_daily_timeseries(timeseries, start_date=None, end_date=None):
+    """Return a DailyTimeseries with the events of the given time series.
+
+    This function only returns the events in [start_date, end_date). It
+    reads the events of the given time series in a single pass and stores
+    their values in an array without intermediate time series. When the
+    given time series already is a (restricted) DailyTimeseries, this
+    function returns a slice that shares its values.
+
+    A TimeseriesRestrictedStub is unwrapped: this function reads the events
+    of the time series it restricts and applies both restrictions itself.
+
+    """
+    daily_timeseries = find_daily_timeseries(timeseries)
+    if daily_timeseries is not None:
+        return daily_timeseries.slice(start_date, end_date)
+    if isinstance(timeseries, TimeseriesRestrictedStub) and \
+       hasattr(timeseries, 'timeseries'):
+        restricted_start_date = getattr(timeseries, 'start_date', None)
+        if start_date is None or \
+           (restricted_start_date is not None and restricted_start_date > start_date):
+            start_date = restricted_start_date
+        restricted_end_date = getattr(timeseries, 'end_date', None)
+        if end_date is None or \
+           (restricted_end_date is not None and restricted_end_date < end_date):
+            end_date = restricted_end_date
+        return load_daily_timeseries(timeseries.timeseries, start_date, end_date)
+
+    first_date = None
+    values = []
+    for date, value in timeseries.events():
+        if start_date is not None and date < start_date:
+            continue
+        elif end_date is not None and date >= end_date:
+            break
+        if first_date is None:
+            first_date = date
+        # just as DailyTimeseries.add_value, we fill the skipped days with 0.0
+        # and append the value of a date that does not lie after the last day
+        index = count_days(first_date, date)
+        if index > len(values):
+            values.extend([0.0] * (index - len(values)))
+        values.append(value)
+    return DailyTimeseries(first_date, numpy.array(values, dtype=float))
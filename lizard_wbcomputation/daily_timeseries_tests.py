@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from datetime import datetime
+from datetime import timedelta
+from unittest import TestCase
+
+import numpy
+
+from lizard_wbcomputation.bucket_arrays import read_events
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from lizard_wbcomputation.daily_timeseries import load_daily_timeseries
+from lizard_wbcomputation.level_control_computer import DateRange
+from lizard_wbcomputation.vertical_timeseries_computer import VerticalTimeseriesComputer
+from timeseries.timeseriesstub import TimeseriesRestrictedStub
+
+
+class DailyTimeseries_TestSuite(TestCase):
+
+    def setUp(self):
+        self.today = datetime(2011, 1, 28)
+        self.tomorrow = datetime(2011, 1, 29)
+        self.day_after_tomorrow = datetime(2011, 1, 30)
+
+    def test_a(self):
+        """Test add_value fills the skipped days with 0.0."""
+        timeseries = DailyTimeseries()
+        timeseries.add_value(self.today, 1.0)
+        timeseries.add_value(self.day_after_tomorrow, 3.0)
+        self.assertEqual([(self.today, 1.0), (self.tomorrow, 0.0),
+                          (self.day_after_tomorrow, 3.0)],
+                         list(timeseries.events()))
+
+    def test_b(self):
+        """Test add_value stores the same events as a SparseTimeseriesStub."""
+        expected_timeseries = create_timeseries(self.today, [(day * 7) % 23 for day in range(100)])
+        timeseries = load_daily_timeseries(expected_timeseries)
+        self.assertEqual(list(expected_timeseries.events()), list(timeseries.events()))
+
+    def test_c(self):
+        """Test get_value returns the value at a date."""
+        timeseries = DailyTimeseries(self.today, [1.0, 2.0])
+        self.assertEqual(0, timeseries.index(self.today))
+        self.assertEqual(2.0, timeseries.get_value(self.tomorrow))
+        self.assertEqual(0.0, timeseries.get_value(self.day_after_tomorrow))
+
+    def test_d(self):
+        """Test slice returns the days in the given period."""
+        timeseries = DailyTimeseries(self.today, [1.0, 2.0, 3.0])
+        self.assertEqual([(self.tomorrow, 2.0)],
+                         list(timeseries.slice(self.tomorrow, self.day_after_tomorrow).events()))
+        self.assertEqual([], list(timeseries.slice(self.day_after_tomorrow, self.today).events()))
+        self.assertEqual([(self.tomorrow, 2.0), (self.day_after_tomorrow, 3.0)],
+                         list(timeseries.events(self.tomorrow)))
+
+    def test_e(self):
+        """Test the sum of two time series spans the days of both."""
+        timeseries = DailyTimeseries(self.today, [1.0, 2.0]) + \
+                     DailyTimeseries(self.tomorrow, [3.0, 4.0])
+        self.assertEqual([(self.today, 1.0), (self.tomorrow, 5.0),
+                          (self.day_after_tomorrow, 4.0)],
+                         list(timeseries.events()))
+
+    def test_f(self):
+        """Test the scaling and splitting of a time series."""
+        timeseries = 2 * DailyTimeseries(self.today, [1.0, -2.0])
+        self.assertEqual([2.0, -4.0], timeseries.values.tolist())
+        positive, negative = timeseries.split()
+        self.assertEqual([2.0, 0.0], positive.values.tolist())
+        self.assertEqual([0.0, -4.0], negative.values.tolist())
+
+    def test_g(self):
+        """Test read_events uses the arrays of a restricted DailyTimeseries."""
+        timeseries = DailyTimeseries(self.today, [1.0, 2.0, 3.0])
+        restricted = TimeseriesRestrictedStub(timeseries=timeseries,
+                                              start_date=self.tomorrow)
+        first_date, days, values = read_events(restricted)
+        self.assertEqual(self.tomorrow, first_date)
+        self.assertEqual([self.tomorrow.toordinal(), self.day_after_tomorrow.toordinal()],
+                         days.tolist())
+        self.assertEqual([2.0, 3.0], values.tolist())
+
+    def test_h(self):
+        """Test daily_arrays returns the times and values of the given period."""
+        timeseries = DailyTimeseries(self.today, [1.0, 2.0, 3.0])
+        times, values = timeseries.daily_arrays(self.tomorrow)
+        self.assertEqual([self.tomorrow, self.day_after_tomorrow],
+                         times.astype(object).tolist())
+        self.assertEqual([2.0, 3.0], values.tolist())
+        times, values = timeseries.daily_arrays(self.day_after_tomorrow, self.today)
+        self.assertEqual(([], []), (times.tolist(), values.tolist()))
+
+
+class load_daily_timeseries_TestSuite(TestCase):
+
+    def setUp(self):
+        self.start_date = datetime(2011, 1, 1)
+        self.timeseries = create_timeseries(self.start_date, [(day * 7) % 23 for day in range(100)])
+
+    def test_a(self):
+        """Test load_daily_timeseries applies the restriction of the time series."""
+        restricted = TimeseriesRestrictedStub(timeseries=self.timeseries,
+                                              start_date=datetime(2011, 1, 10),
+                                              end_date=datetime(2011, 3, 1))
+        timeseries = load_daily_timeseries(restricted, self.start_date, datetime(2011, 2, 1))
+        self.assertEqual([event for event in restricted.events()
+                          if event[0] < datetime(2011, 2, 1)],
+                         list(timeseries.events()))
+
+    def test_b(self):
+        """Test load_daily_timeseries shares the values of a DailyTimeseries."""
+        daily_timeseries = load_daily_timeseries(self.timeseries)
+        restricted = TimeseriesRestrictedStub(timeseries=daily_timeseries,
+                                              start_date=datetime(2011, 1, 10))
+        timeseries = load_daily_timeseries(restricted, end_date=datetime(2011, 2, 1))
+        self.assertEqual(datetime(2011, 1, 10), timeseries.first_date)
+        self.assertEqual(22, len(timeseries))
+        self.assertTrue(numpy.may_share_memory(daily_timeseries.values, timeseries.values))
+
+
+class VerticalTimeseriesComputer_TestSuite(TestCase):
+
+    def setUp(self):
+        start = datetime(2011, 1, 1)
+        self.timeseries_list = [
+            create_timeseries(start, [(day * 7) % 23 for day in range(400)]),
+            create_timeseries(start, [(day * 3) % 5 for day in range(400)]),
+            create_timeseries(start, [((day * 5) % 11) - 5 for day in range(400)]),
+            create_timeseries(start + timedelta(10), [-((day * 5) % 3) for day in range(300)])]
+
+    def assert_same_outcome(self, expected_outcome, outcome):
+        self.assertEqual(sorted(expected_outcome.keys()), sorted(outcome.keys()))
+        for name, timeseries in expected_outcome.items():
+            self.assertEqual(list(timeseries.events()), list(outcome[name].events()))
+
+    def test_a(self):
+        """Test the computation using arrays is equal to the one using events."""
+        computer = VerticalTimeseriesComputer()
+        expected_outcome = computer.compute(2950181.0, 0.8, *self.timeseries_list)
+        daily_timeseries_list = [load_daily_timeseries(timeseries)
+                                 for timeseries in self.timeseries_list]
+        outcome = computer.compute(2950181.0, 0.8, *daily_timeseries_list)
+        self.assert_same_outcome(expected_outcome, outcome)
+
+    def test_b(self):
+        """Test the computation using arrays only computes the given range."""
+        computer = VerticalTimeseriesComputer()
+        computer.inside_range = DateRange(datetime(2011, 3, 1), datetime(2011, 4, 1)).inside
+        expected_outcome = computer.compute(2950181.0, 0.8, *self.timeseries_list)
+        daily_timeseries_list = [load_daily_timeseries(timeseries)
+                                 for timeseries in self.timeseries_list]
+        outcome = computer.compute(2950181.0, 0.8, *daily_timeseries_list)
+        self.assert_same_outcome(expected_outcome, outcome)
+        self.assertEqual(31, len(list(outcome['precipitation'].events())))
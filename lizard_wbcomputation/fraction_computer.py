@@ -25,6 +25,8 @@
 #
 #******************************************************************************
 
+from lizard_wbcomputation.checkpoint import map_checkpoints
+
 from timeseries.timeseriesstub import enumerate_dict_events
 from timeseries.timeseriesstub import SparseTimeseriesStub
 
@@ -32,7 +34,8 @@ from timeseries.timeseriesstub import SparseTimeseriesStub
 class FractionComputer:
 
     def compute(self, area, buckets_summary, precipitation_timeseries, seepage_timeseries,
-                storage_timeseries, total_output_timeseries, intakes_timeseries, start_date, end_date):
+                storage_timeseries, total_output_timeseries, intakes_timeseries, start_date, end_date,
+                checkpoint=None, checkpoints=None):
         """Compute and return the fraction series.
 
         This function returns the pair of SparseTimeseriesStub(s) that consists of
@@ -45,6 +48,12 @@ class FractionComputer:
         * seepage,
         * storage_timeseries -- storage time series in [m3/day]
         * intakes_timeseries -- list of intake timeseries in [m3/day]
+        * checkpoint -- Checkpoint to start the computation from at its date,
+          or None to start from the initial water level at the start date
+        * checkpoints -- list of Checkpoint(s) in which to store the fractions
+          and the storage at the start of their date, or None
+
+        A Checkpoint refers to an intake by its name.
 
         """
         fractions_initial = SparseTimeseriesStub()
@@ -73,6 +82,40 @@ class FractionComputer:
 
         previous_storage = self.initial_storage(area)
 
+        first = True
+        if checkpoint is not None:
+            start_date = max(start_date, checkpoint.date)
+            fractions = checkpoint.fractions
+            previous_initial = fractions['initial']
+            previous_precipitation = fractions['precipitation']
+            previous_seepage = fractions['seepage']
+            previous_hardened = fractions['hardened']
+            previous_sewer = fractions['sewer']
+            previous_drained = fractions['drained']
+            previous_undrained = fractions['undrained']
+            previous_flow_off = fractions['flow_off']
+            for key in intakes_timeseries.keys():
+                previous_intakes[key] = fractions['intakes'].get(key.name, 0.0)
+            previous_storage = checkpoint.storage
+            first = False
+
+        day2checkpoint = map_checkpoints(checkpoints)
+
+        def store_state(day):
+            day_checkpoint = day2checkpoint.get(day)
+            if day_checkpoint is not None:
+                day_checkpoint.fractions = {
+                    'initial': previous_initial,
+                    'precipitation': previous_precipitation,
+                    'seepage': previous_seepage,
+                    'hardened': previous_hardened,
+                    'sewer': previous_sewer,
+                    'drained': previous_drained,
+                    'undrained': previous_undrained,
+                    'flow_off': previous_flow_off,
+                    'intakes': dict((key.name, value) for key, value in previous_intakes.items())}
+                day_checkpoint.storage = previous_storage
+
         ts = {}
         ts['hardened'] = buckets_summary.hardened
         ts['drained'] = buckets_summary.drained
@@ -85,7 +128,7 @@ class FractionComputer:
         ts['total_output'] = total_output_timeseries
         ts['intakes'] = intakes_timeseries
 
-        first = True
+        last_day = None
         for events in enumerate_dict_events(ts):
             date = events['date']
             if date < start_date:
@@ -97,6 +140,9 @@ class FractionComputer:
                 first = False
                 previous_storage = (area.init_water_level - area.bottom_height) * area.surface
 
+            last_day = date.toordinal()
+            store_state(last_day)
+
 
             total_output = -1 * events['total_output'][1]
             current_storage = events['storage'][1]
@@ -184,6 +230,9 @@ class FractionComputer:
 
             previous_storage = current_storage
 
+        if last_day is not None:
+            store_state(last_day + 1)
+
         result = {'initial':fractions_initial,
                 'precipitation':fractions_precipitation,
                 'seepage':fractions_seepage,
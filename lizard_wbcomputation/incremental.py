@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import logging
+import pickle
+
+from timeseries.timeseriesstub import SparseTimeseriesStub
+
+logger = logging.getLogger(__name__)
+
+# names of the methods of WaterbalanceComputer2 whose time series an
+# incremental computation extends
+OUTPUT_METHOD_NAMES = [
+    'get_buckets_timeseries',
+    'get_level_control_timeseries',
+    'get_fraction_timeseries',
+    'get_concentration_timeseries',
+    'calc_sluice_error_timeseries',
+    ]
+
+
+class ComputationRecord(object):
+    """Stores the outcome of a computation to extend it at a later time.
+
+    Instance variables:
+      *start_date*
+        date of the first day of the computation
+      *end_date*
+        date of the day *after* the last day of the computation
+      *checkpoint*
+        Checkpoint with the state at the start of the end date
+      *input_digest*
+        digest of the input time series before the end date
+      *outputs*
+        dictionary of output name to the SparseTimeseriesStub of its values
+        in [outputs_start, end_date)
+      *outputs_start*
+        date of the first day of the outputs, see trim_record
+
+    """
+    def __init__(self, start_date, end_date, checkpoint, input_digest, outputs,
+                 outputs_start=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.checkpoint = checkpoint
+        self.input_digest = input_digest
+        self.outputs = outputs
+        if outputs_start is None:
+            outputs_start = start_date
+        self.outputs_start = outputs_start
+
+    def __repr__(self):
+        return "ComputationRecord(%s, %s)" % (self.start_date.strftime('%Y-%m-%d'),
+                                              self.end_date.strftime('%Y-%m-%d'))
+
+
+def get_name(key):
+    """Return the name of the given dictionary key.
+
+    The dictionaries of time series often use buckets or pumping stations as
+    keys. As these are recreated from the database for each computation, we
+    refer to them by name.
+
+    """
+    return unicode(getattr(key, 'name', key))
+
+
+def flatten_timeseries(value, prefix=''):
+    """Return the list of pairs (name, time series) in the given value.
+
+    The value is a time series, a BucketOutcome or a (nested) dictionary of
+    these. The name of a time series is the path of names that leads to it,
+    separated by a slash. The list is sorted by name.
+
+    """
+    if hasattr(value, 'events'):
+        return [(prefix, value)]
+    if hasattr(value, 'name2timeseries'):
+        value = value.name2timeseries()
+    pairs = []
+    if isinstance(value, dict):
+        for key, item in value.iteritems():
+            pairs.extend(flatten_timeseries(item, prefix + '/' + get_name(key)))
+    return sorted(pairs)
+
+
+def digest_inputs(input_timeseries, end_dates):
+    """Return the digests of the input time series before the given dates.
+
+    This function returns a list that contains, for each given end date, the
+    hexadecimal SHA-1 digest of the names, dates and values of the events of
+    the given (nested dictionary of) input time series before that end date.
+    It reads each time series only once.
+
+    """
+    hashes = [hashlib.sha1() for end_date in end_dates]
+    for name, timeseries in flatten_timeseries(input_timeseries):
+        for (end_date, digest) in zip(end_dates, hashes):
+            digest.update(name.encode('utf-8') + '\n')
+        for date, value in timeseries.events():
+            event = '%s %r\n' % (date.isoformat(), value)
+            for (end_date, digest) in zip(end_dates, hashes):
+                if date < end_date:
+                    digest.update(event)
+    return [digest.hexdigest() for digest in hashes]
+
+
+def collect_outputs(computer, start_date, end_date, method_names=OUTPUT_METHOD_NAMES):
+    """Return the dictionary of output name to time series for the given period.
+
+    This function calls each of the given methods of the computer and
+    collects the time series they return, restricted to [start_date,
+    end_date). The name of each time series is prefixed by the name of its
+    method.
+
+    """
+    outputs = {}
+    for method_name in method_names:
+        outcome = getattr(computer, method_name)(start_date, end_date)
+        for name, timeseries in flatten_timeseries(outcome, method_name):
+            outputs[name] = timeseries
+    return outputs
+
+
+def extend_timeseries(timeseries, new_timeseries, start_date, end_date):
+    """Return the events of the given time series followed by the new ones.
+
+    This function returns a SparseTimeseriesStub with the events of the
+    first time series before the start date and the events of the new time
+    series in [start_date, end_date).
+
+    """
+    result = SparseTimeseriesStub()
+    for date, value in timeseries.events():
+        if date >= start_date:
+            break
+        result.add_value(date, value)
+    for date, value in new_timeseries.events():
+        if date < start_date:
+            continue
+        elif date < end_date:
+            result.add_value(date, value)
+        else:
+            break
+    return result
+
+
+def compute_record(computer, start_date, end_date, input_digest,
+                   method_names=OUTPUT_METHOD_NAMES):
+    """Compute and return the ComputationRecord of the given period."""
+    outputs = dict((name, extend_timeseries(timeseries, timeseries, start_date, end_date))
+                   for (name, timeseries) in
+                   collect_outputs(computer, start_date, end_date, method_names).iteritems())
+    checkpoints = [checkpoint for checkpoint in computer.compute_checkpoints(start_date, end_date)
+                   if checkpoint.date == end_date]
+    return ComputationRecord(start_date, end_date, checkpoints[0], input_digest, outputs)
+
+
+def compute_incremental(create_computer, start_date, end_date, record=None,
+                        method_names=OUTPUT_METHOD_NAMES):
+    """Compute and return the ComputationRecord of the given period.
+
+    Parameters:
+      *create_computer*
+        function that takes a Checkpoint and a list of checkpoint dates and
+        returns a WaterbalanceComputer2 that restarts from that Checkpoint
+      *start_date*
+        date of the first day of the computation
+      *end_date*
+        date of the day *after* the last day of the computation
+      *record*
+        ComputationRecord of a previous computation, None to compute the
+        whole period
+
+    When the previous computation started at the same date and the input time
+    series before its end date did not change, this function only computes
+    the days from the end date of the previous computation and appends the
+    time series of these days to the previous ones. Otherwise it falls back
+    to a computation of the whole period.
+
+    Note that this function has to read the input time series of the whole
+    period to detect whether they have changed. The expensive part, the
+    computation of the waterbalance, only has to be done for the new days.
+
+    """
+    computer = create_computer(None, [end_date])
+    input_timeseries = computer.get_input_timeseries(start_date, end_date)
+    if record is None:
+        input_digest = digest_inputs(input_timeseries, [end_date])[0]
+    else:
+        previous_digest, input_digest = \
+            digest_inputs(input_timeseries, [record.end_date, end_date])
+        if record.start_date != start_date or record.end_date > end_date:
+            logger.info("Recompute %s-%s as the previous period %s-%s differs",
+                        start_date, end_date, record.start_date, record.end_date)
+        elif record.input_digest != previous_digest:
+            logger.info("Recompute %s-%s as its input before %s has changed",
+                        start_date, end_date, record.end_date)
+        elif record.end_date == end_date:
+            return record
+        else:
+            restarted_computer = create_computer(record.checkpoint, [end_date])
+            new_record = compute_record(restarted_computer, record.end_date,
+                                        end_date, input_digest, method_names)
+            if set(new_record.outputs) == set(record.outputs):
+                for name, timeseries in new_record.outputs.iteritems():
+                    new_record.outputs[name] = extend_timeseries(
+                        record.outputs[name], timeseries, record.end_date, end_date)
+                new_record.start_date = start_date
+                new_record.outputs_start = getattr(record, 'outputs_start', start_date)
+                return new_record
+            logger.info("Recompute %s-%s as its outputs differ from the "
+                        "previous ones", start_date, end_date)
+    return compute_record(computer, start_date, end_date, input_digest, method_names)
+
+
+def trim_record(record, start_date):
+    """Remove the output events before the given date from the given record.
+
+    An incremental computation only needs the state at the end date of the
+    previous computation, the outputs before that date are only kept to be
+    returned. This function lets the caller keep only the tail of the outputs
+    it needs, for example the days of the last month when it aggregates the
+    outputs per month.
+
+    """
+    start_date = max(start_date, record.outputs_start)
+    for name, timeseries in record.outputs.iteritems():
+        tail = SparseTimeseriesStub()
+        for date, value in timeseries.events():
+            if date >= start_date:
+                tail.add_value(date, value)
+        record.outputs[name] = tail
+    record.outputs_start = start_date
+
+
+def save_record(file_name, record):
+    """Store the given ComputationRecord in the file with the given name."""
+    record_file = open(file_name, 'wb')
+    try:
+        pickle.dump(record, record_file, pickle.HIGHEST_PROTOCOL)
+    finally:
+        record_file.close()
+
+
+def load_record(file_name):
+    """Return the ComputationRecord stored in the file with the given name."""
+    record_file = open(file_name, 'rb')
+    try:
+        return pickle.load(record_file)
+    finally:
+        record_file.close()
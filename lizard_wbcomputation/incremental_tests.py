@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays_tests import Bucket
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.bucket_computer import compute_multiple_timeseries
+from lizard_wbcomputation.bucket_types import BucketTypes
+from lizard_wbcomputation.checkpoint import Checkpoint
+from lizard_wbcomputation.incremental import compute_incremental
+from lizard_wbcomputation.incremental import digest_inputs
+from lizard_wbcomputation.incremental import load_record
+from lizard_wbcomputation.incremental import save_record
+from lizard_wbcomputation.incremental import trim_record
+from timeseries.timeseriesstub import TimeseriesRestrictedStub
+
+
+class Computer(object):
+    """Implements the part of WaterbalanceComputer2 that computes the buckets."""
+
+    def __init__(self, fixture, checkpoint=None, checkpoint_dates=None):
+        self.fixture = fixture
+        self.checkpoint = checkpoint
+        self.checkpoints = [Checkpoint(date) for date in checkpoint_dates or []]
+
+    def get_input_timeseries(self, start_date, end_date):
+        input_timeseries = {}
+        for name in ['precipitation', 'evaporation']:
+            input_timeseries[name] = TimeseriesRestrictedStub(
+                timeseries=getattr(self.fixture, name),
+                start_date=start_date, end_date=end_date)
+        for bucket in self.fixture.buckets:
+            input_timeseries[bucket] = {'seepage': TimeseriesRestrictedStub(
+                timeseries=self.fixture.bucket2seepage[bucket],
+                start_date=start_date, end_date=end_date)}
+        return input_timeseries
+
+    def get_buckets_timeseries(self, start_date, end_date):
+        self.fixture.periods.append((start_date, end_date))
+        input_timeseries = self.get_input_timeseries(start_date, end_date)
+        bucket2seepage = dict((bucket, input_timeseries[bucket]['seepage'])
+                              for bucket in self.fixture.buckets)
+        return compute_multiple_timeseries(self.fixture.buckets,
+            input_timeseries['precipitation'], input_timeseries['evaporation'],
+            bucket2seepage, checkpoint=self.checkpoint,
+            checkpoints=self.checkpoints)
+
+    def compute_checkpoints(self, start_date, end_date):
+        return self.checkpoints
+
+
+class compute_incremental_TestSuite(TestCase):
+
+    def setUp(self):
+        self.start_date = datetime(2011, 1, 1)
+        self.end_date = datetime(2011, 6, 1)
+        self.new_end_date = datetime(2011, 6, 11)
+        self.precipitation = create_timeseries(self.start_date, [(day * 7) % 23 for day in range(400)])
+        self.evaporation = create_timeseries(self.start_date, [(day * 3) % 5 for day in range(400)])
+        self.buckets = []
+        self.bucket2seepage = {}
+        for surface_type in [BucketTypes.UNDRAINED_SURFACE,
+                             BucketTypes.HARDENED_SURFACE,
+                             BucketTypes.DRAINED_SURFACE]:
+            bucket = Bucket()
+            bucket.name = 'bucket %d' % len(self.buckets)
+            bucket.surface_type = surface_type
+            self.buckets.append(bucket)
+            offset = len(self.buckets)
+            self.bucket2seepage[bucket] = \
+                create_timeseries(self.start_date, [((day * 5 + offset) % 11) - 5 for day in range(400)])
+        self.periods = []
+
+    def create_computer(self, checkpoint, checkpoint_dates):
+        return Computer(self, checkpoint, checkpoint_dates)
+
+    def compute(self, end_date, record=None):
+        return compute_incremental(self.create_computer, self.start_date,
+                                   end_date, record, ['get_buckets_timeseries'])
+
+    def assert_same_outputs(self, expected_record, record):
+        self.assertEqual(sorted(expected_record.outputs), sorted(record.outputs))
+        for name, timeseries in expected_record.outputs.iteritems():
+            self.assertEqual(list(timeseries.events()),
+                             list(record.outputs[name].events()))
+
+    def test_a(self):
+        """Test an incremental computation only computes the new days."""
+        record = self.compute(self.end_date)
+        self.periods = []
+        record = self.compute(self.new_end_date, record)
+        self.assertEqual([(self.end_date, self.new_end_date)], self.periods)
+        self.assertEqual(self.start_date, record.start_date)
+        self.assertEqual(self.new_end_date, record.end_date)
+        self.assertEqual(self.new_end_date, record.checkpoint.date)
+
+    def test_b(self):
+        """Test an incremental computation is equal to a full computation."""
+        expected_record = self.compute(self.new_end_date)
+        record = self.compute(self.new_end_date, self.compute(self.end_date))
+        self.assertEqual(expected_record.input_digest, record.input_digest)
+        self.assertEqual(expected_record.checkpoint.__dict__, record.checkpoint.__dict__)
+        self.assert_same_outputs(expected_record, record)
+
+    def test_c(self):
+        """Test a change in the input before the end date causes a full computation."""
+        record = self.compute(self.end_date)
+        self.precipitation.values[10] += 1.0
+        self.periods = []
+        record = self.compute(self.new_end_date, record)
+        self.assertEqual([(self.start_date, self.new_end_date)], self.periods)
+        self.assert_same_outputs(self.compute(self.new_end_date), record)
+
+    def test_d(self):
+        """Test a computation without new days returns the previous record."""
+        record = self.compute(self.end_date)
+        self.periods = []
+        self.assertTrue(record is self.compute(self.end_date, record))
+        self.assertEqual([], self.periods)
+
+    def test_e(self):
+        """Test digest_inputs only digests the events before each end date."""
+        input_timeseries = {'precipitation': self.precipitation}
+        digest, other_digest = digest_inputs(input_timeseries, [self.end_date, self.new_end_date])
+        self.assertNotEqual(digest, other_digest)
+        self.precipitation.values[155] += 1.0
+        self.assertEqual(digest, digest_inputs(input_timeseries, [self.end_date])[0])
+        self.assertNotEqual(other_digest, digest_inputs(input_timeseries, [self.new_end_date])[0])
+
+    def test_f(self):
+        """Test an incremental computation extends the tail of a trimmed record."""
+        tail_start = datetime(2011, 5, 1)
+        record = self.compute(self.end_date)
+        trim_record(record, tail_start)
+        record = self.compute(self.new_end_date, record)
+        self.assertEqual(tail_start, record.outputs_start)
+        expected_record = self.compute(self.new_end_date)
+        trim_record(expected_record, tail_start)
+        self.assert_same_outputs(expected_record, record)
+        for timeseries in record.outputs.values():
+            self.assertEqual(tail_start, list(timeseries.events())[0][0])
+
+
+class save_record_TestSuite(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_a(self):
+        """Test the stored record can be loaded."""
+        fixture = compute_incremental_TestSuite('test_a')
+        fixture.setUp()
+        record = fixture.compute(fixture.end_date)
+        file_name = os.path.join(self.directory, 'record')
+        save_record(file_name, record)
+        loaded_record = load_record(file_name)
+        self.assertEqual(record.input_digest, loaded_record.input_digest)
+        self.assertEqual(record.checkpoint.__dict__, loaded_record.checkpoint.__dict__)
+        fixture.assert_same_outputs(record, loaded_record)
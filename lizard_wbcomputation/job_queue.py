@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sqlite3
+import time
+
+# status of a job that waits for a worker
+QUEUED = 'queued'
+
+# status of a job that is being processed by a worker
+RUNNING = 'running'
+
+# status of a job that has been processed successfully
+DONE = 'done'
+
+# status of a job whose processing raised an exception
+FAILED = 'failed'
+
+# number of seconds after which a running job is considered to be abandoned
+# by its worker, for example because the worker was killed
+DEFAULT_RUNNING_TIMEOUT = 60 * 60
+
+
+class JobQueue(object):
+    """Implements a queue of jobs that is stored in an SQLite database.
+
+    Each job is identified by a key, for example the fingerprint of the
+    inputs of a configuration, and has a single argument, for example the
+    primary key of that configuration. The queue contains at most one job
+    per key, so the same computation is never queued or run twice at the
+    same time: a request to submit a job whose key is already queued or
+    running returns the status of that job instead.
+
+    Multiple processes can use the same queue: the web workers that submit
+    jobs and wait for their completion and the worker processes that claim
+    and process them. Each method uses its own connection and transaction.
+
+    Instance variables:
+      *file_name*
+        name of the SQLite database file
+      *running_timeout*
+        number of seconds after which a running job is queued again
+
+    """
+    def __init__(self, file_name, running_timeout=DEFAULT_RUNNING_TIMEOUT,
+                 clock=time.time):
+        self.file_name = file_name
+        self.running_timeout = running_timeout
+        self.clock = clock
+        connection = self._connect()
+        try:
+            connection.execute("CREATE TABLE IF NOT EXISTS job ("
+                               "key TEXT PRIMARY KEY, "
+                               "argument TEXT, "
+                               "status TEXT NOT NULL, "
+                               "message TEXT, "
+                               "updated REAL NOT NULL)")
+        finally:
+            connection.close()
+
+    def _connect(self):
+        # we manage the transactions ourselves, see BEGIN IMMEDIATE below
+        return sqlite3.connect(self.file_name, timeout=30, isolation_level=None)
+
+    def submit(self, key, argument):
+        """Queue the job with the given key and argument.
+
+        When a job with the given key is already queued, running or done,
+        this method does not queue it again. A job that failed is queued
+        again. This method returns the status of the job.
+
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT status FROM job WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None or row[0] == FAILED:
+                connection.execute("INSERT OR REPLACE INTO job "
+                                   "(key, argument, status, message, updated) "
+                                   "VALUES (?, ?, ?, NULL, ?)",
+                                   (key, unicode(argument), QUEUED, self.clock()))
+                status = QUEUED
+            else:
+                status = row[0]
+            connection.execute("COMMIT")
+            return status
+        finally:
+            connection.close()
+
+    def get_status(self, key):
+        """Return the status of the job with the given key, or None."""
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT status FROM job WHERE key = ?",
+                                     (key,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return row[0]
+
+    def get_message(self, key):
+        """Return the error message of the job with the given key, or None."""
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT message FROM job WHERE key = ?",
+                                     (key,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return row[0]
+
+    def claim(self):
+        """Mark the oldest queued job as running and return it.
+
+        This method returns the pair (key, argument) of the claimed job, or
+        None when no job is queued. A job that has been running for longer
+        than the running timeout is claimed again, as its worker has
+        probably died.
+
+        """
+        now = self.clock()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("UPDATE job SET status = ?, updated = ? "
+                               "WHERE status = ? AND updated < ?",
+                               (QUEUED, now, RUNNING, now - self.running_timeout))
+            row = connection.execute("SELECT key, argument FROM job "
+                                     "WHERE status = ? ORDER BY updated LIMIT 1",
+                                     (QUEUED,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE job SET status = ?, updated = ? "
+                                   "WHERE key = ?", (RUNNING, now, row[0]))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return row[0], row[1]
+
+    def finish(self, key, message=None):
+        """Mark the job with the given key as done.
+
+        When an error message is given, the job is marked as failed.
+
+        """
+        if message is None:
+            status = DONE
+        else:
+            status = FAILED
+        connection = self._connect()
+        try:
+            connection.execute("UPDATE job SET status = ?, message = ?, updated = ? "
+                               "WHERE key = ?", (status, message, self.clock(), key))
+        finally:
+            connection.close()
+
+    def remove_finished(self, age):
+        """Remove the jobs that finished more than the given number of seconds ago."""
+        connection = self._connect()
+        try:
+            connection.execute("DELETE FROM job WHERE status IN (?, ?) AND updated < ?",
+                               (DONE, FAILED, self.clock() - age))
+        finally:
+            connection.close()
+
+    def wait(self, key, timeout, interval=0.5, sleep=time.sleep):
+        """Wait until the job with the given key has finished and return its status.
+
+        This method polls the status of the job every interval seconds and
+        returns its status when the job has finished or when the given
+        number of seconds has passed, whichever comes first.
+
+        """
+        deadline = self.clock() + timeout
+        status = self.get_status(key)
+        while status in (QUEUED, RUNNING) and self.clock() < deadline:
+            sleep(interval)
+            status = self.get_status(key)
+        return status
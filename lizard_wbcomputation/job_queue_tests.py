@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import tempfile
+
+from unittest import TestCase
+
+from lizard_wbcomputation.job_queue import DONE
+from lizard_wbcomputation.job_queue import FAILED
+from lizard_wbcomputation.job_queue import JobQueue
+from lizard_wbcomputation.job_queue import QUEUED
+from lizard_wbcomputation.job_queue import RUNNING
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        handle, self.file_name = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        self.clock = Clock()
+        self.queue = JobQueue(self.file_name, running_timeout=60, clock=self.clock)
+
+    def tearDown(self):
+        os.remove(self.file_name)
+
+    def test_a(self):
+        """Test a job that is queued or running is not submitted again."""
+        self.assertEqual(QUEUED, self.queue.submit('0123', 1))
+        self.assertEqual(QUEUED, self.queue.submit('0123', 1))
+        self.assertEqual(('0123', u'1'), self.queue.claim())
+        self.assertEqual(None, self.queue.claim())
+        self.assertEqual(RUNNING, self.queue.submit('0123', 1))
+
+    def test_b(self):
+        """Test a failed job is submitted again but a done job is not."""
+        self.queue.submit('0123', 1)
+        self.queue.submit('4567', 2)
+        self.queue.claim()
+        self.queue.claim()
+        self.queue.finish('0123')
+        self.queue.finish('4567', 'no open water')
+        self.assertEqual(DONE, self.queue.submit('0123', 1))
+        self.assertEqual(FAILED, self.queue.get_status('4567'))
+        self.assertEqual('no open water', self.queue.get_message('4567'))
+        self.assertEqual(QUEUED, self.queue.submit('4567', 2))
+
+    def test_c(self):
+        """Test a job that runs longer than the timeout is claimed again."""
+        self.queue.submit('0123', 1)
+        self.queue.claim()
+        self.clock.now += 61
+        self.assertEqual(('0123', u'1'), self.queue.claim())
+
+    def test_d(self):
+        """Test wait returns the status of a job that is still running after the timeout."""
+        self.queue.submit('0123', 1)
+        self.assertEqual(QUEUED, self.queue.wait('0123', 2, sleep=self.clock.sleep))
+        self.assertTrue(self.clock.now >= 1002.0)
+        self.queue.claim()
+        self.queue.finish('0123')
+        self.assertEqual(DONE, self.queue.wait('0123', 2, sleep=self.clock.sleep))
+
+    def test_e(self):
+        """Test remove_finished only removes the jobs that finished long ago."""
+        self.queue.submit('0123', 1)
+        self.queue.submit('4567', 2)
+        self.queue.claim()
+        self.queue.finish('0123')
+        self.clock.now += 100
+        self.queue.remove_finished(50)
+        self.assertEqual(None, self.queue.get_status('0123'))
+        self.assertEqual(QUEUED, self.queue.get_status('4567'))
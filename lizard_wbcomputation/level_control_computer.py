@@ -27,9 +27,9 @@
 
 import logging
 
-from datetime import timedelta
+from lizard_wbcomputation.checkpoint import map_checkpoints
+from lizard_wbcomputation.daily_frame import DailyFrame
 
-from timeseries.timeseriesstub import enumerate_dict_events
 from timeseries.timeseriesstub import SparseTimeseriesStub
 
 logger = logging.getLogger(__name__)
@@ -90,17 +90,30 @@ class LevelControlComputer:
         * pumps_timeseries -- dict of pump timeseries in [m3/day]
 
         """
-        storage = SparseTimeseriesStub()
-        result = SparseTimeseriesStub()
-        water_level_timeseries = SparseTimeseriesStub()
-        pump_time_series = SparseTimeseriesStub()
-        intake_time_series = SparseTimeseriesStub()
-        total_incoming = SparseTimeseriesStub()
-        total_outgoing = SparseTimeseriesStub()
-
-        surface = 1.0 * area.surface
-        water_level = area.init_water_level
+        ts = self.create_input(buckets_summary, precipitation, evaporation, seepage, infiltration,
+                               minimum_level_timeseries, maximum_level_timeseries,
+                               intakes_timeseries, pumps_timeseries)
+        frame = DailyFrame(ts)
+
+        # we only compute the level control for the days that lie in the range
+        # of self.inside_range
+        first_index, end_index = 0, 0
+        day_range = frame.range()
+        if day_range is not None:
+            first_index = self._find_index(frame, day_range, lambda date: self.inside_range(date) >= 0)
+            end_index = self._find_index(frame, (first_index, day_range[1]),
+                                         lambda date: self.inside_range(date) > 0)
+        return self.compute_frame(area, frame.slice(first_index, end_index), max_intake, max_outtake)
+
+    def create_input(self, buckets_summary, precipitation, evaporation, seepage, infiltration,
+                     minimum_level_timeseries, maximum_level_timeseries,
+                     intakes_timeseries, pumps_timeseries):
+        """Return the dictionary of the time series to compute the level control.
+
+        The parameters are the same as the parameters of method compute. The
+        dictionary can be passed to a DailyFrame for method compute_frame.
 
+        """
         ts = {}
         ts['bucket_total_incoming'] = buckets_summary.total_incoming
         ts['bucket_total_outgoing'] = buckets_summary.total_outgoing
@@ -120,37 +133,81 @@ class LevelControlComputer:
         for pump, timeseries in pumps_timeseries.iteritems():
             if not pump.is_computed:
                 ts['pumps'][pump] = timeseries
+        return ts
 
-        for events in enumerate_dict_events(ts):
-            date = events['date']
-            if self.inside_range(date) < 0:
-                continue
-            elif self.inside_range(date) > 0:
-                break
+    def compute_frame(self, area, frame, max_intake = None, max_outtake = None,
+                      checkpoint=None, checkpoints=None):
+        """Compute and return the level control time series from a DailyFrame.
 
-            if not events.has_key('intakes'):
-                events['intakes'] = {}
+        This method computes the same time series as method compute, but it
+        reads its input from the given DailyFrame, which contains the time
+        series returned by method create_input. It computes the level control
+        for each day of the frame for which any of these time series has a
+        value, so it does not use self.inside_range.
 
-            incoming_value = [ events['bucket_total_outgoing'][1],
-                                  events['precipitation'][1],
-                                  events['seepage'][1]] + \
-                                  [event[1] for event in events['intakes'].values()]
+        When a Checkpoint is given, this method starts at the date of that
+        Checkpoint from its water level. When a list of Checkpoint(s) is given,
+        this method stores the water level at the start of their date in
+        them.
 
-            incoming_value = sum(incoming_value)
+        """
+        names = ['intake_wl_control', 'outtake_wl_control', 'storage',
+                 'water_level', 'total_incoming', 'total_outgoing']
+        day_range = frame.range()
+        if day_range is None:
+            return dict((name, SparseTimeseriesStub()) for name in names)
+        first_index, end_index = day_range
+        day2checkpoint = map_checkpoints(checkpoints)
+        first_day = frame.date(first_index).toordinal() - first_index
 
-            if not events.has_key('pumps'):
-                events['pumps'] = {}
+        surface = 1.0 * area.surface
+        if checkpoint is None:
+            water_level = area.init_water_level
+        else:
+            first_index = max(first_index, checkpoint.date.toordinal() - first_day)
+            water_level = checkpoint.water_level
+
+        column = lambda name: frame.columns[name].tolist()
+        bucket_total_incoming = column('bucket_total_incoming')
+        bucket_total_outgoing = column('bucket_total_outgoing')
+        precipitation = column('precipitation')
+        evaporation = column('evaporation')
+        seepage = column('seepage')
+        infiltration = column('infiltration')
+        min_level = column('min_level')
+        max_level = column('max_level')
+        intakes = [values.tolist() for values in frame.group('intakes')]
+        pumps = [values.tolist() for values in frame.group('pumps')]
+
+        pump_values = []
+        intake_values = []
+        storage_values = []
+        water_level_values = []
+        total_incoming_values = []
+        total_outgoing_values = []
+
+        for index in xrange(first_index, end_index):
+
+            if first_day + index in day2checkpoint:
+                day2checkpoint[first_day + index].water_level = water_level
+
+            incoming_value = [ bucket_total_outgoing[index],
+                                  precipitation[index],
+                                  seepage[index]] + \
+                                  [values[index] for values in intakes]
 
-            outgoing_value = [ events['bucket_total_incoming'][1],
-                                  events['infiltration'][1],
-                                  events['evaporation'][1]] + \
-                                  [event[1] for event in events['pumps'].values()]
+            incoming_value = sum(incoming_value)
+
+            outgoing_value = [ bucket_total_incoming[index],
+                                  infiltration[index],
+                                  evaporation[index]] + \
+                                  [values[index] for values in pumps]
 
             outgoing_value = sum(outgoing_value)
 
             water_level += (incoming_value + outgoing_value) / surface
 
-            level_control = self._compute_level_control(surface, water_level, events['min_level'][1], events['max_level'][1])
+            level_control = self._compute_level_control(surface, water_level, min_level[index], max_level[index])
 
             if level_control < 0:
                 if max_outtake is not None:
@@ -167,27 +224,43 @@ class LevelControlComputer:
 
             water_level += (pump + intake) / surface
 
-            pump_time_series.add_value(date, pump)
-            intake_time_series.add_value(date, intake)
+            pump_values.append(pump)
+            intake_values.append(intake)
 
-            water_level_timeseries.add_value(date, water_level)
+            water_level_values.append(water_level)
 
             storage_value = (water_level - area.bottom_height) * surface
-            storage.add_value(date, storage_value)
+            storage_values.append(storage_value)
+
+            total_incoming_values.append(sum([incoming_value, intake]))
+            total_outgoing_values.append(sum([outgoing_value, pump]))
 
-            result.add_value(date, level_control)
+        if first_day + end_index in day2checkpoint:
+            day2checkpoint[first_day + end_index].water_level = water_level
 
-            total_incoming.add_value(date, sum([incoming_value, intake]))
-            total_outgoing.add_value(date, sum([outgoing_value, pump]))
+        return {'intake_wl_control':frame.create_timeseries(first_index, intake_values),
+                'outtake_wl_control':frame.create_timeseries(first_index, pump_values),
+                'storage':frame.create_timeseries(first_index, storage_values),
+                'water_level':frame.create_timeseries(first_index, water_level_values),
+                'total_incoming':frame.create_timeseries(first_index, total_incoming_values),
+                'total_outgoing':frame.create_timeseries(first_index, total_outgoing_values)}
 
-            date += timedelta(1)
+    def _find_index(self, frame, index_range, predicate):
+        """Return the first index in the given range whose date satisfies the
+        given predicate, or the end of the range when no such index exists.
 
-        return {'intake_wl_control':intake_time_series,
-                'outtake_wl_control':pump_time_series,
-                'storage':storage,
-                'water_level':water_level_timeseries,
-                'total_incoming':total_incoming,
-                'total_outgoing':total_outgoing}
+        The predicate should not hold for the dates before that index and
+        should hold for the dates from that index on.
+
+        """
+        low, high = index_range
+        while low < high:
+            middle = (low + high) // 2
+            if predicate(frame.date(middle)):
+                high = middle
+            else:
+                low = middle + 1
+        return low
 
     def _compute_level_control(self, surface, water_level, minimum_water_level, maximum_water_level):
         """Compute and return the level control for the given date.
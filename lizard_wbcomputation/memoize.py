@@ -3,31 +3,339 @@
 
 # pylint: disable=C0111
 
+import sys
+import threading
+
+from collections import OrderedDict
+from itertools import islice
+
+# default maximum number of bytes of the results cached for a single instance,
+# an instance can override this value through attribute memoize_max_bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+# estimated number of bytes of a single event of a time series that does not
+# store its values in an array
+EVENT_BYTES = 64
+
+# maximum number of items of a container whose size is estimated, the size of
+# the other items is extrapolated from the size of these items
+SAMPLE_SIZE = 16
+
+
+def estimate_items_size(items, count):
+    """Return an estimate of the number of bytes used by the given items.
+
+    This function only estimates the size of the first SAMPLE_SIZE items and
+    extrapolates that size to the given number of items.
+
+    """
+    sample = list(islice(items, SAMPLE_SIZE))
+    if len(sample) == 0:
+        return 0
+    return sum(estimate_size(item) for item in sample) * count // len(sample)
+
+
+def estimate_size(value):
+    """Return an estimate of the number of bytes used by the given value.
+
+    The estimate includes the data of a numpy array, the events of a time
+    series and the (estimated) size of the items of a list, tuple, set or
+    dictionary. It does not include the attributes of other objects, as these
+    objects are often model objects or inputs that are shared by multiple
+    results.
+
+    The estimate has to be cheap, as it is computed for each result that is
+    stored: the time it takes does not depend on the number of events or the
+    number of values in an array.
+
+    """
+    if hasattr(value, 'nbytes'):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value, 64) + estimate_items_size(value.itervalues(), len(value))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value, 64) + estimate_items_size(iter(value), len(value))
+    # a DailyTimeseries and SparseTimeseriesStub store their values in
+    # attribute values, a TimeseriesStub stores its events in attribute
+    # _events
+    for name in ['values', '_events']:
+        events = getattr(value, name, None)
+        if hasattr(events, 'nbytes'):
+            return events.nbytes
+        if isinstance(events, list):
+            return len(events) * EVENT_BYTES
+    return sys.getsizeof(value, 64)
+
+
+class MemoizeStatistics(object):
+    """Stores the number of cache hits, misses and evictions of a method.
+
+    The number of range hits is the number of results that were derived from
+    the cached result of a wider period, see memoize_range.
+
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.range_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return "MemoizeStatistics(hits=%d, range_hits=%d, misses=%d, evictions=%d)" % \
+               (self.hits, self.range_hits, self.misses, self.evictions)
+
+
+class MemoizeCache(object):
+    """Implements the cache of the memoized results of a single instance.
+
+    The cache evicts the least recently used results when the estimated
+    number of bytes of all results exceeds the maximum number of bytes. The
+    most recently stored result is never evicted, even when it exceeds the
+    maximum number of bytes on its own.
+
+    All access to the cache is guarded by a lock so multiple threads can use
+    the same cache. The lock is not held during the computation of a result,
+    so two threads that request the same missing result both compute it.
+
+    Instance variables:
+      *max_bytes*
+        maximum number of bytes of the cached results
+      *total_bytes*
+        estimated number of bytes of the cached results
+      *statistics*
+        dictionary of method name to MemoizeStatistics
+
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self.statistics = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_statistics(self, name):
+        return self.statistics.setdefault(name, MemoizeStatistics())
+
+    def get_statistics(self, name):
+        """Return the MemoizeStatistics of the given method."""
+        with self._lock:
+            return self._get_statistics(name)
+
+    def lookup(self, name, args):
+        """Return the pair (found, result) for the given method and arguments.
+
+        If the result is not present, this method returns (False, None).
+
+        """
+        key = (name, args)
+        with self._lock:
+            statistics = self._get_statistics(name)
+            if key in self._entries:
+                result, size = self._entries.pop(key)
+                self._entries[key] = (result, size)
+                statistics.hits += 1
+                return True, result
+            statistics.misses += 1
+            return False, None
+
+    def lookup_range(self, name, args, same_start=False):
+        """Return the triple (found, result, args) for the given method and period.
+
+        The first two arguments of the method should be the start date and the
+        end date of a period. If the result for the given arguments is not
+        present, this method looks for the result of a period that contains the
+        given period and whose other arguments are the same. If same_start
+        holds, that period should start at the given start date.
+
+        The third element of the returned triple are the arguments of the
+        result that is found, or None when no result is found.
+
+        """
+        key = (name, args)
+        start_date, end_date, other_args = args[0], args[1], args[2:]
+        with self._lock:
+            statistics = self._get_statistics(name)
+            if key in self._entries:
+                found_key = key
+                statistics.hits += 1
+            else:
+                found_key = None
+                for entry_key in reversed(self._entries):
+                    entry_name, entry_args = entry_key
+                    if entry_name != name or entry_args[2:] != other_args:
+                        continue
+                    if same_start:
+                        contains = entry_args[0] == start_date
+                    else:
+                        contains = entry_args[0] <= start_date
+                    if contains and end_date <= entry_args[1]:
+                        found_key = entry_key
+                        break
+                if found_key is None:
+                    statistics.misses += 1
+                    return False, None, None
+                statistics.range_hits += 1
+            result, size = self._entries.pop(found_key)
+            self._entries[found_key] = (result, size)
+            return True, result, found_key[1]
+
+    def store(self, name, args, result):
+        """Store the result for the given method and arguments."""
+        key = (name, args)
+        size = self.sizeof(result)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                (evicted_name, evicted_args), (evicted_result, evicted_size) = \
+                    self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self._get_statistics(evicted_name).evictions += 1
+
+    def clear(self):
+        """Remove all results from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+def get_memoize_cache(instance):
+    """Return the MemoizeCache of the given instance.
+
+    This function creates the MemoizeCache when the instance does not have
+    one yet. The maximum number of bytes of that cache is the value of
+    attribute memoize_max_bytes of the instance, or DEFAULT_MAX_BYTES when
+    the instance does not have that attribute.
+
+    """
+    cache = instance.__dict__.get('_memoize_cache')
+    if cache is None:
+        max_bytes = getattr(instance, 'memoize_max_bytes', DEFAULT_MAX_BYTES)
+        # dict.setdefault is atomic, so when two threads create a cache at the
+        # same time, both use the same one
+        cache = instance.__dict__.setdefault('_memoize_cache', MemoizeCache(max_bytes))
+    return cache
+
+
 class memoize(object):
     """Implements a memoize decorator for instance methods.
 
     The memoize decorator caches the results of the invocation of an instance
-    method.
+    method in the MemoizeCache of that instance.
 
-    This decorator class is by Oleg Noga and was found at
+    This decorator class was inspired by the one of Oleg Noga, which can be
+    found at
 
         http://code.activestate.com/recipes/577452-a-memoize-decorator-for-instance-methods/
 
-    The original snippet by Oleg Noga can be found here
-
-        http://code.activestate.com/recipes/466320-another-memoize/#c7
+    That decorator stored the instance on the decorator itself, which is
+    shared by all instances. This decorator binds to the instance instead, so
+    it can be used by multiple threads that use different instances.
 
     """
     def __init__(self, function):
         self._function = function
-        self._cacheName = '_cache__' + function.__name__
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
     def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        return BoundMemoize(self._function, instance)
+
+
+class BoundMemoize(object):
+    """Implements a memoized method bound to a single instance."""
+
+    def __init__(self, function, instance):
+        self._function = function
         self._instance = instance
-        return self
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __call__(self, *args):
+        cache = get_memoize_cache(self._instance)
+        found, result = cache.lookup(self.__name__, args)
+        if not found:
+            result = self._function(self._instance, *args)
+            cache.store(self.__name__, args, result)
+        return result
+
+    def statistics(self):
+        """Return the MemoizeStatistics of the current method."""
+        return get_memoize_cache(self._instance).get_statistics(self.__name__)
+
+
+class memoize_range(object):
+    """Implements a memoize decorator for methods that compute a period.
+
+    The first two arguments of the decorated method should be the start date
+    and the end date of a period, where the end date is the date of the day
+    *after* the last day of the period. When the result for a period is not
+    cached but the result for a period that contains it is, the decorated
+    method derives its result from the cached one instead of computing it.
+
+    Parameters:
+      *restrict*
+        function that takes a cached result, a start date and an end date and
+        returns that result restricted to the given period, None to reuse the
+        cached result as is
+      *same_start*
+        holds if and only if the containing period should start at the same
+        date
+
+    Use same_start for methods whose results depend on the state at the start
+    date, such as the storage of a bucket. The results of these methods for a
+    shorter period are equal to the start of the results for the longer
+    period.
+
+    A result that is derived from a cached result is not stored itself, as it
+    usually refers to the data of the cached result.
+
+    """
+    def __init__(self, restrict=None, same_start=False):
+        self._restrict = restrict
+        self._same_start = same_start
+
+    def __call__(self, function):
+        return memoize_range_method(function, self._restrict, self._same_start)
+
+
+class memoize_range_method(memoize):
+    """Implements a method decorated by memoize_range."""
+
+    def __init__(self, function, restrict, same_start):
+        memoize.__init__(self, function)
+        self._restrict = restrict
+        self._same_start = same_start
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        return BoundMemoizeRange(self._function, instance, self._restrict,
+                                 self._same_start)
+
+
+class BoundMemoizeRange(BoundMemoize):
+    """Implements a memoize_range method bound to a single instance."""
+
+    def __init__(self, function, instance, restrict, same_start):
+        BoundMemoize.__init__(self, function, instance)
+        self._restrict = restrict
+        self._same_start = same_start
+
     def __call__(self, *args):
-        cache = self._instance.__dict__.setdefault(self._cacheName, {})
-        if cache.has_key(args):
-            return cache[args]
-        else:
-            object = cache[args] = self._function(self._instance, *args)
-            return object
+        cache = get_memoize_cache(self._instance)
+        found, result, found_args = \
+            cache.lookup_range(self.__name__, args, self._same_start)
+        if not found:
+            result = self._function(self._instance, *args)
+            cache.store(self.__name__, args, result)
+        elif found_args != args and self._restrict is not None:
+            result = self._restrict(result, args[0], args[1])
+        return result
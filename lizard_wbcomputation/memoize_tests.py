@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from lizard_wbcomputation.memoize import EVENT_BYTES
+from lizard_wbcomputation.memoize import estimate_size
+from lizard_wbcomputation.memoize import memoize
+from lizard_wbcomputation.memoize import memoize_range
+from timeseries.timeseriesstub import SparseTimeseriesStub
+
+
+def restrict_days(result, start_day, end_day):
+    return [day for day in result if start_day <= day < end_day]
+
+
+class Computer(object):
+
+    def __init__(self, name, memoize_max_bytes=1024 * 1024):
+        self.name = name
+        self.memoize_max_bytes = memoize_max_bytes
+        self.call_count = 0
+
+    @memoize
+    def compute(self, value):
+        self.call_count += 1
+        return (self.name, value)
+
+    @memoize
+    def compute_list(self, size):
+        self.call_count += 1
+        return [0.0] * size
+
+    @memoize_range(restrict_days)
+    def compute_days(self, start_day, end_day, step=1):
+        self.call_count += 1
+        return range(start_day, end_day, step)
+
+    @memoize_range(restrict_days, same_start=True)
+    def compute_storage(self, start_day, end_day):
+        self.call_count += 1
+        return range(start_day, end_day)
+
+
+class memoize_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test a result is only computed once."""
+        computer = Computer('computer')
+        self.assertEqual(('computer', 1), computer.compute(1))
+        self.assertEqual(('computer', 1), computer.compute(1))
+        self.assertEqual(1, computer.call_count)
+
+    def test_b(self):
+        """Test the results of different instances are kept apart."""
+        computer = Computer('computer')
+        other_computer = Computer('other computer')
+        method = computer.compute
+        other_method = other_computer.compute
+        self.assertEqual(('other computer', 1), other_method(1))
+        self.assertEqual(('computer', 1), method(1))
+
+    def test_c(self):
+        """Test the hit and miss statistics are kept per method."""
+        computer = Computer('computer')
+        computer.compute(1)
+        computer.compute(1)
+        computer.compute(2)
+        computer.compute_list(1)
+        self.assertEqual(1, computer.compute.statistics().hits)
+        self.assertEqual(2, computer.compute.statistics().misses)
+        self.assertEqual(0, computer.compute_list.statistics().hits)
+        self.assertEqual(1, computer.compute_list.statistics().misses)
+
+    def test_d(self):
+        """Test the least recently used results are evicted first."""
+        # the cache can hold two results but not three
+        max_bytes = estimate_size([0.0] * 100) * 5 / 2
+        computer = Computer('computer', memoize_max_bytes=max_bytes)
+        computer.compute_list(100)
+        computer.compute_list(101)
+        computer.compute_list(100)
+        computer.compute_list(102)
+        self.assertEqual(1, computer.compute_list.statistics().evictions)
+        computer.compute_list(100)
+        self.assertEqual(3, computer.call_count)
+        computer.compute_list(101)
+        self.assertEqual(4, computer.call_count)
+
+    def test_e(self):
+        """Test multiple threads that use different instances."""
+        computers = [Computer('computer %d' % index) for index in range(8)]
+        results = {}
+        def compute(computer):
+            for value in range(200):
+                results.setdefault(computer.name, []).append(computer.compute(value))
+        threads = [threading.Thread(target=compute, args=(computer,)) for computer in computers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for computer in computers:
+            self.assertEqual([(computer.name, value) for value in range(200)],
+                             results[computer.name])
+
+
+class estimate_size_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test the size of a time series depends on its number of values."""
+        first_date = datetime(2011, 1, 1)
+        self.assertEqual(800, estimate_size(DailyTimeseries(first_date, [0.0] * 100)))
+        self.assertEqual(100 * EVENT_BYTES,
+                         estimate_size(SparseTimeseriesStub(first_date, [0.0] * 100)))
+
+    def test_b(self):
+        """Test the attributes of an arbitrary object are not included."""
+        computer = Computer('computer')
+        computer.inputs = [0.0] * 1000
+        self.assertTrue(estimate_size(computer) < estimate_size(computer.inputs))
+
+
+class memoize_range_TestSuite(TestCase):
+
+    def test_a(self):
+        """Test the result of a contained period is derived from a cached one."""
+        computer = Computer('computer')
+        computer.compute_days(0, 10)
+        self.assertEqual(range(2, 5), computer.compute_days(2, 5))
+        self.assertEqual(1, computer.call_count)
+        self.assertEqual(1, computer.compute_days.statistics().range_hits)
+
+    def test_b(self):
+        """Test the result of a period that is not contained is computed."""
+        computer = Computer('computer')
+        computer.compute_days(0, 10)
+        self.assertEqual(range(5, 12), computer.compute_days(5, 12))
+        self.assertEqual(2, computer.call_count)
+
+    def test_c(self):
+        """Test a cached result is only used for the same other arguments."""
+        computer = Computer('computer')
+        computer.compute_days(0, 10)
+        self.assertEqual(range(2, 5, 2), computer.compute_days(2, 5, 2))
+        self.assertEqual(2, computer.call_count)
+
+    def test_d(self):
+        """Test a same start result is only derived for the same start."""
+        computer = Computer('computer')
+        computer.compute_storage(0, 10)
+        self.assertEqual(range(0, 5), computer.compute_storage(0, 5))
+        self.assertEqual(1, computer.call_count)
+        self.assertEqual(range(2, 5), computer.compute_storage(2, 5))
+        self.assertEqual(2, computer.call_count)
+
+    def test_e(self):
+        """Test a derived result is not stored itself."""
+        computer = Computer('computer')
+        computer.compute_days(0, 10)
+        computer.compute_days(2, 5)
+        computer.compute_days(2, 5)
+        statistics = computer.compute_days.statistics()
+        self.assertEqual((0, 2, 1), (statistics.hits, statistics.range_hits, statistics.misses))
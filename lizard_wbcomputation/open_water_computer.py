@@ -0,0 +1,484 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+
+from lizard_wbcomputation.bucket_arrays import fill_days
+from lizard_wbcomputation.bucket_arrays import read_events
+from lizard_wbcomputation.bucket_summarizer import summation_order
+from lizard_wbcomputation.checkpoint import map_checkpoints
+from lizard_wbcomputation.fraction_computer import FractionComputer
+from lizard_wbcomputation.level_control_computer import LevelControlComputer
+
+from timeseries.timeseriesstub import SparseTimeseriesStub
+from timeseries.timeseriesstub import TimeseriesRestrictedStub
+
+# names of the fraction time series of the sources other than the intakes in
+# the order of FractionComputer.compute
+FRACTION_NAMES = ['precipitation', 'seepage', 'hardened', 'sewer', 'drained',
+                  'undrained', 'flow_off']
+
+
+def find_range(read_events_list):
+    """Return the pair (first day, day after the last day) of the given events.
+
+    Parameter:
+      *read_events_list*
+        list of triples as returned by bucket_arrays.read_events
+
+    The range starts at the first day for which any of the events exists and
+    ends after the last day for which any of the events exists. When none of
+    the events exists, this function returns None.
+
+    """
+    present = [(first_date, days) for (first_date, days, values) in read_events_list
+               if first_date is not None]
+    if len(present) == 0:
+        return None
+    first_day = min(days[0] for (first_date, days) in present)
+    end_day = max(days[-1] for (first_date, days) in present) + 1
+    return first_day, end_day
+
+
+def clip_range(day_range, start_day, end_day):
+    """Return the part of the given range that lies in [start_day, end_day)."""
+    if day_range is not None:
+        day_range = max(day_range[0], start_day), min(day_range[1], end_day)
+        if day_range[0] >= day_range[1]:
+            day_range = None
+    return day_range
+
+
+def join_ranges(*day_ranges):
+    """Return the smallest range that contains each of the given ranges."""
+    day_ranges = [day_range for day_range in day_ranges if day_range is not None]
+    if len(day_ranges) == 0:
+        return None
+    return min(first for (first, end) in day_ranges), max(end for (first, end) in day_ranges)
+
+
+def fill_range(events, first_day, day_count):
+    """Return the list of the given events for each day of the given range.
+
+    The given events are a triple as returned by bucket_arrays.read_events.
+    Events outside the given range are ignored and when no event is given for
+    a day, its value is 0.0.
+
+    """
+    first_date, days, values = events
+    inside = (days >= first_day) & (days < first_day + day_count)
+    return fill_days(days[inside], values[inside], first_day, day_count).tolist()
+
+
+def create_timeseries(first_date, values):
+    """Return the SparseTimeseriesStub with the given daily values."""
+    if len(values) == 0:
+        return SparseTimeseriesStub()
+    return SparseTimeseriesStub(first_date, values)
+
+
+class OpenWaterComputer(object):
+    """Computes the level control, fractions and chloride of an open water.
+
+    LevelControlComputer, FractionComputer and ConcentrationComputer each
+    merge their input time series day by day. An OpenWaterComputer aligns all
+    these input time series only once to a dense range of days and then
+    computes the level control, the fractions and the chloride concentration
+    in a single pass over that range.
+
+    The OpenWaterComputer computes exactly the same time series as the
+    separate computers. To do so, it computes each of them for the range of
+    days that the separate computer would use and it sums the values of each
+    day in the same order.
+
+    """
+    def __init__(self):
+        self.level_control_computer = LevelControlComputer()
+        self.fraction_computer = FractionComputer()
+
+    def compute(self, area, buckets_summary, precipitation, evaporation, seepage, infiltration,
+                minimum_level_timeseries, maximum_level_timeseries,
+                intakes_timeseries, pumps_timeseries,
+                fraction_intakes_timeseries, chloride_inflows,
+                start_date, end_date, max_intake=None, max_outtake=None,
+                checkpoint=None, checkpoints=None):
+        """Compute and return the level control, fractions and chloride.
+
+        This method returns a dictionary with the following keys:
+          - 'level_control', which maps to the dictionary that
+            LevelControlComputer.compute returns,
+          - 'fractions', which maps to the dictionary that
+            FractionComputer.compute returns, and
+          - 'concentration', which maps to the chloride concentration time
+            series that ConcentrationComputer.compute returns.
+
+        Parameters:
+        * area -- Area for which to compute the open water time series
+        * buckets_summary -- BucketsSummary with the summed buckets outcome
+        * precipitation,
+        * evaporation,
+        * seepage,
+        * infiltration -- vertical time series of the open water in [m3/day]
+        * minimum_level_timeseries,
+        * maximum_level_timeseries -- water level bounds in [m]
+        * intakes_timeseries -- dict of intake timeseries in [m3/day]
+        * pumps_timeseries -- dict of pump timeseries in [m3/day]
+        * fraction_intakes_timeseries -- dict of intake to the timeseries of
+          that intake for the computation of the fractions
+        * chloride_inflows -- list of pairs (timeseries in [m3/day], chloride
+          concentration in [g/m3]) of the water that comes into the open water
+        * start_date -- first date for which to compute the time series
+        * end_date -- date after the last date for which to compute the time
+          series
+        * checkpoint -- Checkpoint to start the computations from at its
+          date, or None to start from the initial state at the start date
+        * checkpoints -- list of Checkpoint(s) in which to store the state of
+          each computation at the start of their date, or None
+
+        As the time series of the intake for level control are computed by
+        this method, a None instead of a time series in
+        fraction_intakes_timeseries or chloride_inflows refers to the
+        computed intake time series.
+
+        """
+        start_day = start_date.toordinal()
+        end_day = end_date.toordinal()
+        if checkpoint is not None:
+            start_day = max(start_day, checkpoint.date.toordinal())
+
+        # read each input time series once
+
+        lc_intakes = {}
+        for intake, timeseries in intakes_timeseries.iteritems():
+            if not intake.is_computed:
+                lc_intakes[intake] = timeseries
+        lc_pumps = {}
+        for pump, timeseries in pumps_timeseries.iteritems():
+            if not pump.is_computed:
+                lc_pumps[pump] = timeseries
+
+        lc_events = {
+            'bucket_total_incoming': read_events(buckets_summary.total_incoming),
+            'bucket_total_outgoing': read_events(buckets_summary.total_outgoing),
+            'precipitation': read_events(precipitation),
+            'evaporation': read_events(evaporation),
+            'seepage': read_events(seepage),
+            'infiltration': read_events(infiltration),
+            'min_level': read_events(minimum_level_timeseries),
+            'max_level': read_events(maximum_level_timeseries),
+            }
+        lc_intakes_order = summation_order(lc_intakes)
+        lc_pumps_order = summation_order(lc_pumps)
+        lc_intakes_events = [read_events(lc_intakes[intake]) for intake in lc_intakes_order]
+        lc_pumps_events = [read_events(lc_pumps[pump]) for pump in lc_pumps_order]
+
+        fr_events = {
+            'hardened': read_events(buckets_summary.hardened),
+            'drained': read_events(buckets_summary.drained),
+            'undrained': read_events(buckets_summary.undrained),
+            'flow_off': read_events(buckets_summary.flow_off),
+            'sewer': read_events(buckets_summary.sewer),
+            'precipitation': lc_events['precipitation'],
+            'seepage': lc_events['seepage'],
+            }
+        fr_intakes_events = {}
+        for intake, timeseries in fraction_intakes_timeseries.items():
+            if timeseries is None:
+                fr_intakes_events[intake] = None
+            else:
+                restricted = TimeseriesRestrictedStub(timeseries=timeseries,
+                                                      start_date=start_date,
+                                                      end_date=end_date)
+                fr_intakes_events[intake] = read_events(restricted)
+
+        cl_events = []
+        for timeseries, concentration in chloride_inflows:
+            if timeseries is None:
+                cl_events.append(None)
+            else:
+                cl_events.append(read_events(timeseries))
+
+        # determine the range of days of each computation
+
+        lc_range = clip_range(find_range(lc_events.values() + lc_intakes_events + lc_pumps_events),
+                              start_day, end_day)
+
+        fr_range = find_range(fr_events.values() +
+                              [events for events in fr_intakes_events.values() if events is not None])
+        if None in fr_intakes_events.values():
+            fr_range = join_ranges(fr_range, lc_range)
+        # the fraction computation also uses the computed storage and total
+        # outgoing volume
+        fr_range = clip_range(join_ranges(fr_range, lc_range), start_day, end_day)
+
+        cl_range = find_range([events for events in cl_events if events is not None] +
+                              [lc_events['evaporation']])
+        # the chloride computation also uses the computed total outgoing
+        # volume
+        cl_range = join_ranges(cl_range, lc_range)
+        if checkpoint is not None and cl_range is not None:
+            cl_range = clip_range(cl_range, start_day, cl_range[1])
+
+        frame = join_ranges(lc_range, fr_range, cl_range)
+        if frame is None:
+            frame = (start_day, start_day)
+        first_day, end_frame_day = frame
+        day_count = end_frame_day - first_day
+
+        first_dates = [events[0] for events in
+                       lc_events.values() + fr_events.values() +
+                       lc_intakes_events + lc_pumps_events +
+                       [events for events in fr_intakes_events.values() + cl_events
+                        if events is not None]
+                       if events[0] is not None]
+        if len(first_dates) > 0:
+            base_date = min(first_dates)
+            base_date = base_date + timedelta(first_day - base_date.toordinal())
+        else:
+            base_date = start_date
+
+        # align each input time series to the dense range of days
+
+        fill = lambda events: fill_range(events, first_day, day_count)
+
+        lc_values = dict((name, fill(events)) for (name, events) in lc_events.items())
+        lc_intakes_values = [fill(events) for events in lc_intakes_events]
+        lc_pumps_values = [fill(events) for events in lc_pumps_events]
+        fr_values = dict((name, fill(events)) for (name, events) in fr_events.items())
+        fr_intakes = fr_intakes_events.keys()
+        fr_intakes_values = []
+        for intake in fr_intakes:
+            events = fr_intakes_events[intake]
+            if events is None:
+                fr_intakes_values.append(None)
+            else:
+                fr_intakes_values.append(fill(events))
+        cl_values = []
+        for (timeseries, concentration), events in zip(chloride_inflows, cl_events):
+            if events is None:
+                cl_values.append((None, concentration))
+            else:
+                cl_values.append((fill(events), concentration))
+        # the chloride computation considers the evaporation as outgoing water
+        # that does not take chloride with it
+        cl_evaporation = lc_values['evaporation']
+
+        # initialize each computation
+
+        compute_level_control = self.level_control_computer._compute_level_control
+        surface = 1.0 * area.surface
+        if checkpoint is None:
+            water_level = area.init_water_level
+        else:
+            water_level = checkpoint.water_level
+        lc_names = ['intake_wl_control', 'outtake_wl_control', 'storage',
+                    'water_level', 'total_incoming', 'total_outgoing']
+        lc_result = dict((name, []) for name in lc_names)
+        lc_intake_values = [0.0] * day_count
+        lc_storage_values = [0.0] * day_count
+        lc_total_outgoing_values = [0.0] * day_count
+
+        compute_fraction = self.fraction_computer.compute_fraction
+        previous_storage = self.fraction_computer.initial_storage(area)
+        previous_fractions = dict((name, 0.0) for name in FRACTION_NAMES)
+        previous_fractions['initial'] = 1.0
+        previous_intakes = [0.0] * len(fr_intakes)
+        fr_result = dict((name, []) for name in ['initial'] + FRACTION_NAMES)
+        fr_intakes_result = [[] for intake in fr_intakes]
+        first = True
+        if checkpoint is not None:
+            for name in previous_fractions.keys():
+                previous_fractions[name] = checkpoint.fractions[name]
+            previous_intakes = [checkpoint.fractions['intakes'].get(intake.name, 0.0)
+                                for intake in fr_intakes]
+            previous_storage = checkpoint.storage
+            first = False
+
+        concentrations = []
+        if checkpoint is None:
+            concentration = area.init_concentration
+            volume = area.init_volume
+        else:
+            concentration, volume = checkpoint.chloride
+        chloride = volume * concentration
+
+        day2checkpoint = map_checkpoints(checkpoints)
+        inside = lambda day_range, day: day_range is not None and \
+            day_range[0] <= day <= day_range[1]
+
+        def store_state(day_checkpoint, day):
+            if inside(lc_range, day):
+                day_checkpoint.water_level = water_level
+            if inside(fr_range, day):
+                day_checkpoint.fractions = dict(previous_fractions)
+                day_checkpoint.fractions['intakes'] = \
+                    dict((intake.name, fraction) for intake, fraction in
+                         zip(fr_intakes, previous_intakes))
+                day_checkpoint.storage = previous_storage
+            if inside(cl_range, day):
+                day_checkpoint.chloride = (concentration, volume)
+
+        for index in xrange(day_count):
+            day = first_day + index
+
+            if first and fr_range is not None and fr_range[0] <= day < fr_range[1]:
+                first = False
+                previous_storage = (area.init_water_level - area.bottom_height) * area.surface
+            if day in day2checkpoint:
+                store_state(day2checkpoint[day], day)
+
+            if lc_range is not None and lc_range[0] <= day < lc_range[1]:
+                incoming_value = sum([lc_values['bucket_total_outgoing'][index],
+                                      lc_values['precipitation'][index],
+                                      lc_values['seepage'][index]] + \
+                                     [values[index] for values in lc_intakes_values])
+                outgoing_value = sum([lc_values['bucket_total_incoming'][index],
+                                      lc_values['infiltration'][index],
+                                      lc_values['evaporation'][index]] + \
+                                     [values[index] for values in lc_pumps_values])
+
+                water_level += (incoming_value + outgoing_value) / surface
+
+                level_control = compute_level_control(surface, water_level,
+                                                      lc_values['min_level'][index],
+                                                      lc_values['max_level'][index])
+                if level_control < 0:
+                    if max_outtake is not None:
+                        pump = max(level_control, -1*max_outtake)
+                    else:
+                        pump = level_control
+                    intake = 0
+                else:
+                    pump = 0
+                    if max_intake is not None:
+                        intake = min(level_control, max_intake)
+                    else:
+                        intake = level_control
+
+                water_level += (pump + intake) / surface
+
+                storage_value = (water_level - area.bottom_height) * surface
+                total_outgoing_value = sum([outgoing_value, pump])
+
+                lc_result['intake_wl_control'].append(intake)
+                lc_result['outtake_wl_control'].append(pump)
+                lc_result['storage'].append(storage_value)
+                lc_result['water_level'].append(water_level)
+                lc_result['total_incoming'].append(sum([incoming_value, intake]))
+                lc_result['total_outgoing'].append(total_outgoing_value)
+
+                lc_intake_values[index] = intake
+                lc_storage_values[index] = storage_value
+                lc_total_outgoing_values[index] = total_outgoing_value
+
+            if fr_range is not None and fr_range[0] <= day < fr_range[1]:
+                total_output = -1 * lc_total_outgoing_values[index]
+                current_storage = lc_storage_values[index]
+
+                fraction = compute_fraction(0, total_output, current_storage,
+                                            previous_fractions['initial'],
+                                            previous_storage)
+                fr_result['initial'].append(fraction)
+                previous_fractions['initial'] = fraction
+                for name in FRACTION_NAMES:
+                    fraction = compute_fraction(fr_values[name][index],
+                                                total_output,
+                                                current_storage,
+                                                previous_fractions[name],
+                                                previous_storage)
+                    fr_result[name].append(fraction)
+                    previous_fractions[name] = fraction
+                for intake_index, values in enumerate(fr_intakes_values):
+                    if values is None:
+                        value = lc_intake_values[index]
+                    else:
+                        value = values[index]
+                    fraction = compute_fraction(value,
+                                                total_output,
+                                                current_storage,
+                                                previous_intakes[intake_index],
+                                                previous_storage)
+                    fr_intakes_result[intake_index].append(fraction)
+                    previous_intakes[intake_index] = fraction
+
+                previous_storage = current_storage
+
+            if cl_range is not None and cl_range[0] <= day < cl_range[1]:
+                incoming_volume = 0
+                incoming_chloride = 0
+                for values, inflow_concentration in cl_values:
+                    if values is None:
+                        value = lc_intake_values[index]
+                    else:
+                        value = values[index]
+                    incoming_volume += value
+                    incoming_chloride += value * inflow_concentration
+                outgoing_volume = lc_total_outgoing_values[index]
+                outgoing_volume_no_chloride = cl_evaporation[index]
+
+                max_chloride = chloride + incoming_chloride
+                max_volume = volume + incoming_volume
+                if max_volume + outgoing_volume > 0.0:
+                    concentration = max_chloride / (max_volume + outgoing_volume_no_chloride)
+                else:
+                    concentration = 0.0
+                concentrations.append(concentration)
+
+                volume = max(max_volume + outgoing_volume, 0.0)
+                chloride = concentration * volume
+
+        if first_day + day_count in day2checkpoint:
+            store_state(day2checkpoint[first_day + day_count], first_day + day_count)
+
+        # store the computed values as time series
+
+        date_of = lambda day_range: base_date + timedelta(day_range[0] - first_day)
+
+        level_control = {}
+        for name in lc_names:
+            if lc_range is None:
+                level_control[name] = SparseTimeseriesStub()
+            else:
+                level_control[name] = create_timeseries(date_of(lc_range), lc_result[name])
+
+        fractions = {}
+        for name in ['initial'] + FRACTION_NAMES:
+            if fr_range is None:
+                fractions[name] = SparseTimeseriesStub()
+            else:
+                fractions[name] = create_timeseries(date_of(fr_range), fr_result[name])
+        fractions['intakes'] = {}
+        for intake, values in zip(fr_intakes, fr_intakes_result):
+            if fr_range is None:
+                fractions['intakes'][intake] = SparseTimeseriesStub()
+            else:
+                fractions['intakes'][intake] = create_timeseries(date_of(fr_range), values)
+
+        if cl_range is None:
+            concentration_timeseries = SparseTimeseriesStub()
+        else:
+            concentration_timeseries = create_timeseries(date_of(cl_range), concentrations)
+
+        return {'level_control': level_control,
+                'fractions': fractions,
+                'concentration': concentration_timeseries}
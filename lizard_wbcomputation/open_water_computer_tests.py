@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from unittest import TestCase
+
+from lizard_wbcomputation.bucket_arrays_tests import create_timeseries
+from lizard_wbcomputation.bucket_summarizer import BucketsSummary
+from lizard_wbcomputation.concentration_computer import ConcentrationComputer
+from lizard_wbcomputation.concentration_computer import TotalVolumeChlorideTimeseries
+from lizard_wbcomputation.daily_frame import DailyFrame
+from lizard_wbcomputation.fraction_computer import FractionComputer
+from lizard_wbcomputation.level_control_computer import DateRange
+from lizard_wbcomputation.level_control_computer import LevelControlComputer
+from lizard_wbcomputation.open_water_computer import OpenWaterComputer
+
+
+class Area(object):
+
+    def __init__(self):
+        self.surface = 100000
+        self.init_water_level = -1.0
+        self.bottom_height = -2.5
+        self.init_concentration = 100.0
+        self.init_volume = 150000.0
+
+
+class PumpingStation(object):
+
+    def __init__(self, name, is_computed):
+        self.name = name
+        self.is_computed = is_computed
+
+
+class OpenWaterFixture(object):
+    """Provides the input of the open water computations."""
+
+    def setUp(self):
+        self.area = Area()
+        self.start_date = datetime(2011, 1, 5)
+        self.end_date = datetime(2011, 3, 1)
+        start = datetime(2011, 1, 1)
+        values = lambda factor, offset, count: \
+            [((day * factor + offset) % 17 - 8) * 11.0 for day in range(count)]
+
+        self.buckets_summary = BucketsSummary()
+        for offset, name in enumerate(['totals', 'total_incoming', 'total_outgoing',
+                                       'hardened', 'drained', 'undrained',
+                                       'flow_off', 'indraft', 'sewer']):
+            setattr(self.buckets_summary, name,
+                    create_timeseries(start, [abs(value) for value in values(3, offset, 70)]))
+        self.buckets_summary.total_incoming = \
+            create_timeseries(start, [-abs(value) for value in values(5, 1, 70)])
+
+        self.precipitation = create_timeseries(start, [abs(value) for value in values(7, 2, 80)])
+        self.evaporation = create_timeseries(start, [-abs(value) for value in values(2, 3, 80)])
+        self.seepage = create_timeseries(start, values(4, 4, 80))
+        self.infiltration = create_timeseries(start, [-abs(value) for value in values(6, 5, 80)])
+        self.minimum_level = create_timeseries(start, [-1.0 - (day % 3) * 0.001 for day in range(90)])
+        self.maximum_level = create_timeseries(start, [-1.0 + (day % 4) * 0.001 for day in range(90)])
+
+        self.level_control_intake = PumpingStation('intake 3', True)
+        self.intakes_timeseries = {
+            PumpingStation('intake 1', False): create_timeseries(start, [abs(value) for value in values(9, 6, 75)]),
+            PumpingStation('intake 2', False): create_timeseries(datetime(2011, 1, 10), [abs(value) for value in values(1, 7, 30)]),
+            self.level_control_intake: create_timeseries(start, [abs(value) for value in values(8, 8, 75)])}
+        self.pumps_timeseries = {
+            PumpingStation('pump 1', False): create_timeseries(start, [-abs(value) for value in values(3, 9, 75)]),
+            PumpingStation('pump 2', True): create_timeseries(start, [-abs(value) for value in values(5, 10, 75)])}
+
+        self.chloride_inflows = [(self.precipitation, 10.0),
+                                 (self.seepage, 300.0),
+                                 (None, 120.0),
+                                 (create_timeseries(start, [abs(value) for value in values(2, 11, 60)]), 80.0)]
+
+    def compute_separately(self, start_date=None, checkpoint=None, checkpoints=None):
+        start_date = start_date or self.start_date
+        level_control_computer = LevelControlComputer()
+        if checkpoint is None and checkpoints is None:
+            level_control_computer.inside_range = DateRange(start_date, self.end_date).inside
+            level_control = level_control_computer.compute(self.area,
+                self.buckets_summary, self.precipitation, self.evaporation,
+                self.seepage, self.infiltration, self.minimum_level,
+                self.maximum_level, self.intakes_timeseries,
+                self.pumps_timeseries, 2000.0, 3000.0)
+        else:
+            # only method compute_frame supports checkpoints
+            ts = level_control_computer.create_input(self.buckets_summary,
+                self.precipitation, self.evaporation, self.seepage,
+                self.infiltration, self.minimum_level, self.maximum_level,
+                self.intakes_timeseries, self.pumps_timeseries)
+            level_control = level_control_computer.compute_frame(self.area,
+                DailyFrame(ts, start_date, self.end_date), 2000.0, 3000.0,
+                checkpoint, checkpoints)
+
+        intakes_timeseries = dict(self.intakes_timeseries)
+        intakes_timeseries[self.level_control_intake] = level_control['intake_wl_control']
+        fractions = FractionComputer().compute(self.area, self.buckets_summary,
+            self.precipitation, self.seepage, level_control['storage'],
+            level_control['total_outgoing'], intakes_timeseries,
+            start_date, self.end_date, checkpoint, checkpoints)
+
+        volumes = []
+        for timeseries, concentration in self.chloride_inflows:
+            if timeseries is None:
+                timeseries = level_control['intake_wl_control']
+            volumes.append(timeseries)
+        totals = TotalVolumeChlorideTimeseries(volumes,
+            [concentration for (volume, concentration) in self.chloride_inflows])
+        computer = ConcentrationComputer()
+        computer.initial_concentration = self.area.init_concentration
+        computer.initial_volume = self.area.init_volume
+        computer.incoming_volumes, computer.incoming_chlorides = totals.compute()
+        computer.outgoing_volumes = level_control['total_outgoing']
+        computer.outgoing_volumes_no_chloride = self.evaporation
+        return level_control, fractions, computer.compute(checkpoint, checkpoints)
+
+    def compute_together(self, start_date=None, checkpoint=None, checkpoints=None):
+        fraction_intakes_timeseries = dict(self.intakes_timeseries)
+        fraction_intakes_timeseries[self.level_control_intake] = None
+        return OpenWaterComputer().compute(self.area, self.buckets_summary,
+            self.precipitation, self.evaporation, self.seepage,
+            self.infiltration, self.minimum_level, self.maximum_level,
+            self.intakes_timeseries, self.pumps_timeseries,
+            fraction_intakes_timeseries, self.chloride_inflows,
+            start_date or self.start_date, self.end_date, 2000.0, 3000.0,
+            checkpoint, checkpoints)
+
+    def assert_same_timeseries(self, expected_timeseries, timeseries):
+        self.assertEqual(list(expected_timeseries.events()), list(timeseries.events()))
+
+
+class OpenWaterComputer_TestSuite(OpenWaterFixture, TestCase):
+
+    def test_a(self):
+        """Test the level control is equal to the one of LevelControlComputer."""
+        level_control, fractions, concentration = self.compute_separately()
+        outcome = self.compute_together()
+        self.assertEqual(sorted(level_control.keys()), sorted(outcome['level_control'].keys()))
+        for name, timeseries in level_control.items():
+            self.assert_same_timeseries(timeseries, outcome['level_control'][name])
+
+    def test_b(self):
+        """Test the fractions are equal to the ones of FractionComputer."""
+        level_control, fractions, concentration = self.compute_separately()
+        outcome = self.compute_together()
+        self.assertEqual(sorted(fractions.keys()), sorted(outcome['fractions'].keys()))
+        for name, timeseries in fractions.items():
+            if name == 'intakes':
+                self.assertEqual(set(timeseries.keys()), set(outcome['fractions']['intakes'].keys()))
+                for intake, intake_timeseries in timeseries.items():
+                    self.assert_same_timeseries(intake_timeseries,
+                                                outcome['fractions']['intakes'][intake])
+            else:
+                self.assert_same_timeseries(timeseries, outcome['fractions'][name])
+
+    def test_c(self):
+        """Test the concentration is equal to the one of ConcentrationComputer."""
+        level_control, fractions, concentration = self.compute_separately()
+        outcome = self.compute_together()
+        self.assert_same_timeseries(concentration, outcome['concentration'])
+        self.assertTrue(len(list(concentration.events())) > 0)
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import cPickle as pickle
+import errno
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+from lizard_wbcomputation.cache_codec import ArrayBlock
+from lizard_wbcomputation.cache_codec import replace_timeseries
+from lizard_wbcomputation.cache_codec import restore_timeseries
+
+# first bytes of each result file, to recognize the format
+MAGIC = 'WBR1'
+
+# extension of the name of each result file
+EXTENSION = '.wbr'
+
+# the block of values starts at a multiple of this number of bytes, so it can
+# be mapped as an array of float64
+ALIGNMENT = 8
+
+# mode of each result file before the umask is applied, so the results written
+# by a command can be read by the web server
+FILE_MODE = 0666
+
+
+def get_umask():
+    """Return the umask of the current process.
+
+    The umask can only be read by setting it, so this function should not be
+    called when other threads may create files.
+
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# umask of the current process, read once at import
+UMASK = get_umask()
+
+
+def format_period(start_date, end_date):
+    """Return the string that identifies the given period in a file name.
+
+    The period is identified by its days, as the results are daily time
+    series: two periods that only differ in the time of day of their start or
+    end share their results.
+
+    """
+    return '%s-%s' % (start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d'))
+
+
+def write_result(file_name, value):
+    """Write the given value to the file with the given name.
+
+    The file consists of a header and a block of values. The header is the
+    pickled value in which each daily time series is replaced by a reference
+    to its values in the block, see cache_codec.replace_timeseries. The block
+    contains the uncompressed values of all daily time series as
+    little-endian float64, so it can be mapped into memory as is.
+
+    The value is written to a temporary file that is renamed when it is
+    complete, so a reader never sees a partial file. As a temporary file can
+    only be read by its owner, its mode is set to FILE_MODE, restricted by
+    the umask, before it is renamed.
+
+    """
+    block = ArrayBlock()
+    header = pickle.dumps(replace_timeseries(value, block), pickle.HIGHEST_PROTOCOL)
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    padding = '\0' * (-len(prefix) % ALIGNMENT)
+    directory = os.path.dirname(file_name)
+    handle, temporary_name = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as result_file:
+            result_file.write(prefix)
+            result_file.write(padding)
+            result_file.write(block.tostring())
+        os.chmod(temporary_name, FILE_MODE & ~UMASK)
+        os.rename(temporary_name, file_name)
+    except:
+        os.remove(temporary_name)
+        raise
+
+
+def read_result(file_name):
+    """Return the value that was written to the file with the given name.
+
+    Each daily time series of the value is read as a DailyTimeseries whose
+    values are a read-only memory map of the block of the file: the values
+    are only read from disk when they are used.
+
+    """
+    with open(file_name, 'rb') as result_file:
+        prefix = result_file.read(len(MAGIC) + 4)
+        if not prefix.startswith(MAGIC):
+            raise ValueError("File %s is not a result file" % file_name)
+        header_size, = struct.unpack('<I', prefix[len(MAGIC):])
+        header = result_file.read(header_size)
+    offset = len(MAGIC) + 4 + header_size
+    offset += -offset % ALIGNMENT
+    value_count = (os.path.getsize(file_name) - offset) // 8
+    if value_count > 0:
+        values = numpy.memmap(file_name, dtype='<f8', mode='r', offset=offset,
+                              shape=(value_count,))
+    else:
+        values = numpy.zeros(0)
+    return restore_timeseries(pickle.loads(header), values)
+
+
+class ResultStore(object):
+    """Stores the computed results of configurations on disk.
+
+    The results of a configuration are stored in the subdirectory named
+    after the fingerprint of the inputs of that configuration, see
+    lizard_waterbalance.fingerprint.compute_fingerprint. Each result is
+    stored in a separate file whose name consists of the name of the result
+    and the period for which it was computed. As the fingerprint changes
+    when the inputs change, a stored result remains valid until it is
+    removed.
+
+    Instance variables:
+      *directory*
+        directory that contains the results
+
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_file_name(self, fingerprint, name, start_date=None, end_date=None):
+        """Return the name of the file of the given result.
+
+        A result that does not depend on a period, such as the level control
+        pumping stations, is stored without a start and end date.
+
+        """
+        if start_date is None or end_date is None:
+            base_name = name
+        else:
+            base_name = '%s-%s' % (name, format_period(start_date, end_date))
+        return os.path.join(self.directory, fingerprint, base_name + EXTENSION)
+
+    def load(self, fingerprint, name, start_date=None, end_date=None):
+        """Return the given result, or None when it has not been stored."""
+        file_name = self.get_file_name(fingerprint, name, start_date, end_date)
+        try:
+            return read_result(file_name)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+    def store(self, fingerprint, name, value, start_date=None, end_date=None):
+        """Store the given result."""
+        file_name = self.get_file_name(fingerprint, name, start_date, end_date)
+        directory = os.path.dirname(file_name)
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            # another process may have created the directory in the meantime
+            if e.errno != errno.EEXIST:
+                raise
+        write_result(file_name, value)
+
+    def get_fingerprints(self):
+        """Return the list of fingerprints of the stored results."""
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory)
+                if os.path.isdir(os.path.join(self.directory, name))]
+
+    def remove(self, fingerprint):
+        """Remove the stored results of the given fingerprint."""
+        shutil.rmtree(os.path.join(self.directory, fingerprint), ignore_errors=True)
+
+    def remove_others(self, fingerprints, before=None):
+        """Remove the stored results of all but the given fingerprints.
+
+        As the fingerprint of a configuration changes when its inputs change,
+        this method removes the results of the inputs that are no longer
+        current.
+
+        When a time is given, as seconds since the epoch, this method only
+        removes the results of a fingerprint that were last modified before
+        that time. In that way it keeps the results other processes have
+        stored for a fingerprint that became current after that time.
+
+        """
+        for fingerprint in set(self.get_fingerprints()) - set(fingerprints):
+            if before is not None:
+                directory = os.path.join(self.directory, fingerprint)
+                try:
+                    if os.path.getmtime(directory) >= before:
+                        continue
+                except OSError:
+                    # another process has removed the directory
+                    continue
+            self.remove(fingerprint)
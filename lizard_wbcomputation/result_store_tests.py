@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=C0111
+
+# The lizard_wbcomputation package implements the computational core of the
+# lizard waterbalance Django app.
+#
+# Copyright (C) 2012 Nelen & Schuurmans
+#
+# This package is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this package.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import stat
+import tempfile
+
+from datetime import datetime
+from datetime import timedelta
+from unittest import TestCase
+
+from lizard_wbcomputation.daily_timeseries import DailyTimeseries
+from lizard_wbcomputation.result_store import ResultStore
+from lizard_wbcomputation.result_store import FILE_MODE
+from lizard_wbcomputation.result_store import UMASK
+from timeseries.timeseriesstub import SparseTimeseriesStub
+
+
+class ResultStoreTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ResultStore(self.directory)
+        self.start_date = datetime(2011, 1, 1)
+        self.end_date = datetime(2012, 1, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_a(self):
+        """Test a stored result can be loaded for the same period."""
+        value = {'intake': SparseTimeseriesStub(self.start_date, [1.0, 2.0, 3.0]),
+                 'label': 'intake'}
+        self.store.store('0123', 'incoming', value, self.start_date, self.end_date)
+        loaded = self.store.load('0123', 'incoming', self.start_date, self.end_date)
+        self.assertTrue(isinstance(loaded['intake'], DailyTimeseries))
+        self.assertEqual(list(value['intake'].events()), list(loaded['intake'].events()))
+        self.assertEqual('intake', loaded['label'])
+
+    def test_b(self):
+        """Test a result is not loaded for another period or fingerprint."""
+        value = DailyTimeseries(self.start_date, [1.0])
+        self.store.store('0123', 'sluice_error', value, self.start_date, self.end_date)
+        self.assertEqual(None, self.store.load('0123', 'sluice_error', self.start_date,
+                                               self.end_date + timedelta(1)))
+        self.assertEqual(None, self.store.load('4567', 'sluice_error', self.start_date,
+                                               self.end_date))
+
+    def test_c(self):
+        """Test a result without time series or period can be stored."""
+        self.store.store('0123', 'pair', (None, []))
+        self.assertEqual((None, []), self.store.load('0123', 'pair'))
+
+    def test_d(self):
+        """Test remove_others only keeps the results of the given fingerprints."""
+        value = DailyTimeseries(self.start_date, [1.0])
+        self.store.store('0123', 'sluice_error', value)
+        self.store.store('4567', 'sluice_error', value)
+        self.store.remove_others(['4567'])
+        self.assertEqual(['4567'], self.store.get_fingerprints())
+        self.assertEqual(['sluice_error.wbr'], os.listdir(os.path.join(self.directory, '4567')))
+
+    def test_e(self):
+        """Test remove_others keeps the results that were modified after the given time."""
+        value = DailyTimeseries(self.start_date, [1.0])
+        self.store.store('0123', 'sluice_error', value)
+        self.store.store('4567', 'sluice_error', value)
+        os.utime(os.path.join(self.directory, '0123'), (1000, 1000))
+        self.store.remove_others([], before=2000)
+        self.assertEqual(['4567'], self.store.get_fingerprints())
+
+    def test_f(self):
+        """Test a result is loaded for the same days at another time of day."""
+        value = DailyTimeseries(self.start_date, [1.0])
+        self.store.store('0123', 'sluice_error', value, self.start_date, self.end_date)
+        loaded = self.store.load('0123', 'sluice_error', self.start_date,
+                                 self.end_date + timedelta(hours=12))
+        self.assertEqual(list(value.events()), list(loaded.events()))
+
+    def test_g(self):
+        """Test a result file can be read by others, unless the umask prevents it."""
+        self.store.store('0123', 'pair', (None, []))
+        file_name = self.store.get_file_name('0123', 'pair')
+        mode = stat.S_IMODE(os.stat(file_name).st_mode)
+        self.assertEqual(FILE_MODE & ~UMASK, mode)
+        self.assertTrue(mode & stat.S_IROTH or UMASK & stat.S_IROTH)
@@ -27,6 +27,12 @@
 
 import logging
 
+from datetime import timedelta
+
+import numpy
+
+from lizard_wbcomputation.bucket_arrays import align_events
+from lizard_wbcomputation.daily_timeseries import find_daily_timeseries
 from timeseries.timeseriesstub import enumerate_events
 from timeseries.timeseriesstub import split_timeseries
 from timeseries.timeseriesstub import SparseTimeseriesStub
@@ -34,6 +40,24 @@ from timeseries.timeseriesstub import SparseTimeseriesStub
 logger = logging.getLogger(__name__)
 
 
+def find_first_index(day_count, predicate):
+    """Return the first index in [0, day_count) for which the predicate holds.
+
+    The predicate should not hold for the indices before that index and it
+    should hold for all indices from that index on. When the predicate does
+    not hold for any index, this function returns day_count.
+
+    """
+    low, high = 0, day_count
+    while low < high:
+        middle = (low + high) // 2
+        if predicate(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
 class VerticalTimeseriesComputer:
     """Implements the computation of the vertical time series of an open water.
 
@@ -87,12 +111,19 @@ class VerticalTimeseriesComputer:
         * seepage -- seepage time series in [mm/day]
         * infiltration -- seepage time series in [mm/day]
 
+        When all time series are a DailyTimeseries, this method computes the
+        vertical time series using arrays, see compute_daily.
+
         """
+        timeseries_list = [precipitation, evaporation, seepage, infiltration]
+        daily_timeseries_list = [find_daily_timeseries(timeseries) for timeseries in timeseries_list]
+        if None not in daily_timeseries_list:
+            return self.compute_daily(surface, crop_evaporation_factor, daily_timeseries_list)
+
         vertical_timeseries_list = [SparseTimeseriesStub(),
                                     SparseTimeseriesStub(),
                                     SparseTimeseriesStub(),
                                     SparseTimeseriesStub()]
-        timeseries_list = [precipitation, evaporation, seepage, infiltration]
         index_evaporation = 1
         for event_tuple in enumerate_events(*timeseries_list):
             date = event_tuple[0][0]
@@ -114,3 +145,42 @@ class VerticalTimeseriesComputer:
                 "seepage":vertical_timeseries_list[2],
                 "infiltration":vertical_timeseries_list[3]}
 
+    def compute_daily(self, surface, crop_evaporation_factor, timeseries_list):
+        """Compute and return the vertical time series from DailyTimeseries.
+
+        This method computes the same time series as method compute but it
+        computes the values of all days in one go. As the function that
+        determines whether a date lies in the range is negative before, zero
+        inside and positive after the range, this method finds the days in
+        that range by bisection.
+
+        """
+        first_date, arrays = align_events(*timeseries_list)
+        day_count = len(arrays[0])
+        if first_date is None:
+            day_count = 0
+        date = lambda index: first_date + timedelta(index)
+        first_index = find_first_index(day_count,
+                                       lambda index: self.inside_range(date(index)) >= 0)
+        end_index = find_first_index(day_count,
+                                     lambda index: index >= first_index and
+                                                   self.inside_range(date(index)) > 0)
+
+        vertical_arrays = [values[first_index:end_index] * surface * 0.001
+                           for values in arrays]
+        evaporation = vertical_arrays[1] * crop_evaporation_factor
+        vertical_arrays[1] = numpy.where(evaporation > 0, -evaporation, evaporation)
+
+        vertical_timeseries_list = []
+        for values in vertical_arrays:
+            if first_index < end_index:
+                timeseries = SparseTimeseriesStub(date(first_index), values.tolist())
+            else:
+                timeseries = SparseTimeseriesStub()
+            vertical_timeseries_list.append(timeseries)
+
+        return {"precipitation":vertical_timeseries_list[0],
+                "evaporation":vertical_timeseries_list[1],
+                "seepage":vertical_timeseries_list[2],
+                "infiltration":vertical_timeseries_list[3]}
+
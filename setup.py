@@ -14,12 +14,14 @@ install_requires = [
     'django-extensions',
     'django-nose',
     'django-staticfiles',
+    'futures',
     'lizard-fewsunblobbed',
     'lizard-map',
     'lizard-shape',
     'lizard-ui > 1.53',
     'mock >= 0.7.2',
     'nens >= 1.10',
+    'numpy',
     'timeseries >= 0.11',
     'xlrd',
     'xlwt',
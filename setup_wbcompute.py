@@ -12,7 +12,9 @@ long_description = '\n\n'.join([
     ])
 
 install_requires = [
+    'futures',
     'nens == 1.10',
+    'numpy',
     'pkginfo >= 0.8',
     'timeseries == 0.17',
     ],